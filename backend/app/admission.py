@@ -0,0 +1,88 @@
+import threading
+import time
+
+class AdmissionController:
+    """
+    Concurrency limits per route class for the synchronous API.
+
+    At most limits[route_class] requests of a class are served at once. Up
+    to queue_size more wait, each for at most queue_timeout_ms, for a slot
+    to free up. Everything else is rejected at once. Classes missing from
+    limits are not limited.
+
+    Waiting requests hold a server thread too, so no more than max_requests
+    are served or waiting across all classes. The server's other threads
+    stay free for unlimited routes such as /api/health.
+    """
+
+    def __init__(self, limits, queue_size=8, queue_timeout_ms=250.0, max_requests=None):
+        self.limits = dict(limits)
+        self.queue_size = queue_size
+        self.timeout = queue_timeout_ms / 1000.0
+        self.max_requests = max_requests
+        self._condition = threading.Condition()
+        self._active = dict.fromkeys(self.limits, 0)
+        self._waiting = dict.fromkeys(self.limits, 0)
+
+        # Metrics
+        self.admitted = dict.fromkeys(self.limits, 0)
+        self.rejected = dict.fromkeys(self.limits, 0)
+        self.queued = dict.fromkeys(self.limits, 0)
+
+    def _in_flight(self):
+        return sum(self._active.values()) + sum(self._waiting.values())
+
+    def acquire(self, route_class):
+        """Take a slot of route_class, waiting in its queue if needed. Returns False when rejected"""
+        if route_class not in self.limits:
+            return True
+        with self._condition:
+            if self.max_requests is not None and self._in_flight() >= self.max_requests:
+                self.rejected[route_class] += 1
+                return False
+            if self._active[route_class] >= self.limits[route_class]:
+                if self._waiting[route_class] >= self.queue_size:
+                    self.rejected[route_class] += 1
+                    return False
+                self.queued[route_class] += 1
+                self._waiting[route_class] += 1
+                deadline = time.monotonic() + self.timeout
+                try:
+                    while self._active[route_class] >= self.limits[route_class]:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected[route_class] += 1
+                            return False
+                        self._condition.wait(remaining)
+                finally:
+                    self._waiting[route_class] -= 1
+            self._active[route_class] += 1
+            self.admitted[route_class] += 1
+            return True
+
+    def release(self, route_class):
+        if route_class not in self.limits:
+            return
+        with self._condition:
+            self._active[route_class] -= 1
+            self._condition.notify_all()
+
+    def busy(self, route_class):
+        """Whether route_class has no free slot, or requests waiting for one"""
+        with self._condition:
+            return (route_class in self.limits and (self._active[route_class] >= self.limits[route_class]
+                                                    or self._waiting[route_class] > 0))
+
+    def stats(self):
+        with self._condition:
+            return {
+                route_class: {
+                    "limit": limit,
+                    "active": self._active[route_class],
+                    "waiting": self._waiting[route_class],
+                    "admitted": self.admitted[route_class],
+                    "queued": self.queued[route_class],
+                    "rejected": self.rejected[route_class],
+                }
+                for route_class, limit in self.limits.items()
+            }
@@ -1,15 +1,69 @@
 from flask import Flask
 from flask_cors import CORS
 import os
+from app.ingest import UploadRequest
 
-def create_app():
+def create_app(config=None):
+    """The API app, with the settings in config overriding the defaults below"""
     app = Flask(__name__)
+    app.request_class = UploadRequest  # Larger, disk-spooled uploads for batch jobs
     CORS(app)  # Enable CORS for all routes
     
     # Load configuration
     app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), '..', 'uploads')
     app.config['RESULTS_FOLDER'] = os.path.join(os.path.dirname(__file__), '..', 'results')
+    app.config['MODEL_FOLDER'] = os.environ.get('MODEL_FOLDER', os.path.join(os.path.dirname(__file__), '..'))  # Where model artifacts are found
+    app.config['DEFAULT_MODEL'] = 'rf'  # Model used when a request does not name one
+    app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')  # Enables the admin endpoints, e.g. model reload
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max size
+    app.config['BATCH_MAX_UPLOAD_BYTES'] = 2 * 1024 * 1024 * 1024  # 2 GB max size for batch CSV uploads
+    app.config['BATCH_CHUNK_SIZE'] = 50000  # Rows per model.predict call in batch jobs
+    app.config['BATCH_WORKERS'] = max(1, (os.cpu_count() or 1) - 1)  # Batch worker processes per host, one core left for requests
+    app.config['BATCH_QUEUE_MAX'] = 20  # Batch jobs waiting for a worker per host, 429 beyond that
+    app.config['SERVER_PROCESSES'] = int(os.environ.get('WEB_CONCURRENCY', 1))  # Server processes on the host, the batch limits are split among them
+    app.config['BATCH_WORKER_NICE'] = 10  # CPU niceness added to batch workers
+    app.config['BATCH_EVENTS_POLL_SECONDS'] = 1.0  # How often an event stream checks its job
+    app.config['BATCH_EVENTS_MAX_SECONDS'] = 300.0  # Event streams end after this, clients reconnect
+    app.config['UPLOADS_MAX_BYTES'] = 5 * 1024 * 1024 * 1024  # Oldest uploads are deleted beyond this
+    app.config['RESULTS_MAX_BYTES'] = 5 * 1024 * 1024 * 1024  # Oldest results are deleted beyond this
+    app.config['RETENTION_MAX_AGE_SECONDS'] = 7 * 24 * 3600  # Uploads and results older than this are deleted
+    app.config['RETENTION_INTERVAL_SECONDS'] = 60.0  # Minimum time between retention sweeps
+    app.config['JOB_STORE_URL'] = 'sqlite:///' + os.path.abspath(
+        os.path.join(os.path.dirname(__file__), '..', 'jobs.db'))  # Batch job records, or 'memory://' for one process
+    app.config['BULK_MAX_RECORDS'] = 10000  # Max records per /api/predict/bulk request
+    app.config['SWEEP_MAX_POINTS'] = 10000  # Max grid points per /api/predict/sweep request
+    app.config['HISTORY_DATASET'] = os.path.join(os.path.dirname(__file__), '..', 'content', 'garments_worker_productivity.csv')  # Historical records served by /api/history
+    app.config['HISTORY_INCLUDE_BATCHES'] = True  # Add the predictions of completed batch jobs to the history
+    app.config['HISTORY_REFRESH_SECONDS'] = 10.0  # How often a server process picks up batch jobs completed by others
+    app.config['HISTORY_MAX_RECORDS'] = 10000  # Max records per /api/history response
+    app.config['HISTORY_MAX_AGE_SECONDS'] = 60  # Cache-Control max-age of history queries and aggregates
+    app.config['META_MAX_AGE_SECONDS'] = 3600  # Cache-Control max-age of the metadata endpoints
+    app.config['CHART_CACHE_MAX_BYTES'] = 64 * 1024 * 1024  # Rendered chart cache size
+    app.config['CHART_RENDER_WORKERS'] = min(4, os.cpu_count() or 1)  # Chart render processes, 0 renders in-thread
+    app.config['MICROBATCH_ENABLED'] = True  # Coalesce concurrent /api/predict calls into one model call
+    app.config['MICROBATCH_WINDOW_MS'] = 0.0  # Extra wait for more rows once the queue is empty, 0 flushes at once
+    app.config['MICROBATCH_MAX_ROWS'] = 64  # Rows per coalesced model call
+    app.config['MICROBATCH_TIMEOUT_MS'] = 1000.0  # Upper bound on a request's wait, 503 after that
+    app.config['PREDICTION_CACHE_SIZE'] = 10000  # Feature vectors kept in the prediction cache, 0 disables it
+    app.config['PREDICTION_CACHE_TTL'] = 300.0  # Seconds a cached prediction stays valid
+    app.config['ADMISSION_ENABLED'] = True  # Limit concurrent requests per route class, 429 beyond the limits
+    app.config['ADMISSION_LIMITS'] = {'prediction': 4, 'visualization': 2, 'batch_upload': 2, 'batch_status': 4, 'batch_events': 2, 'metadata': 4, 'operations': 2}  # Requests served at once per route class, in each server process
+    app.config['ADMISSION_QUEUE_SIZE'] = 8  # Requests of a class waiting for a slot
+    app.config['ADMISSION_QUEUE_TIMEOUT_MS'] = 250.0  # Longest wait for a slot, 429 after that
+    app.config['ADMISSION_MAX_REQUESTS'] = int(os.environ.get('GUNICORN_THREADS', 8)) - 1  # Limited requests served or waiting at once, one server thread stays free for /api/health
+    app.config['ADMISSION_RETRY_AFTER_SECONDS'] = 1  # Retry-After of a 429 from admission control
+    app.config['SERVER_TIMING'] = False  # Add a Server-Timing header with the stage timings to API responses
+    app.config['METRICS_MULTIPROC_DIR'] = os.environ.get('PROMETHEUS_MULTIPROC_DIR')  # Where server processes share their metrics, set by gunicorn.conf.py
+    app.config['METRICS_FLUSH_SECONDS'] = 1.0  # How often a process saves its metrics for the others
+    app.config['PROFILE_DIR'] = os.path.join(os.path.dirname(__file__), '..', 'profiles')  # Where request profiles and batch allocation reports are written
+    app.config['PROFILE_SAMPLE_RATE'] = 0.0  # Fraction of requests profiled, with 0 only admin requests sent with X-Profile are
+    app.config['PROFILE_FORMAT'] = 'pstats'  # 'pstats' (cProfile) or 'speedscope' (sampled stacks)
+    app.config['PROFILE_SAMPLE_INTERVAL_MS'] = 5.0  # Stack sampling interval of speedscope profiles
+    app.config['BATCH_TRACK_MEMORY'] = False  # Trace the allocations of batch jobs and record their peak memory
+    
+    # Overrides of the caller, e.g. tests with their own folders and job store
+    if config:
+        app.config.update(config)
     
     # Create directories if they don't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
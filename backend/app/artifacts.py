@@ -0,0 +1,168 @@
+"""
+Pickle-free model artifacts.
+
+A compiled model is exported to a folder of .npy arrays and a model.json
+manifest. Loading maps the arrays read-only with np.load(mmap_mode='r'), so
+no Python objects are deserialized and every process on the machine shares
+one page-cache copy of the model.
+
+Export the shipped pickles from the backend directory:
+
+    python -m app.artifacts model_rf.pkl model_lr.pkl
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+from app.inference import CompiledForest, CompiledLinear, compile_model
+
+# Describes the arrays of an exported model
+MANIFEST = 'model.json'
+
+# Bumped when the layout of the arrays changes
+FORMAT_VERSION = 1
+
+def _model_arrays(compiled):
+    """The arrays and settings that make up a compiled model"""
+    if isinstance(compiled, CompiledForest):
+        arrays = {
+            "feature": compiled.feature,
+            "threshold": compiled.threshold,
+            "children": compiled.children,
+            "value": compiled.value,
+            "roots": compiled.roots,
+        }
+        if compiled.default_left is not None:
+            arrays["default_left"] = compiled.default_left
+        if compiled.node_value is not compiled.value:
+            arrays["node_value"] = compiled.node_value
+        settings = {
+            "kind": "forest",
+            "max_depth": compiled.max_depth,
+            "n_features": compiled.n_features,
+            "average": compiled.average,
+            "strict": compiled.strict,
+            "base_score": compiled.base_score,
+        }
+        return arrays, settings
+    if isinstance(compiled, CompiledLinear):
+        return {"coef": compiled.coef}, {"kind": "linear", "intercept": compiled.intercept}
+    raise TypeError(f"Cannot export {type(compiled).__name__}, only fitted tree ensembles and linear models")
+
+def export_model(model, path, version=None):
+    """
+    Write a fitted model to the folder path as an array artifact.
+
+    version defaults to a hash of the arrays. Pass the version of the pickle
+    the model came from to keep cached predictions and reusable batch
+    results valid across the two, as both predict the same values. The
+    folder is written next to path and renamed into place. Returns the
+    version.
+    """
+    compiled = model if isinstance(model, (CompiledForest, CompiledLinear)) else compile_model(model)
+    arrays, settings = _model_arrays(compiled)
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    if version is None:
+        digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+        for name in sorted(arrays):
+            digest.update(name.encode())
+            digest.update(arrays[name].tobytes())
+        version = digest.hexdigest()[:12]
+
+    path = os.path.abspath(path)
+    staging = path + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, f"{name}.npy"), array, allow_pickle=False)
+    manifest = dict(settings, format=FORMAT_VERSION, version=version, arrays=sorted(arrays))
+    with open(os.path.join(staging, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Processes that already mapped the old arrays keep reading them
+    if os.path.exists(path):
+        retired = path + '.old'
+        shutil.rmtree(retired, ignore_errors=True)
+        os.rename(path, retired)
+        os.rename(staging, path)
+        shutil.rmtree(retired)
+    else:
+        os.rename(staging, path)
+    return version
+
+def load_model_artifact(path):
+    """Map an exported model read-only, returns (model, version)"""
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported model artifact format {manifest.get('format')}")
+
+    # np.asarray drops the memmap subclass, the data stays in the mapping
+    arrays = {
+        name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r', allow_pickle=False))
+        for name in manifest["arrays"]
+    }
+    if manifest["kind"] == "forest":
+        model = CompiledForest(
+            arrays["feature"], arrays["threshold"], arrays["children"], arrays["value"], arrays["roots"],
+            manifest["max_depth"], manifest["n_features"],
+            average=manifest["average"],
+            strict=manifest["strict"],
+            default_left=arrays.get("default_left"),
+            base_score=manifest["base_score"],
+            node_value=arrays.get("node_value"),
+        )
+        if manifest["strict"] and "node_value" not in arrays:
+            # Boosters exported before explanations have no node means
+            model.node_value = None
+    elif manifest["kind"] == "linear":
+        model = CompiledLinear(arrays["coef"], manifest["intercept"])
+    else:
+        raise ValueError(f"Unknown model kind {manifest['kind']}")
+    return model, manifest["version"]
+
+def artifact_version(path):
+    """Version of the model artifact at path, an exported folder or a pickle"""
+    if os.path.isdir(path):
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f)["version"]
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+def load_artifact(path):
+    """
+    Load the model artifact at path, returns (model, version).
+
+    Exported folders are mapped with load_model_artifact. Pickles are
+    unpickled and compiled, their version is a hash of the file.
+    """
+    if os.path.isdir(path):
+        return load_model_artifact(path)
+    with open(path, 'rb') as f:
+        model_bytes = f.read()
+    return compile_model(pickle.loads(model_bytes)), hashlib.sha256(model_bytes).hexdigest()[:12]
+
+def main():
+    parser = argparse.ArgumentParser(description="Export pickled models to memory-mappable array artifacts")
+    parser.add_argument("pickles", nargs="+", help="model_<name>.pkl files, exported to model_<name>/")
+    args = parser.parse_args()
+
+    for pickle_path in args.pickles:
+        model, version = load_artifact(pickle_path)
+        path = os.path.splitext(pickle_path)[0]
+        try:
+            export_model(model, path, version=version)
+        except TypeError as e:
+            print(f"Skipped {pickle_path}: {e}")
+            continue
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        print(f"Exported {pickle_path} to {path}/ ({size / 1024:.0f} KB, version {version})")
+
+if __name__ == "__main__":
+    main()
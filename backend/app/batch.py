@@ -0,0 +1,140 @@
+from contextlib import nullcontext
+
+import numpy as np
+
+from app.artifacts import artifact_version, load_artifact
+from app.cache import PredictionCache, predict_cached
+from app.explain import explain_rows, explanation_columns
+from app.features import FEATURE_NAMES, validate_frame, prepare_model_frame, get_productivity_categories
+from app.history import BatchHistoryWriter, batch_history
+from app.ingest import read_batch_chunks
+from app.jobs import JobCancelled
+from app.jobstore import open_job_store
+from app.metrics import NULL_TIMER, STAGE_SECONDS, Histogram, StageTimer
+from app.profiling import track_allocations
+from app.writers import RESULT_WRITERS
+
+# Rows read and scored per chunk
+DEFAULT_CHUNK_SIZE = 50000
+
+def predict_chunk(df, model, cache=None, model_version=None, timer=NULL_TIMER, explain=False, history=None):
+    """
+    Validate, encode and score one chunk of batch rows column-wise.
+
+    Returns (predictions, categories, errors) aligned with the rows of df.
+    Invalid rows get a NaN prediction and the 'Invalid input data' category.
+    With a PredictionCache, repeated feature vectors are only scored once.
+    Each step is timed as a stage of timer.
+
+    With explain, the model's (bias, contributions) per row is returned as
+    a fourth item, see explain_rows. Invalid rows get NaN contributions.
+    With a BatchHistoryWriter as history, the valid rows and their
+    predictions are appended to it.
+    """
+    with timer.stage("validate"):
+        valid, errors, columns = validate_frame(df)
+
+    predictions = np.full(len(df), np.nan)
+    contributions = np.full((len(df), len(FEATURE_NAMES)), np.nan) if explain else None
+    bias = np.nan
+    if valid.any():
+        with timer.stage("prepare"):
+            model_input = prepare_model_frame(columns, valid)
+        with timer.stage("predict"):
+            predictions[valid] = predict_cached(model, model_input, cache, model_version)
+        if explain:
+            with timer.stage("explain"):
+                bias, contributions[valid] = explain_rows(model, model_input)
+
+    with timer.stage("categorize"):
+        categories = np.full(len(df), "Invalid input data", dtype=object)
+        categories[valid] = get_productivity_categories(predictions[valid])
+
+    if history is not None:
+        with timer.stage("history"):
+            history.append(batch_history(predictions, valid, columns))
+
+    if explain:
+        return predictions, categories, errors, (bias, contributions)
+    return predictions, categories, errors
+
+# Models loaded by this worker process: path -> (model, version, cache). The
+# API's prediction caches live in the server process, out of reach of the
+# pool, so each worker caches the predictions of the jobs it runs itself.
+_worker_models = {}
+
+def _load_worker_model(model_path):
+    """
+    The model in the artifact at model_path. Its version is checked on every
+    job, so an artifact replaced by a hot swap is picked up by the next job.
+    """
+    version = artifact_version(model_path)
+    loaded = _worker_models.get(model_path)
+    if loaded is None or loaded[1] != version:
+        model, version = load_artifact(model_path)
+        loaded = (model, version, PredictionCache())
+        _worker_models[model_path] = loaded
+    return loaded
+
+def run_batch(job_id, store_url, file_path, results_path, model_path, chunk_size=DEFAULT_CHUNK_SIZE,
+              output_format='xlsx', history_path=None, explain=False, memory_report_path=None):
+    """
+    Score an uploaded CSV chunk by chunk and stream the results to disk in
+    the given output format. With a history_path, the valid rows and their
+    predictions are also saved there for the history store, a chunk at a
+    time. With explain, the results get the bias and per-feature
+    contribution columns of app.explain. With a memory_report_path,
+    allocations are traced, the summary gets the job's peak_memory_bytes
+    and the top allocation sites are written to that path.
+
+    Runs in a scheduler worker process, so it only depends on its arguments
+    and the job store. Only one chunk is in memory at a time. Progress is
+    recorded after every chunk, and cancellation is checked before each one.
+    Returns a summary of the job, with the version of the model used and
+    the time spent per stage of every chunk as a STAGE_SECONDS snapshot.
+    """
+    # Allocations are traced only when asked for, tracemalloc slows every allocation down
+    tracking = track_allocations(memory_report_path) if memory_report_path else nullcontext({})
+    with tracking as memory:
+        store = open_job_store(store_url)
+        model, version, cache = _load_worker_model(model_path)
+        stage_seconds = Histogram(STAGE_SECONDS.name, STAGE_SECONDS.documentation, STAGE_SECONDS.labelnames)
+
+        rows_done = 0
+        valid_rows = 0
+        history = BatchHistoryWriter(history_path) if history_path else nullcontext()
+        with history as history, RESULT_WRITERS[output_format](results_path) as writer:
+            chunks = read_batch_chunks(file_path, chunk_size)
+            while True:
+                timer = StageTimer()
+                with timer.stage("read"):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                if store.cancel_requested(job_id):
+                    raise JobCancelled()
+                scored = predict_chunk(chunk, model, cache, version, timer, explain, history)
+                predictions, categories, errors = scored[:3]
+                with timer.stage("write"):
+                    results = chunk.assign(
+                        actual_productivity=predictions,
+                        category=categories,
+                        # Present even when every row is valid, the header is written before that is known
+                        errors=np.where(errors != "", errors, None),
+                    )
+                    if explain:
+                        results = results.assign(**explanation_columns(*scored[3]))
+                    writer.write(results)
+                rows_done += len(chunk)
+                valid_rows += int(np.count_nonzero(errors == ""))
+                store.update(job_id, rows_done=rows_done)
+                for stage, seconds in timer.stages.items():
+                    stage_seconds.observe(seconds, endpoint="batch", stage=stage)
+            if store.cancel_requested(job_id):
+                raise JobCancelled()
+
+    summary = {"rows_done": rows_done, "rows_total": rows_done, "valid_rows": valid_rows, "model_version": version,
+               "stage_seconds": stage_seconds.snapshot()}
+    if "peak_bytes" in memory:
+        summary["peak_memory_bytes"] = memory["peak_bytes"]
+    return summary
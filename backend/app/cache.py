@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+class PredictionCache:
+    """
+    Bounded LRU cache of predictions with a time-to-live.
+
+    Keys are the encoded feature vectors produced by prepare_model_input, so
+    requests that differ only in ways the model cannot see share an entry.
+    Every lookup carries the model version and the whole cache is dropped
+    when it changes.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.model_version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(row):
+        """Canonical key of one feature vector"""
+        return np.asarray(row, dtype=np.float64).tobytes()
+
+    def _check_version(self, version):
+        # Caller holds the lock
+        if version != self.model_version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.model_version = version
+
+    def get(self, row, version):
+        """Return the cached prediction for a row, or None"""
+        key = self.key(row)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, row, version, value):
+        key = self.key(row)
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (float(value), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, rows, version):
+        """Look up several rows under one lock, returns (values, found mask)"""
+        values = np.full(len(rows), np.nan)
+        found = np.zeros(len(rows), dtype=bool)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            for i, row in enumerate(rows):
+                key = self.key(row)
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    continue
+                self._entries.move_to_end(key)
+                values[i] = entry[0]
+                found[i] = True
+            self.hits += int(found.sum())
+            self.misses += int(len(rows) - found.sum())
+        return values, found
+
+    def put_many(self, rows, version, values):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._check_version(version)
+            for row, value in zip(rows, values):
+                key = self.key(row)
+                self._entries[key] = (float(value), expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "model_version": self.model_version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+def predict_cached(model, X, cache, version):
+    """
+    Score rows of encoded features, skipping the model for cached vectors.
+
+    Repeated rows are scored once. Only the distinct vectors missing from the
+    cache go to model.predict, in a single call.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    if cache is None or not len(X):
+        return model.predict(X)
+
+    unique, inverse = np.unique(X, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    if len(unique) > cache.max_entries:
+        # A batch this varied would only flush the cache, just score each distinct row once
+        return model.predict(unique)[inverse]
+
+    values, found = cache.get_many(unique, version)
+    if not found.all():
+        missing = unique[~found]
+        predictions = model.predict(missing)
+        values[~found] = predictions
+        cache.put_many(missing, version, predictions)
+
+    return values[inverse]
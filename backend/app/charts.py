@@ -0,0 +1,332 @@
+import io
+import math
+import os
+import sys
+import threading
+import weakref
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Response key -> chart name used in the image URL
+CHARTS = {
+    'bar_chart_url': 'bar',
+    'scatter_plot_url': 'scatter',
+    'line_graph_url': 'line',
+    'pie_chart_url': 'pie',
+}
+
+CATEGORIES = ['Targeted Productivity', 'SMV', 'Over Time', 'Idle Time']
+
+# Response formats for the visualizations of a prediction
+CHART_FORMATS = ('png', 'composite', 'svg', 'data')
+
+# Image formats served by the visualization route
+IMAGE_MIMETYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+# The composite chart draws all four plots on one 2x2 figure
+COMPOSITE_CHART = 'composite'
+
+# Default size bound of the rendered image cache
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+def chart_values(data):
+    """Return the four plotted values of a validated record"""
+    return (
+        float(data.get("targeted_productivity", 0)),
+        float(data.get("smv_minutes", 0)),
+        float(data.get("over_time_hours", 0)),
+        float(data.get("idle_time_minutes", 0)),
+    )
+
+def chart_key(values):
+    """Content address of a chart set: the plotted values themselves"""
+    return "_".join(repr(value) for value in values)
+
+def parse_chart_key(key):
+    """
+    Inverse of chart_key, returns None for a malformed key. Validated
+    records never plot negative or non-finite values, so neither do keys.
+    """
+    parts = key.split("_")
+    if len(parts) != len(CATEGORIES):
+        return None
+    try:
+        values = tuple(float(part) for part in parts)
+    except ValueError:
+        return None
+    if not all(math.isfinite(value) and value >= 0 for value in values):
+        return None
+    return values
+
+def _draw_bar(fig, values):
+    ax = fig.add_subplot()
+    ax.bar(CATEGORIES, values, color=['blue', 'green', 'red', 'orange'])
+    ax.set_xlabel('Parameters')
+    ax.set_ylabel('Values')
+    ax.set_title('Employee Productivity Parameters')
+
+def _draw_scatter(fig, values):
+    ax = fig.add_subplot()
+    ax.scatter([1, 2, 3, 4], values, s=100, alpha=0.7)
+    ax.set_xticks([1, 2, 3, 4], CATEGORIES)
+    ax.set_xlabel('Parameters')
+    ax.set_ylabel('Values')
+    ax.set_title('Scatter Plot of Employee Parameters')
+    ax.grid(True, linestyle='--', alpha=0.7)
+
+def _draw_line(fig, values):
+    ax = fig.add_subplot()
+    ax.plot([1, 2, 3, 4], values, marker='o', linestyle='-', linewidth=2, markersize=10)
+    ax.set_xticks([1, 2, 3, 4], CATEGORIES)
+    ax.set_xlabel('Parameters')
+    ax.set_ylabel('Values')
+    ax.set_title('Line Plot of Employee Parameters')
+    ax.grid(True, linestyle='--', alpha=0.7)
+
+def _pie(ax, values, **kwargs):
+    """Pie of the values, or a "No data" placeholder when they are all zero"""
+    if sum(values) > 0:
+        ax.pie(values, labels=CATEGORIES, autopct='%1.1f%%', startangle=90, **kwargs)
+        ax.axis('equal')
+    else:
+        ax.text(0.5, 0.5, 'No data', ha='center', va='center', fontsize=14, transform=ax.transAxes)
+        ax.axis('off')
+
+def _draw_pie(fig, values):
+    ax = fig.add_subplot()
+    _pie(ax, values, shadow=True, explode=(0.05, 0, 0, 0))
+    ax.set_title('Distribution of Employee Parameters')
+
+def _draw_composite(fig, values):
+    axes = fig.subplots(2, 2)
+
+    # Bar chart (top left)
+    axes[0, 0].bar(CATEGORIES, values, color=['blue', 'green', 'red', 'orange'])
+    axes[0, 0].set_xlabel('Parameters')
+    axes[0, 0].set_ylabel('Values')
+    axes[0, 0].set_title('Employee Productivity Parameters')
+
+    # Scatter plot (top right)
+    axes[0, 1].scatter([1, 2, 3, 4], values, s=100)
+    axes[0, 1].set_xticks([1, 2, 3, 4], CATEGORIES)
+    axes[0, 1].set_xlabel('Parameters')
+    axes[0, 1].set_ylabel('Values')
+    axes[0, 1].set_title('Scatter Plot of Parameters')
+
+    # Line plot (bottom left)
+    axes[1, 0].plot([1, 2, 3, 4], values, marker='o', linestyle='-', linewidth=2)
+    axes[1, 0].set_xticks([1, 2, 3, 4], CATEGORIES)
+    axes[1, 0].set_xlabel('Parameters')
+    axes[1, 0].set_ylabel('Values')
+    axes[1, 0].set_title('Line Plot of Parameters')
+
+    # Pie chart (bottom right)
+    _pie(axes[1, 1], values)
+    axes[1, 1].set_title('Distribution of Parameters')
+
+    fig.tight_layout()
+
+_DRAW = {
+    'bar': _draw_bar,
+    'scatter': _draw_scatter,
+    'line': _draw_line,
+    'pie': _draw_pie,
+    COMPOSITE_CHART: _draw_composite,
+}
+
+_FIGSIZE = {COMPOSITE_CHART: (15, 12)}
+
+# Figures drawn by this process and not garbage collected yet, growth here is a leak
+_figures = weakref.WeakSet()
+
+# Live figures of each render process, pid -> count, as sent with its last image
+_worker_figures = {}
+
+def render_worker_figures():
+    """Live figures of each render process of the pool, as of its last render"""
+    return dict(_worker_figures)
+
+def live_figures():
+    """Figures of this process and its render processes still in memory, open pyplot figures included"""
+    pyplot = sys.modules.get('matplotlib.pyplot')
+    own = len(_figures) + (len(pyplot.get_fignums()) if pyplot is not None else 0)
+    return own + sum(render_worker_figures().values())
+
+def _figure_classes():
+    """
+    Import matplotlib on the first render. It is one of the slowest imports
+    of the app, and most requests never draw a chart.
+    """
+    import matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    # Fixed salt so SVG element ids, and therefore the cached bytes, are stable
+    matplotlib.rcParams['svg.hashsalt'] = 'employee-performance-charts'
+    return Figure, FigureCanvasAgg
+
+def render_chart(chart, values, fmt='png'):
+    """
+    Render one chart and return the image bytes in the given format.
+
+    Uses a standalone Figure on its own Agg canvas, so no pyplot state is
+    shared and concurrent calls are safe.
+    """
+    Figure, FigureCanvasAgg = _figure_classes()
+    fig = Figure(figsize=_FIGSIZE.get(chart, (10, 6)))
+    _figures.add(fig)
+    FigureCanvasAgg(fig)
+    _DRAW[chart](fig, list(values))
+    buf = io.BytesIO()
+    # Drop the SVG creation date so identical values give identical bytes
+    fig.savefig(buf, format=fmt, metadata={'Date': None} if fmt == 'svg' else None)
+    return buf.getvalue()
+
+def _render_in_worker(chart, values, fmt):
+    """render_chart in a pool process, returns (image, pid, live figures of the process)"""
+    image = render_chart(chart, values, fmt)
+    return image, os.getpid(), live_figures()
+
+def _init_render_worker():
+    """Warm up fonts and the Agg backend once per pool process"""
+    for chart in CHARTS.values():
+        render_chart(chart, (1.0, 1.0, 1.0, 1.0))
+
+# Bounded pool of render processes, created on first use
+_executor = None
+_executor_lock = threading.Lock()
+_render_workers = min(4, os.cpu_count() or 1)
+
+def configure_renderer(workers):
+    """Set the render pool size, 0 renders in the calling thread"""
+    global _render_workers
+    _render_workers = workers
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None and _render_workers > 0:
+            _executor = ProcessPoolExecutor(
+                max_workers=_render_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_render_worker,
+            )
+        return _executor
+
+def shutdown_renderer():
+    """Stop the render pool, it is recreated on the next render"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(cancel_futures=True)
+            _executor = None
+        _worker_figures.clear()
+
+def render_charts(values, charts=None, fmt='png'):
+    """Render several charts concurrently in the pool, returns {chart: image}"""
+    charts = list(charts or CHARTS.values())
+    executor = _get_executor()
+    if executor is not None:
+        try:
+            futures = {chart: executor.submit(_render_in_worker, chart, values, fmt) for chart in charts}
+            images = {}
+            for chart, future in futures.items():
+                images[chart], pid, figures = future.result()
+                _worker_figures[pid] = figures
+            return images
+        except BrokenProcessPool:
+            print("Chart render pool failed, rendering in-process")
+            shutdown_renderer()
+    return {chart: render_chart(chart, values, fmt) for chart in charts}
+
+class ChartCache:
+    """Thread-safe LRU cache of rendered images bounded by total size in bytes"""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= len(self._entries.pop(key))
+            self._entries[key] = image
+            self.current_bytes += len(image)
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+chart_cache = ChartCache()
+
+# Renders in progress, so concurrent requests for one chart set share a render
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def get_chart(chart, values, fmt='png'):
+    """
+    Return the image for a chart, rendering it only on a cache miss.
+
+    Each chart is rendered and cached on its own, the client requests the
+    four single charts concurrently and the pool renders them in parallel.
+    """
+    key = chart_key(values)
+    render_key = (chart, fmt, key)
+    image = chart_cache.get(render_key)
+    if image is not None:
+        return image
+
+    with _inflight_lock:
+        pending = _inflight.get(render_key)
+        owner = pending is None
+        if owner:
+            pending = _inflight[render_key] = Future()
+
+    if owner:
+        try:
+            image = render_charts(values, [chart], fmt)[chart]
+            chart_cache.put(render_key, image)
+            pending.set_result(image)
+        except Exception as e:
+            pending.set_exception(e)
+        finally:
+            with _inflight_lock:
+                del _inflight[render_key]
+
+    return pending.result()
+
+def chart_data(values):
+    """Series and labels of the charts, for clients that draw them themselves"""
+    return {
+        "labels": CATEGORIES,
+        "values": list(values),
+        "charts": list(CHARTS.values()),
+    }
@@ -0,0 +1,85 @@
+import json
+import time
+from datetime import datetime
+
+# Final job statuses and the event that reports each one
+FINAL_EVENTS = {
+    'completed': 'complete',
+    'failed': 'failed',
+    'cancelled': 'cancelled',
+    'expired': 'expired',
+}
+
+# Seconds between comment lines that keep idle proxies from closing the stream
+HEARTBEAT_SECONDS = 15.0
+
+# Milliseconds an EventSource waits before reconnecting
+RECONNECT_MS = 2000
+
+def format_event(event, data):
+    """One Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def job_progress(job, now=None):
+    """Rows done, throughput and estimated time left of a running job"""
+    rows_done = job["rows_done"] or 0
+    rows_total = job["rows_total"]
+    progress = {"batch_id": job["id"], "rows_done": rows_done, "rows_total": rows_total}
+    if rows_total:
+        progress["percent"] = round(100.0 * min(rows_done / rows_total, 1.0), 1)
+
+    if job["started_at"]:
+        elapsed = ((now or datetime.now()) - datetime.fromisoformat(job["started_at"])).total_seconds()
+        if elapsed > 0 and rows_done:
+            rate = rows_done / elapsed
+            progress["rows_per_sec"] = round(rate, 1)
+            if rows_total:
+                progress["eta_seconds"] = round(max(rows_total - rows_done, 0) / rate, 1)
+    return progress
+
+def batch_events(load, describe, poll_interval=1.0, max_seconds=300.0):
+    """
+    Generate the event stream of one batch job.
+
+    load() returns the job record from the job store and describe(job) its
+    public status. The store is read every poll_interval seconds. A 'status'
+    event goes out on every status change and a 'progress' event whenever
+    more rows are done. The stream ends with 'complete', 'failed',
+    'cancelled' or 'expired'. It also ends after max_seconds, and the client's
+    EventSource then reconnects.
+    """
+    yield f"retry: {RECONNECT_MS}\n\n"
+    started = last_sent = time.monotonic()
+    last_status = None
+    last_rows = None
+
+    while True:
+        job = load()
+        if job is None:
+            yield format_event("error", {"error": "Batch job not found"})
+            return
+
+        status = job["status"]
+        if status in FINAL_EVENTS:
+            yield format_event(FINAL_EVENTS[status], describe(job))
+            return
+
+        messages = []
+        if status != last_status:
+            messages.append(format_event("status", describe(job)))
+            last_status = status
+        if status == "processing" and job["rows_done"] != last_rows:
+            messages.append(format_event("progress", job_progress(job)))
+            last_rows = job["rows_done"]
+
+        now = time.monotonic()
+        if messages:
+            yield "".join(messages)
+            last_sent = now
+        elif now - last_sent >= HEARTBEAT_SECONDS:
+            yield ": keep-alive\n\n"
+            last_sent = now
+
+        if now - started >= max_seconds:
+            return
+        time.sleep(poll_interval)
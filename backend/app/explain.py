@@ -0,0 +1,39 @@
+import numpy as np
+
+from app.features import FEATURE_NAMES
+
+# Batch result columns of an explained job, the bias first
+BIAS_COLUMN = 'contribution_bias'
+CONTRIBUTION_COLUMNS = [f'contribution_{name}' for name in FEATURE_NAMES]
+
+def check_explainable(model):
+    """Raise ValueError unless model can explain its predictions"""
+    if getattr(model, "explain", None) is None:
+        raise ValueError(f"{type(model).__name__} models cannot explain their predictions")
+    if getattr(model, "node_value", ()) is None:
+        raise ValueError("This model export has no node values, export it again to explain predictions")
+
+def explain_rows(model, model_input):
+    """
+    Per-feature contributions of encoded rows, as (bias, contributions) with
+    contributions of shape (n_rows, len(FEATURE_NAMES)). The bias plus a
+    row's contributions is its prediction.
+
+    Raises ValueError for a model that cannot explain its predictions.
+    """
+    check_explainable(model)
+    bias, contributions = model.explain(np.asarray(model_input, dtype=np.float64).reshape(-1, len(FEATURE_NAMES)))
+    return bias, contributions
+
+def explanation(bias, contributions):
+    """JSON-ready explanation of one row"""
+    return {
+        "bias": float(bias),
+        "contributions": {name: float(value) for name, value in zip(FEATURE_NAMES, contributions)},
+    }
+
+def explanation_columns(bias, contributions):
+    """Batch result columns of a chunk's explanations, NaN for invalid rows"""
+    columns = {BIAS_COLUMN: np.where(np.isnan(contributions).all(axis=1), np.nan, bias)}
+    columns.update(zip(CONTRIBUTION_COLUMNS, contributions.T))
+    return columns
@@ -0,0 +1,368 @@
+import re
+import numpy as np
+from datetime import datetime, date
+
+# Reference data shared by the single-record and columnar paths
+VALID_DEPARTMENTS = ["Sewing", "Finishing", "Cutting", "QC"]
+VALID_INCENTIVE_LEVELS = ["None", "Low", "Standard", "High"]
+
+# Team names are 'Team ' and the team number
+TEAM_PATTERN = re.compile(r"Team ([0-9]+)")
+
+# Encodings used during training
+DEPARTMENT_MAP = {"Sewing": 1, "Finishing": 0}
+INCENTIVE_MAP = {"None": 0, "Low": 1, "Standard": 2, "High": 3}
+
+# Numeric input fields: (key, label, min, max, integer)
+NUMERIC_FIELDS = [
+    ("targeted_productivity", "Targeted productivity", 0, 150, False),
+    ("smv_minutes", "SMV minutes", 0, None, False),
+    ("over_time_hours", "Overtime hours", 0, 8, False),
+    ("idle_time_minutes", "Idle time minutes", 0, None, False),
+    ("idle_men_count", "Idle men count", 0, None, True),
+    ("style_change_count", "Style change count", 0, None, True),
+    ("worker_count", "Worker count", 1, None, True),
+]
+
+# Record fields in the order they are validated
+INPUT_FIELDS = [
+    "date", "department", "team", "targeted_productivity", "smv_minutes",
+    "over_time_hours", "incentive_level", "idle_time_minutes",
+    "idle_men_count", "style_change_count", "worker_count",
+]
+
+# Column order of the model input produced by prepare_model_input
+FEATURE_NAMES = [
+    "quarter", "department", "day", "team", "targeted_productivity", "smv",
+    "over_time", "incentive", "idle_time", "idle_men", "no_of_style_change",
+    "no_of_workers", "month",
+]
+
+# Helper functions
+# The rules below are shared by validate_input and validate_frame, so a record
+# is accepted or rejected the same way by every endpoint
+
+def is_missing(value):
+    """Whether a field value counts as not given: absent, null or a blank CSV cell"""
+    return value is None or (isinstance(value, float) and value != value)
+
+def parse_team(value):
+    """Team number of a 'Team X' string, or None if it is not one"""
+    if not isinstance(value, str):
+        return None
+    match = TEAM_PATTERN.fullmatch(value)
+    return int(match.group(1)) if match else None
+
+def parse_number(value):
+    """Finite float of a number or numeric string, or None if it is not one"""
+    if isinstance(value, (bool, np.bool_)) or not isinstance(value, (int, float, str, np.number)):
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        return None
+    return value if np.isfinite(value) else None
+
+def validate_date(date_str):
+    if not isinstance(date_str, str):
+        return False, "Invalid date format. Use YYYY-MM-DD"
+    try:
+        input_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+        today = date.today()
+        if input_date > today:
+            return False, "Date cannot be in the future"
+        return True, input_date
+    except ValueError:
+        return False, "Invalid date format. Use YYYY-MM-DD"
+
+def validate_numeric(value, name, min_val=None, max_val=None):
+    value = parse_number(value)
+    if value is None:
+        return False, f"{name} must be a number"
+
+    if min_val is not None and value < min_val:
+        return False, f"{name} must be at least {min_val}"
+
+    if max_val is not None and value > max_val:
+        return False, f"{name} cannot exceed {max_val}"
+
+    return True, value
+
+def validate_input(data):
+    errors = []
+    validated_data = {}
+
+    # Check date
+    value = data.get("date")
+    if is_missing(value):
+        errors.append("Date is required")
+    else:
+        is_valid, date_result = validate_date(value)
+        if not is_valid:
+            errors.append(date_result)
+        else:
+            validated_data["date"] = date_result
+
+    # Check department
+    value = data.get("department")
+    if is_missing(value):
+        errors.append("Department is required")
+    elif value not in VALID_DEPARTMENTS:
+        errors.append("Invalid department")
+    else:
+        validated_data["department"] = value
+
+    # Check team
+    value = data.get("team")
+    if is_missing(value):
+        errors.append("Team is required")
+    elif parse_team(value) is None:
+        errors.append("Invalid team format. Should be 'Team X'")
+    else:
+        validated_data["team"] = value
+
+    # Check the numeric fields in validation order, incentive level sits between them
+    for key, label, min_val, max_val, integer in NUMERIC_FIELDS:
+        if key == "idle_time_minutes":
+            level = data.get("incentive_level")
+            if is_missing(level):
+                errors.append("Incentive level is required")
+            elif level not in VALID_INCENTIVE_LEVELS:
+                errors.append("Invalid incentive level")
+            else:
+                validated_data["incentive_level"] = level
+
+        value = data.get(key)
+        if is_missing(value):
+            errors.append(f"{label} is required")
+            continue
+        is_valid, value = validate_numeric(value, label, min_val, max_val)
+        if not is_valid:
+            errors.append(value)
+        else:
+            validated_data[key] = int(value) if integer else value
+
+    return len(errors) == 0, errors, validated_data
+
+def prepare_model_input(data):
+    """
+    Convert the user input to the format expected by the model
+    """
+    # Encode categorical features
+    quarter = data.get("date").month // 3 + 1 if hasattr(data.get("date"), "month") else 1
+    month = data.get("date").month if hasattr(data.get("date"), "month") else datetime.now().month
+
+    # Map department to numeric value (use the encoding used during training)
+    department = DEPARTMENT_MAP.get(data.get("department"), 1)  # Default to Sewing if unknown
+
+    # Map day of week (1=Monday, 7=Sunday)
+    day = data.get("date").weekday() + 1 if hasattr(data.get("date"), "weekday") else 1
+
+    # Extract team number
+    team = parse_team(data.get("team")) or 1
+
+    # Map incentive level
+    incentive = INCENTIVE_MAP.get(data.get("incentive_level"), 2)  # Default to Standard if unknown
+
+    # Prepare the input array for model prediction
+    model_input = [
+        quarter,
+        department,
+        day,
+        team,
+        float(data.get("targeted_productivity")),
+        float(data.get("smv_minutes")),
+        int(data.get("over_time_hours")),
+        incentive,
+        float(data.get("idle_time_minutes")),
+        int(data.get("idle_men_count")),
+        int(data.get("style_change_count")),
+        float(data.get("worker_count")),
+        month
+    ]
+
+    return [model_input]  # Model expects a 2D array
+
+def get_productivity_category(productivity):
+    """Return the productivity category based on the model's output"""
+    if productivity <= 0.3:
+        return "Below Average Productivity"
+    elif 0.3 < productivity <= 0.8:
+        return "Medium Productivity"
+    else:
+        return "High Productivity"
+
+# Columnar helpers
+
+# Stands in for the list and dict values of JSON records, which cannot be
+# hashed. Like those values it is not missing and fails every rule
+_NOT_SCALAR = object()
+
+def _column(df, key):
+    """Return a column as an object array, or all-missing if it is absent"""
+    import pandas as pd
+    if key not in df.columns:
+        return np.full(len(df), None, dtype=object)
+    values = df[key].to_numpy(dtype=object)
+    # Only mixed columns can hold non-scalar cells, CSV columns are never checked cell by cell
+    if pd.api.types.infer_dtype(values, skipna=True) in ("mixed", "mixed-integer"):
+        values = np.array([value if pd.api.types.is_scalar(value) else _NOT_SCALAR for value in values],
+                          dtype=object)
+    return values
+
+def _add_error(errors, mask, message):
+    """Append a message to the error string of every row in mask"""
+    if not mask.any():
+        return
+    current = errors[mask]
+    if isinstance(message, str):
+        message = np.full(len(current), message, dtype=object)
+    errors[mask] = np.where(current == "", message, current + "; " + message)
+
+def _validate_dates(values):
+    """Validate date strings once per distinct value"""
+    import pandas as pd
+    codes, uniques = pd.factorize(values)
+    # One extra slot at the end absorbs the -1 code of missing values
+    messages = np.full(len(uniques) + 1, "", dtype=object)
+    dates = np.full(len(uniques) + 1, np.datetime64('NaT'), dtype='datetime64[D]')
+    months = np.zeros(len(uniques) + 1, dtype=np.int64)
+    weekdays = np.zeros(len(uniques) + 1, dtype=np.int64)
+    for i, value in enumerate(uniques):
+        is_valid, result = validate_date(value)
+        if not is_valid:
+            messages[i] = result
+        else:
+            dates[i] = result
+            months[i] = result.month
+            weekdays[i] = result.weekday()
+    return codes == -1, messages[codes], dates[codes], months[codes], weekdays[codes]
+
+def _validate_teams(values):
+    """Validate 'Team X' strings once per distinct value"""
+    import pandas as pd
+    codes, uniques = pd.factorize(values)
+    # One extra slot at the end absorbs the -1 code of missing values
+    valid = np.zeros(len(uniques) + 1, dtype=bool)
+    numbers = np.zeros(len(uniques) + 1, dtype=np.int64)
+    for i, value in enumerate(uniques):
+        number = parse_team(value)
+        if number is not None:
+            numbers[i] = number
+            valid[i] = True
+    return codes == -1, valid[codes], numbers[codes]
+
+def _parse_numbers(values):
+    """parse_number of a column, as floats with NaN where it gives None"""
+    import pandas as pd
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        numbers = values.to_numpy(dtype=np.float64)
+        return np.where(np.isfinite(numbers), numbers, np.nan)
+    # Text and mixed columns, parsed once per distinct value
+    codes, uniques = pd.factorize(values)
+    parsed = np.array([parse_number(value) for value in uniques] + [None], dtype=np.float64)
+    return parsed[codes]
+
+def validate_frame(df):
+    """
+    Validate every row of a batch DataFrame at once.
+
+    Mirrors validate_input column by column and produces the same error
+    messages in the same order. Blank cells and missing keys are reported as
+    "<field> is required", like a record that omits the field, instead of
+    failing the whole batch.
+
+    Returns (valid, errors, columns) where valid is a boolean mask, errors is
+    an object array of '; '-joined messages ('' for valid rows) and columns
+    holds the validated values used by prepare_model_frame, plus the parsed
+    date and the department name of every row for the batch history.
+    """
+    # Imported here, the single-record path runs without pandas
+    import pandas as pd
+
+    n = len(df)
+    errors = np.full(n, "", dtype=object)
+    columns = {}
+
+    # Check date
+    missing, messages, dates, months, weekdays = _validate_dates(_column(df, "date"))
+    _add_error(errors, missing, "Date is required")
+    invalid = ~missing & (messages != "")
+    _add_error(errors, invalid, messages[invalid])
+    columns["date"] = dates
+    columns["month"] = months
+    columns["weekday"] = weekdays
+
+    # Check department
+    department = pd.Series(_column(df, "department"))
+    missing = department.isna().to_numpy()
+    _add_error(errors, missing, "Department is required")
+    _add_error(errors, ~missing & ~department.isin(VALID_DEPARTMENTS).to_numpy(), "Invalid department")
+    columns["department_name"] = department.to_numpy(dtype=object)
+    columns["department"] = department.map(DEPARTMENT_MAP).fillna(1).to_numpy(dtype=np.int64)
+
+    # Check team
+    missing, valid, numbers = _validate_teams(_column(df, "team"))
+    _add_error(errors, missing, "Team is required")
+    _add_error(errors, ~missing & ~valid, "Invalid team format. Should be 'Team X'")
+    columns["team"] = numbers
+
+    # Check the numeric fields in validation order, incentive level sits between them
+    for key, label, min_val, max_val, integer in NUMERIC_FIELDS:
+        if key == "idle_time_minutes":
+            level = pd.Series(_column(df, "incentive_level"))
+            missing = level.isna().to_numpy()
+            _add_error(errors, missing, "Incentive level is required")
+            _add_error(errors, ~missing & ~level.isin(VALID_INCENTIVE_LEVELS).to_numpy(), "Invalid incentive level")
+            columns["incentive_level"] = level.map(INCENTIVE_MAP).fillna(2).to_numpy(dtype=np.int64)
+
+        raw = df[key] if key in df.columns and df[key].dtype != object else pd.Series(_column(df, key))
+        missing = raw.isna().to_numpy()
+        values = _parse_numbers(raw)
+        not_number = ~missing & np.isnan(values)
+        _add_error(errors, missing, f"{label} is required")
+        _add_error(errors, not_number, f"{label} must be a number")
+
+        checked = ~missing & ~not_number
+        with np.errstate(invalid="ignore"):
+            _add_error(errors, checked & (values < min_val), f"{label} must be at least {min_val}")
+            if max_val is not None:
+                _add_error(errors, checked & (values >= min_val) & (values > max_val), f"{label} cannot exceed {max_val}")
+
+        values = np.where(checked, values, 0.0)
+        columns[key] = np.trunc(values) if integer else values
+
+    return errors == "", errors, columns
+
+def prepare_model_frame(columns, rows=None):
+    """
+    Build the 2D model input for validated columns, matching prepare_model_input
+    """
+    if rows is None:
+        rows = slice(None)
+    month = columns["month"][rows]
+    return np.column_stack([
+        month // 3 + 1,
+        columns["department"][rows],
+        columns["weekday"][rows] + 1,
+        columns["team"][rows],
+        columns["targeted_productivity"][rows],
+        columns["smv_minutes"][rows],
+        np.trunc(columns["over_time_hours"][rows]),
+        columns["incentive_level"][rows],
+        columns["idle_time_minutes"][rows],
+        columns["idle_men_count"][rows],
+        columns["style_change_count"][rows],
+        columns["worker_count"][rows],
+        month,
+    ]).astype(np.float64)
+
+def get_productivity_categories(predictions):
+    """Vectorized get_productivity_category"""
+    predictions = np.asarray(predictions, dtype=np.float64)
+    return np.select(
+        [predictions <= 0.3, predictions <= 0.8],
+        ["Below Average Productivity", "Medium Productivity"],
+        "High Productivity",
+    ).astype(object)
@@ -0,0 +1,414 @@
+import csv
+import hashlib
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+# Historical productivity records served by /api/history
+DATASET_PATH = os.path.join(os.path.dirname(__file__), '..', 'content', 'garments_worker_productivity.csv')
+
+# Written next to a batch result, the rows it adds to the history
+HISTORY_SUFFIX = '.history.npz'
+
+# Where a record comes from: the dataset, or a completed batch job
+SOURCES = ("observed", "predicted")
+
+# Upper bounds of the dataset's incentive amounts in each band, named like
+# the incentive levels of the API
+INCENTIVE_BANDS = [(0, "None"), (40, "Low"), (80, "Standard"), (float('inf'), "High")]
+BAND_NAMES = [name for _, name in INCENTIVE_BANDS]
+
+# Groupings of the precomputed aggregates
+GROUPINGS = ("team", "department", "week", "incentive_band")
+
+PERCENTILES = (10, 50, 90)
+
+# Columns of a history record, in the order rows are returned
+COLUMNS = ("date", "department", "team", "incentive_band", "targeted_productivity", "actual_productivity", "source")
+
+# Columns saved with a batch result and their types, text as fixed-width
+# strings so loading needs no pickle
+BATCH_COLUMNS = {
+    "date": 'datetime64[D]',
+    "department": str,
+    "team": np.int64,
+    "incentive_band": str,
+    "targeted_productivity": np.float64,
+    "actual_productivity": np.float64,
+}
+
+# Encoded columns of the history store. Departments and bands are codes,
+# job is the batch job a predicted row came from, -1 for observed rows
+STORE_COLUMNS = {
+    "date": 'datetime64[D]',
+    "department": np.int16,
+    "team": np.int64,
+    "incentive_band": np.int8,
+    "targeted_productivity": np.float64,
+    "actual_productivity": np.float64,
+    "source": np.int8,
+    "job": np.int32,
+}
+
+def incentive_band(amounts):
+    """Band name of each incentive amount"""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    return np.select([amounts <= bound for bound, _ in INCENTIVE_BANDS], BAND_NAMES, default=BAND_NAMES[0]).astype(object)
+
+def load_dataset(path=DATASET_PATH):
+    """The dataset as history columns, read without pandas so startup stays light"""
+    with open(path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    return {
+        "date": np.array([datetime.strptime(row["date"], "%m/%d/%Y").date() for row in rows], dtype='datetime64[D]'),
+        # 'sweing' and 'finishing ' as the API spells them
+        "department": np.array(["Finishing" if row["department"].strip() == "finishing" else "Sewing"
+                                for row in rows], dtype=object),
+        "team": np.array([int(row["team"]) for row in rows], dtype=np.int64),
+        "incentive_band": incentive_band([float(row["incentive"]) for row in rows]),
+        "targeted_productivity": np.array([float(row["targeted_productivity"]) for row in rows]),
+        "actual_productivity": np.array([float(row["actual_productivity"]) for row in rows]),
+    }
+
+def batch_history(predictions, valid, columns):
+    """History columns of the valid rows of a scored batch chunk, from the columns of validate_frame"""
+    return {
+        "date": columns["date"][valid],
+        "department": columns["department_name"][valid],
+        "team": columns["team"][valid],
+        # Incentive level codes number the levels in BAND_NAMES order
+        "incentive_band": np.array(BAND_NAMES, dtype=object)[columns["incentive_level"][valid]],
+        "targeted_productivity": columns["targeted_productivity"][valid],
+        "actual_productivity": np.asarray(predictions, dtype=np.float64)[valid],
+    }
+
+class BatchHistoryWriter:
+    """
+    Writes the history columns of a batch job to an .npz file one chunk at
+    a time, each chunk as arrays of its own, so the job never holds more
+    than a chunk of history. The file appears at path when the writer is
+    closed without an error.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = path[:-len('.npz')] + '.tmp.npz'
+        self._zip = zipfile.ZipFile(self._tmp_path, 'w')
+        self._chunks = 0
+
+    def append(self, columns):
+        if not len(columns["date"]):
+            return
+        for key, dtype in BATCH_COLUMNS.items():
+            with self._zip.open(f"{key}.{self._chunks}.npy", 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, np.asarray(columns[key]).astype(dtype), allow_pickle=False)
+        self._chunks += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._zip.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.path)
+        else:
+            os.remove(self._tmp_path)
+
+def load_batch_history(path):
+    """The history columns written by a BatchHistoryWriter, chunks in order"""
+    parts = {key: [] for key in BATCH_COLUMNS}
+    with np.load(path, allow_pickle=False) as data:
+        for name in data.files:
+            key, _, chunk = name.rpartition('.')
+            parts[key].append((int(chunk), data[name]))
+    columns = {key: np.concatenate([values for _, values in sorted(chunks, key=lambda part: part[0])])
+               if chunks else np.array([], dtype=BATCH_COLUMNS[key])
+               for key, chunks in parts.items()}
+    columns["department"] = columns["department"].astype(object)
+    columns["incentive_band"] = columns["incentive_band"].astype(object)
+    return columns
+
+def _summary(values):
+    if not len(values):
+        return {"count": 0}
+    summary = {"count": int(len(values)), "mean": float(values.mean())}
+    for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{p}"] = float(value)
+    summary["min"] = float(values.min())
+    summary["max"] = float(values.max())
+    return summary
+
+class HistoryData:
+    """
+    One version of the history, over the first size rows of the store's
+    column buffers. Rows are never changed or removed in those buffers, so
+    a version stays valid while the store grows, and a query sees one
+    consistent version.
+
+    order lists the rows by date, and date holds their dates in that order.
+    The team and department indexes and the aggregates are built on first
+    use and kept with the version.
+    """
+
+    def __init__(self, buffers, size, department_names, version, order=None, date=None):
+        self.version = version
+        self._columns = {name: values[:size] for name, values in buffers.items()}
+        if order is None:
+            order = np.argsort(self._columns["date"], kind='stable')
+            date = self._columns["date"][order]
+        self.order = order
+        self.date = date
+
+        # Store codes of the departments present -> index in the sorted names
+        present = np.flatnonzero(np.bincount(self._columns["department"], minlength=len(department_names)))
+        self.departments = sorted(department_names[code] for code in present)
+        self._department_index = np.full(len(department_names), -1, dtype=np.int16)
+        for code in present:
+            self._department_index[code] = self.departments.index(department_names[code])
+        self.teams = [int(team) for team in np.unique(self._columns["team"])]
+
+        self._by_team = None
+        self._by_department = None
+        self._aggregates = {}
+
+    @staticmethod
+    def _index(codes):
+        order = np.argsort(codes, kind='stable')
+        values, starts = np.unique(codes[order], return_index=True)
+        return {int(value): positions for value, positions in zip(values, np.split(order, starts[1:]))}
+
+    def _department_codes(self, rows):
+        return self._department_index[self._columns["department"][rows]]
+
+    def __len__(self):
+        return len(self.date)
+
+    def columns(self):
+        """The records in date order as history columns, text columns decoded"""
+        rows = self.order
+        return {
+            "date": self.date,
+            "department": np.array(self.departments, dtype=object)[self._department_codes(rows)],
+            "team": self._columns["team"][rows],
+            "incentive_band": np.array(BAND_NAMES, dtype=object)[self._columns["incentive_band"][rows]],
+            "targeted_productivity": self._columns["targeted_productivity"][rows],
+            "actual_productivity": self._columns["actual_productivity"][rows],
+            "source": self._columns["source"][rows],
+        }
+
+    def select(self, team=None, department=None, start=None, end=None, source=None):
+        """Positions of the records matching every given filter, in date order"""
+        lo = 0 if start is None else int(np.searchsorted(self.date, start, side='left'))
+        hi = len(self.date) if end is None else int(np.searchsorted(self.date, end, side='right'))
+
+        candidates = []
+        if team is not None:
+            if self._by_team is None:
+                self._by_team = self._index(self._columns["team"][self.order])
+            candidates.append(self._by_team.get(team, np.array([], dtype=np.int64)))
+        if department is not None:
+            if self._by_department is None:
+                self._by_department = self._index(self._department_codes(self.order))
+            code = self.departments.index(department) if department in self.departments else -1
+            candidates.append(self._by_department.get(code, np.array([], dtype=np.int64)))
+
+        if candidates:
+            # Index positions are in date order, so the date range is a slice
+            candidates.sort(key=len)
+            positions = candidates[0]
+            positions = positions[np.searchsorted(positions, lo):np.searchsorted(positions, hi)]
+            for other in candidates[1:]:
+                positions = positions[np.isin(positions, other, assume_unique=True)]
+        else:
+            positions = np.arange(lo, hi)
+        if source is not None:
+            positions = positions[self._columns["source"][self.order[positions]] == SOURCES.index(source)]
+        return positions
+
+    def records(self, positions):
+        """The records at positions, as JSON-ready dicts"""
+        columns = self._columns
+        return [
+            {
+                "date": str(columns["date"][i]),
+                "department": self.departments[self._department_index[columns["department"][i]]],
+                "team": f"Team {int(columns['team'][i])}",
+                "incentive_band": BAND_NAMES[columns["incentive_band"][i]],
+                "targeted_productivity": float(columns["targeted_productivity"][i]),
+                "actual_productivity": float(columns["actual_productivity"][i]),
+                "source": SOURCES[columns["source"][i]],
+            }
+            for i in self.order[positions]
+        ]
+
+    def summary(self, positions):
+        """Count, mean, percentiles and range of actual_productivity at positions"""
+        return _summary(self._columns["actual_productivity"][self.order[positions]])
+
+    def _group_keys(self, by):
+        columns = self._columns
+        if by == "team":
+            return columns["team"], lambda key: f"Team {key}"
+        if by == "department":
+            return self._department_codes(slice(None)), lambda key: self.departments[key]
+        if by == "incentive_band":
+            return columns["incentive_band"], lambda key: BAND_NAMES[key]
+        # Weeks start on Monday, 1970-01-01 was a Thursday
+        days = columns["date"].astype(np.int64)
+        return days - (days + 3) % 7, lambda key: str(np.datetime64(int(key), 'D'))
+
+    def aggregate(self, by, source=None):
+        """Summary of actual_productivity per group of a GROUPINGS column"""
+        cache_key = (by, source)
+        result = self._aggregates.get(cache_key)
+        if result is not None:
+            return result
+
+        keys, label = self._group_keys(by)
+        values, targets = self._columns["actual_productivity"], self._columns["targeted_productivity"]
+        if source is not None:
+            mask = self._columns["source"] == SOURCES.index(source)
+            keys, values, targets = keys[mask], values[mask], targets[mask]
+        # Sorted by group, so each group is one contiguous slice
+        order = np.argsort(keys, kind='stable')
+        keys, values, targets = keys[order], values[order], targets[order]
+        groups, starts = np.unique(keys, return_index=True)
+        stops = list(starts[1:]) + [len(keys)]
+        result = [
+            dict(key=label(group), **_summary(values[start:stop]), targeted_mean=float(targets[start:stop].mean()))
+            for group, start, stop in zip(groups, starts, stops)
+        ]
+        self._aggregates[cache_key] = result
+        return result
+
+class HistoryStore:
+    """
+    The productivity dataset plus the predictions of completed batch jobs,
+    as 'predicted' records. data is the current HistoryData, replaced as a
+    whole when records are added or removed.
+
+    Records are held encoded in column buffers with spare room at the end.
+    A job's records are written into that room, doubling the buffers when
+    it runs out, and merged into the date order of the previous version,
+    so adding a job does not copy or re-sort the records already held.
+    Removing a job copies the remaining records to new buffers, versions
+    still in use keep the old ones.
+    """
+
+    def __init__(self, columns, dataset_digest="", refresh_interval=10.0):
+        self._lock = threading.Lock()
+        self._dataset_digest = dataset_digest
+        # Batch job key -> job code of its records
+        self._jobs = {}
+        self._job_codes = iter(range(np.iinfo(np.int32).max))
+        self._department_names = []
+        self._department_codes = {}
+        self._buffers = {name: np.empty(0, dtype=dtype) for name, dtype in STORE_COLUMNS.items()}
+        self._size = 0
+        self._refreshed = None
+        self.refresh_interval = refresh_interval
+        self._write(columns, SOURCES.index("observed"), -1)
+        self.data = HistoryData(self._buffers, self._size, self._department_names, self._version())
+
+    @classmethod
+    def from_dataset(cls, path=DATASET_PATH, refresh_interval=10.0):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        return cls(load_dataset(path), digest, refresh_interval)
+
+    def _version(self):
+        """Same data, same version, in every server process"""
+        return hashlib.sha256((self._dataset_digest + "".join(sorted(self._jobs))).encode()).hexdigest()[:16]
+
+    def _codes(self, names, codes, table):
+        """Codes of the names in table, new names added to codes and table"""
+        uniques, inverse = np.unique(np.asarray(names).astype(str), return_inverse=True)
+        for name in uniques:
+            if name not in codes:
+                codes[name] = len(table)
+                table.append(name)
+        return np.array([codes[name] for name in uniques], dtype=np.int64)[inverse.ravel()]
+
+    def _write(self, columns, source, job):
+        """Write records after the last one, caller holds the lock. Returns the first new row"""
+        n = len(columns["date"])
+        first = self._size
+        if first + n > len(self._buffers["date"]):
+            capacity = max(2 * len(self._buffers["date"]), first + n)
+            for name, values in self._buffers.items():
+                grown = np.empty(capacity, dtype=values.dtype)
+                grown[:first] = values[:first]
+                self._buffers[name] = grown
+        rows = slice(first, first + n)
+        buffers = self._buffers
+        buffers["date"][rows] = columns["date"]
+        buffers["department"][rows] = self._codes(columns["department"], self._department_codes,
+                                                  self._department_names)
+        buffers["team"][rows] = columns["team"]
+        buffers["incentive_band"][rows] = [BAND_NAMES.index(band) for band in columns["incentive_band"]]
+        buffers["targeted_productivity"][rows] = columns["targeted_productivity"]
+        buffers["actual_productivity"][rows] = columns["actual_productivity"]
+        buffers["source"][rows] = source
+        buffers["job"][rows] = job
+        self._size = first + n
+        return first
+
+    def append(self, columns, key):
+        """Add the records of a batch job, once per key. Returns whether they were added"""
+        with self._lock:
+            if key in self._jobs:
+                return False
+            self._jobs[key] = next(self._job_codes)
+            first = self._write(columns, SOURCES.index("predicted"), self._jobs[key])
+
+            # Merge the new rows into the date order, after older rows of the same date
+            previous = self.data
+            dates = self._buffers["date"][first:self._size]
+            order = np.argsort(dates, kind='stable')
+            positions = np.searchsorted(previous.date, dates[order], side='right')
+            self.data = HistoryData(self._buffers, self._size, self._department_names, self._version(),
+                                    np.insert(previous.order, positions, first + order),
+                                    np.insert(previous.date, positions, dates[order]))
+            return True
+
+    def remove(self, keys):
+        """Drop the records of batch jobs, returns how many jobs were removed"""
+        with self._lock:
+            codes = [self._jobs.pop(key) for key in keys if key in self._jobs]
+            if not codes:
+                return 0
+            keep = ~np.isin(self._buffers["job"][:self._size], codes)
+            self._buffers = {name: values[:self._size][keep] for name, values in self._buffers.items()}
+            self._size = int(np.count_nonzero(keep))
+            self.data = HistoryData(self._buffers, self._size, self._department_names, self._version())
+            return len(codes)
+
+    def refresh(self, job_store, force=False):
+        """
+        Add the history of batch jobs completed since the last refresh, by
+        this or any other server process, and drop the records of jobs no
+        longer completed, such as expired ones. Checked at most every
+        refresh_interval seconds unless forced. Returns the jobs added.
+        """
+        now = time.monotonic()
+        if not force and self._refreshed is not None and now - self._refreshed < self.refresh_interval:
+            return 0
+        self._refreshed = now
+        completed = dict(job_store.completed_results())
+        self.remove([key for key in list(self._jobs) if key not in completed])
+        added = 0
+        for job_id, results_path in completed.items():
+            path = results_path + HISTORY_SUFFIX
+            if job_id in self._jobs or not os.path.exists(path):
+                continue
+            try:
+                columns = load_batch_history(path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not read the history of batch {job_id}: {e}")
+                continue
+            added += self.append(columns, job_id)
+        return added
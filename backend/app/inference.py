@@ -0,0 +1,265 @@
+import json
+
+import numpy as np
+
+# Batches this large are faster through the library's own predict
+LARGE_BATCH_ROWS = 2000
+
+class CompiledForest:
+    """
+    Tree ensemble flattened into contiguous arrays.
+
+    All trees share one node table. Leaves point to themselves, so every row
+    can be pushed through every tree for max_depth steps with plain array
+    indexing and no per-tree Python loop.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth,
+                 n_features, average=True, strict=False, default_left=None, base_score=0.0, node_value=None):
+        self.feature = feature
+        self.threshold = threshold
+        # Interleaved (left, right) pairs, so one gather takes a step down every tree
+        self.children = children
+        self.value = value
+        # Expected output of every node, leaves included, used by explain.
+        # sklearn stores it in value, XGBoost only has leaf weights there.
+        self.node_value = value if node_value is None else node_value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.n_features = int(n_features)
+        # sklearn forests average the trees, boosters add them to base_score
+        self.average = average
+        # sklearn goes left on x <= threshold, XGBoost on x < threshold
+        self.strict = strict
+        # XGBoost routes missing values per node, sklearn sends them right
+        self.default_left = default_left
+        self.base_score = base_score
+        # Optional source model used for large batches, see predict
+        self.estimator = None
+        self.estimator_min_rows = LARGE_BATCH_ROWS
+        # Per node contributions of the path from its root, built by explain
+        self._path_contributions = None
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Compile a fitted RandomForestRegressor, ExtraTreesRegressor or DecisionTreeRegressor"""
+        trees = [estimator.tree_ for estimator in getattr(model, "estimators_", [model])]
+        arrays = [(tree.feature, tree.threshold, tree.children_left, tree.children_right,
+                   tree.value[:, 0, 0]) for tree in trees]
+        return cls._build(arrays, max(tree.max_depth for tree in trees), model.n_features_in_,
+                          average=hasattr(model, "estimators_"))
+
+    @classmethod
+    def from_xgboost(cls, booster):
+        """Compile a gbtree XGBoost regression booster (or XGBRegressor)"""
+        if hasattr(booster, "get_booster"):
+            booster = booster.get_booster()
+        config = json.loads(booster.save_raw("json"))["learner"]
+        if config["gradient_booster"]["name"] != "gbtree":
+            raise TypeError("Only gbtree boosters can be compiled")
+        if not config["objective"]["name"].startswith("reg:"):
+            raise TypeError(f"Unsupported objective {config['objective']['name']}")
+
+        arrays = []
+        defaults = []
+        node_values = []
+        max_depth = 0
+        for tree in config["gradient_booster"]["model"]["trees"]:
+            left = np.asarray(tree["left_children"], dtype=np.int64)
+            right = np.asarray(tree["right_children"], dtype=np.int64)
+            # Leaves store their weight in split_conditions
+            conditions = np.asarray(tree["split_conditions"], dtype=np.float32).astype(np.float64)
+            arrays.append((np.asarray(tree["split_indices"], dtype=np.int64), conditions,
+                           left, right, conditions))
+            defaults.append(np.asarray(tree["default_left"], dtype=bool))
+            node_values.append(_node_means(left, right, conditions, np.asarray(tree["sum_hessian"], dtype=np.float64)))
+            max_depth = max(max_depth, _tree_depth(left, right))
+
+        params = config["learner_model_param"]
+        base_score = float(params["base_score"].strip("[]"))
+        return cls._build(arrays, max_depth, int(params["num_feature"]), average=False,
+                          strict=True, default_left=np.concatenate(defaults), base_score=base_score,
+                          node_value=np.concatenate(node_values))
+
+    @classmethod
+    def _build(cls, arrays, max_depth, n_features, **kwargs):
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for feature, threshold, left, right, value in arrays:
+            n_nodes = len(left)
+            index = np.arange(n_nodes) + offset
+            leaf = left < 0
+            features.append(np.where(leaf, 0, feature))
+            thresholds.append(threshold)
+            lefts.append(np.where(leaf, index, left + offset))
+            rights.append(np.where(leaf, index, right + offset))
+            values.append(value)
+            roots.append(offset)
+            offset += n_nodes
+        return cls(
+            np.concatenate(features).astype(np.int32),
+            np.concatenate(thresholds).astype(np.float64),
+            np.stack([np.concatenate(lefts), np.concatenate(rights)], axis=1).ravel().astype(np.int32),
+            np.concatenate(values).astype(np.float64),
+            np.asarray(roots, dtype=np.int32),
+            max_depth,
+            n_features,
+            **kwargs,
+        )
+
+    def apply(self, X, block_size=256):
+        """Return the leaf index reached in every tree, shape (n_rows, n_trees)"""
+        # Trees were fit on float32 inputs, compare in the same precision
+        X = np.ascontiguousarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        leaves = np.empty((X.shape[0], len(self.roots)), dtype=self.children.dtype)
+        # Work on blocks of rows so the (rows, trees) state stays in cache
+        for start in range(0, X.shape[0], block_size):
+            block = X[start:start + block_size]
+            flat = block.ravel()
+            row_offsets = (np.arange(block.shape[0], dtype=self.children.dtype) * self.n_features)[:, None]
+            nodes = np.repeat(self.roots[None, :], block.shape[0], axis=0)
+            # np.take is markedly faster than fancy indexing for these gathers
+            for _ in range(self.max_depth):
+                x = np.take(flat, row_offsets + np.take(self.feature, nodes))
+                threshold = np.take(self.threshold, nodes)
+                go_right = ~(x < threshold if self.strict else x <= threshold)
+                if self.default_left is not None:
+                    go_right = np.where(np.isnan(x), ~np.take(self.default_left, nodes), go_right)
+                nodes = np.take(self.children, (nodes << 1) | go_right)
+            leaves[start:start + block_size] = nodes
+        return leaves
+
+    def path_contributions(self):
+        """
+        Saabas contributions of every node: for each feature, the change in
+        expected output along the splits on that feature from the root of
+        its tree. Shape (n_nodes, n_features), built once per model.
+        """
+        if self._path_contributions is None:
+            n_nodes = len(self.feature)
+            contributions = np.zeros((n_nodes, self.n_features))
+            pairs = self.children.reshape(-1, 2)
+            level = self.roots.astype(np.int64)
+            while len(level):
+                # Leaves point to themselves, they end the walk
+                level = level[pairs[level, 0] != level]
+                for side in (0, 1):
+                    child = pairs[level, side]
+                    contributions[child] = contributions[level]
+                    contributions[child, self.feature[level]] += self.node_value[child] - self.node_value[level]
+                level = pairs[level].ravel()
+            self._path_contributions = contributions
+        return self._path_contributions
+
+    def explain(self, X, block_size=256):
+        """
+        Per-feature contributions of every row, from the paths the row takes
+        through the trees. Returns (bias, contributions) where bias is the
+        expected output and contributions has shape (n_rows, n_features).
+        bias plus a row of contributions is the row's prediction.
+        """
+        if self.node_value is None:
+            raise ValueError("This model export has no node values, export it again to explain predictions")
+        from scipy import sparse
+
+        X = np.asarray(X)
+        paths = self.path_contributions()
+        if self.estimator is not None and X.reshape(-1, self.n_features).shape[0] >= self.estimator_min_rows:
+            # Same leaves as apply, numbered within each tree
+            leaves = np.asarray(self.estimator.apply(X)).astype(np.int64).reshape(len(X), -1) + self.roots
+        else:
+            leaves = self.apply(X, block_size)
+        n_rows, n_trees = leaves.shape
+        # One row per input row with a one at each of its leaves, summing the
+        # leaves' path contributions is then a single sparse product
+        reached = sparse.csr_matrix((np.ones(leaves.size), leaves.ravel(), np.arange(0, leaves.size + 1, n_trees)),
+                                    shape=(n_rows, len(paths)))
+        contributions = reached @ paths
+        root_values = self.node_value[self.roots]
+        if self.average:
+            return float(root_values.mean()), contributions / len(self.roots)
+        return float(self.base_score + root_values.sum()), contributions
+
+    def predict(self, X):
+        X = np.asarray(X)
+        # The library's compiled loop wins on large batches, hand those back to it
+        if self.estimator is not None and X.shape[0] >= self.estimator_min_rows:
+            return self.estimator.predict(X)
+        return self.predict_compiled(X)
+
+    def predict_compiled(self, X):
+        values = np.take(self.value, self.apply(X))
+        if self.average:
+            # Add trees in order like sklearn does, so results match it bit for bit
+            return np.cumsum(values, axis=1)[:, -1] / values.shape[1]
+        # XGBoost accumulates leaf weights onto base_score in float32
+        margin = np.column_stack([np.full(len(values), self.base_score), values])
+        return np.cumsum(margin, axis=1, dtype=np.float32)[:, -1]
+
+class CompiledLinear:
+    """Linear model reduced to its coefficients"""
+
+    def __init__(self, coef, intercept):
+        self.coef = coef
+        self.intercept = intercept
+        self.n_features = len(coef)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        return cls(np.asarray(model.coef_, dtype=np.float64).ravel(), float(model.intercept_))
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        return X @ self.coef + self.intercept
+
+    def explain(self, X):
+        """Per-feature terms of the prediction, (intercept, coef * x)"""
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features)
+        return self.intercept, X * self.coef
+
+def _node_means(left, right, leaf_values, hessians):
+    """Expected output of every node of a booster tree, its leaves weighted by their hessian sums"""
+    means = leaf_values.copy()
+    # Children come after their parents, fill the tree in from the bottom
+    for node in range(len(left) - 1, -1, -1):
+        if left[node] >= 0:
+            l, r = left[node], right[node]
+            total = hessians[l] + hessians[r]
+            means[node] = (hessians[l] * means[l] + hessians[r] * means[r]) / total if total else 0.0
+    return means
+
+def _tree_depth(left, right):
+    """Depth of a tree given its child arrays, leaves marked with -1"""
+    depth = 0
+    level = np.array([0])
+    while True:
+        level = level[left[level] >= 0]
+        if not len(level):
+            return depth
+        level = np.concatenate([left[level], right[level]])
+        depth += 1
+
+def compile_model(model):
+    """
+    Return a fast predictor for a fitted model.
+
+    Tree ensembles and linear models are compiled to NumPy arrays. Compiled
+    forests keep the source model for batches of LARGE_BATCH_ROWS or more.
+    Anything else, or a model that cannot be compiled, is returned unchanged
+    so its own predict method is used.
+    """
+    try:
+        module = type(model).__module__
+        if module.startswith("xgboost"):
+            compiled = CompiledForest.from_xgboost(model)
+            compiled.estimator = model
+            return compiled
+        if hasattr(model, "estimators_") or hasattr(model, "tree_"):
+            compiled = CompiledForest.from_sklearn(model)
+            compiled.estimator = model
+            return compiled
+        if hasattr(model, "coef_") and hasattr(model, "intercept_"):
+            return CompiledLinear.from_sklearn(model)
+    except Exception as e:
+        print(f"Could not compile {type(model).__name__}, using its own predict: {e}")
+    return model
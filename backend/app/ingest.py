@@ -0,0 +1,127 @@
+import hashlib
+import os
+import tempfile
+
+from flask import Request, current_app
+
+# Endpoints that accept uploads above MAX_CONTENT_LENGTH
+LARGE_UPLOAD_ENDPOINTS = ('api.create_batch',)
+
+# Text columns are always read as strings, so every chunk of a file gets the
+# same types. Numeric columns are left to the parser, validation coerces them
+# and reports values that are not numbers.
+BATCH_DTYPES = {
+    'date': str,
+    'department': str,
+    'team': str,
+    'incentive_level': str,
+}
+
+# Bytes copied per read when saving an upload that was not spooled
+COPY_BUFFER_SIZE = 1024 * 1024
+
+class UploadSpool:
+    """
+    Upload body written to a file in UPLOAD_FOLDER as it arrives, hashing it
+    and counting its lines on the way. save_upload renames the file into
+    place, so a large upload is written to disk only once. The file is
+    deleted on close unless it was saved.
+    """
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix='.part')
+        self.file = os.fdopen(fd, 'w+b')
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.lines = 0
+        self.last = b"\n"
+
+    def write(self, block):
+        self.digest.update(block)
+        self.size += len(block)
+        self.lines += block.count(b"\n")
+        if block:
+            self.last = block[-1:]
+        return self.file.write(block)
+
+    def __getattr__(self, name):
+        # read, seek, tell and the rest of the file interface
+        return getattr(self.file, name)
+
+    def save(self, path):
+        """Move the spooled upload to path, returns (bytes, data rows, SHA-256 hex digest)"""
+        self.file.close()
+        os.replace(self.path, path)
+        return self.size, _data_rows(self.lines, self.last), self.digest.hexdigest()
+
+    def close(self):
+        self.file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            # Saved under its final name
+            pass
+
+class UploadRequest(Request):
+    """
+    Request with a larger body limit for batch uploads.
+
+    Uploaded files are spooled to UPLOAD_FOLDER as they arrive, so a large
+    upload never sits in memory.
+    """
+
+    @property
+    def max_content_length(self):
+        if current_app and self.endpoint in LARGE_UPLOAD_ENDPOINTS:
+            return current_app.config['BATCH_MAX_UPLOAD_BYTES']
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if current_app and self.endpoint in LARGE_UPLOAD_ENDPOINTS:
+            return UploadSpool(current_app.config['UPLOAD_FOLDER'])
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+def _data_rows(lines, last):
+    """Data rows of a CSV with this many line breaks and last byte, not counting the header"""
+    if last != b"\n":
+        # Last line without a line break
+        lines += 1
+    return max(lines - 1, 0)
+
+def save_upload(file, path):
+    """
+    Save an uploaded file to path.
+
+    Returns (bytes written, data rows, SHA-256 hex digest). The row count is
+    taken from the line breaks in the file, not counting the header. A
+    spooled upload is moved into place, anything else is copied in
+    fixed-size blocks.
+    """
+    if isinstance(file.stream, UploadSpool):
+        return file.stream.save(path)
+    digest = hashlib.sha256()
+    size = 0
+    lines = 0
+    last = b"\n"
+    with open(path, 'wb') as out:
+        while True:
+            block = file.stream.read(COPY_BUFFER_SIZE)
+            if not block:
+                break
+            out.write(block)
+            digest.update(block)
+            size += len(block)
+            lines += block.count(b"\n")
+            last = block[-1:]
+    return size, _data_rows(lines, last), digest.hexdigest()
+
+def read_batch_chunks(path, chunk_size):
+    """
+    Iterate over a batch CSV in DataFrames of at most chunk_size rows.
+
+    Only empty fields count as missing. The pandas defaults would also turn
+    the incentive level "None" into a missing value.
+    """
+    import pandas as pd
+    return pd.read_csv(path, chunksize=chunk_size, dtype=BATCH_DTYPES,
+                       keep_default_na=False, na_values=[""])
@@ -0,0 +1,173 @@
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the scheduler queue is full"""
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled"""
+
+def _init_worker(nice):
+    # Batch work runs at a lower CPU priority than the request handlers
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+
+class JobScheduler:
+    """
+    Runs jobs on a bounded pool of worker processes.
+
+    At most `workers` jobs run at once. Up to `max_queued` more wait in a
+    priority queue, higher priority first and in submission order within a
+    priority. Jobs are handed to the pool only when a worker is free, so the
+    queue order is kept and queued jobs can still be cancelled.
+
+    Running jobs are not interrupted by the scheduler. They are expected to
+    check for cancellation themselves, through the job store, and raise
+    JobCancelled.
+    """
+
+    def __init__(self, workers=1, max_queued=20, nice=10, on_start=None, on_done=None):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.nice = nice
+        # on_start(job_id) and on_done(job_id, result, error) report progress to the caller
+        self.on_start = on_start
+        self.on_done = on_done
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self._queue = []
+        self._queued = {}
+        self._running = {}
+        self._counter = itertools.count()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Caller holds the lock. Created on first use, so a forking server does not copy it
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.nice,),
+            )
+        return self._executor
+
+    def submit(self, job_id, fn, *args, priority=0):
+        """
+        Queue fn(*args) to run in a worker process.
+
+        Raises QueueFull when max_queued jobs are already waiting.
+        """
+        with self._lock:
+            if len(self._queued) >= self.max_queued:
+                self.rejected += 1
+                raise QueueFull(f"Batch queue is full ({self.max_queued} jobs waiting)")
+            entry = [-priority, next(self._counter), job_id, fn, args]
+            heapq.heappush(self._queue, entry)
+            self._queued[job_id] = entry
+            self.submitted += 1
+            started = self._dispatch()
+        self._notify_started(started)
+
+    def _dispatch(self):
+        """Move queued jobs to the pool while workers are free, caller holds the lock"""
+        started = []
+        while self._queue and len(self._running) < self.workers:
+            entry = heapq.heappop(self._queue)
+            job_id, fn, args = entry[2], entry[3], entry[4]
+            if job_id is None:
+                # Cancelled while queued
+                continue
+            del self._queued[job_id]
+            future = self._get_executor().submit(fn, *args)
+            self._running[job_id] = future
+            started.append((job_id, future))
+        return started
+
+    def _notify_started(self, started):
+        """Report started jobs and watch for their completion, called without the lock"""
+        for job_id, future in started:
+            if self.on_start is not None:
+                self.on_start(job_id)
+            future.add_done_callback(lambda future, job_id=job_id: self._finished(job_id, future))
+
+    def _finished(self, job_id, future):
+        error = future.exception()
+        with self._lock:
+            del self._running[job_id]
+            if isinstance(error, BrokenProcessPool):
+                # A worker died, later jobs get a fresh pool
+                self._executor = None
+            if isinstance(error, JobCancelled):
+                self.cancelled += 1
+            elif error is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+            started = self._dispatch()
+
+        if self.on_done is not None:
+            self.on_done(job_id, None if error is not None else future.result(), error)
+        self._notify_started(started)
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job. Returns 'queued' if it was removed from the
+        queue, and on_done has been called with a JobCancelled error like
+        for a job that stopped itself. Returns 'running' if it is already
+        running, so the caller has to signal it, or None if it is unknown
+        to this scheduler.
+        """
+        with self._lock:
+            entry = self._queued.pop(job_id, None)
+            if entry is not None:
+                # Leave the heap entry in place, _dispatch skips it
+                entry[2] = None
+                self.cancelled += 1
+            elif job_id in self._running:
+                return "running"
+            else:
+                return None
+        if self.on_done is not None:
+            self.on_done(job_id, None, JobCancelled())
+        return "queued"
+
+    def position(self, job_id):
+        """1-based position of a queued job in run order, or None"""
+        with self._lock:
+            entry = self._queued.get(job_id)
+            if entry is None:
+                return None
+            return 1 + sum(1 for other in self._queued.values() if other[:2] < entry[:2])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": len(self._running),
+                "queued": len(self._queued),
+                "max_queued": self.max_queued,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            for entry in self._queued.values():
+                entry[2] = None
+            self._queued.clear()
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
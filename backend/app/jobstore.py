@@ -0,0 +1,352 @@
+import itertools
+import os
+import sqlite3
+import threading
+
+# Job fields kept by every store
+JOB_FIELDS = (
+    "status", "priority", "file_path", "results_path", "output_format", "error",
+    "rows_total", "rows_done", "valid_rows", "created_at", "started_at",
+    "finished_at", "cancel_requested", "owner_pid", "content_hash",
+    "model_name", "model_version", "reused_from", "explanations", "peak_memory_bytes",
+)
+
+# Statuses of jobs that have not reached a final state
+ACTIVE_STATUSES = ("queued", "processing")
+
+# Statuses of jobs whose result a duplicate upload can share
+REUSABLE_STATUSES = ("queued", "processing", "completed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    file_path TEXT,
+    results_path TEXT,
+    output_format TEXT,
+    error TEXT,
+    rows_total INTEGER,
+    rows_done INTEGER,
+    valid_rows INTEGER,
+    created_at TEXT,
+    started_at TEXT,
+    finished_at TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    owner_pid INTEGER,
+    content_hash TEXT,
+    model_name TEXT,
+    model_version TEXT,
+    reused_from TEXT,
+    explanations INTEGER NOT NULL DEFAULT 0,
+    peak_memory_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, seq);
+"""
+
+# Created once the columns it covers exist, see SQLiteJobStore.__init__
+CONTENT_INDEX = "CREATE INDEX IF NOT EXISTS jobs_content ON jobs (content_hash, model_version, output_format)"
+
+# Columns added after the first release of the schema: name -> definition
+ADDED_COLUMNS = {
+    "output_format": "TEXT",
+    "content_hash": "TEXT",
+    "model_name": "TEXT",
+    "model_version": "TEXT",
+    "reused_from": "TEXT",
+    "explanations": "INTEGER NOT NULL DEFAULT 0",
+    "peak_memory_bytes": "INTEGER",
+}
+
+def _check_fields(fields):
+    unknown = set(fields) - set(JOB_FIELDS)
+    if unknown:
+        raise KeyError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+
+def pid_alive(pid):
+    """True if a process with this id is running on this host"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+def orphaned(job):
+    """True for an unfinished job whose owning process has exited"""
+    return job["status"] in ACTIVE_STATUSES and not pid_alive(job["owner_pid"])
+
+class MemoryJobStore:
+    """
+    Job store in a dict, for tests and single-process deployments.
+
+    Worker processes cannot see it, so running jobs only learn about a
+    cancellation when they finish.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def create(self, job_id, **fields):
+        _check_fields(fields)
+        job = dict.fromkeys(JOB_FIELDS)
+        job.update(priority=0, cancel_requested=0, explanations=0)
+        job.update(fields)
+        with self._lock:
+            job["seq"] = next(self._seq)
+            self._jobs[job_id] = job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job, id=job_id) if job is not None else None
+
+    def update(self, job_id, **fields):
+        _check_fields(fields)
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def cancel_requested(self, job_id):
+        job = self.get(job_id)
+        return bool(job and job["cancel_requested"])
+
+    def queue_position(self, job_id):
+        """1-based position of a queued job among all queued jobs, or None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                return None
+            key = (-job["priority"], job["seq"])
+            return 1 + sum(1 for other in self._jobs.values()
+                           if other["status"] == "queued" and (-other["priority"], other["seq"]) < key)
+
+    def counts(self):
+        """Number of jobs in each status"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+    def find_duplicate(self, content_hash, model_version, output_format, explanations=0):
+        """
+        Latest queued, running or completed job for the same upload, model,
+        format and explanations. Unfinished jobs whose owner has exited are
+        skipped, they will never complete.
+        """
+        with self._lock:
+            matches = [
+                (job["seq"], job_id) for job_id, job in self._jobs.items()
+                if job["status"] in REUSABLE_STATUSES and job["content_hash"] == content_hash
+                and job["model_version"] == model_version and job["output_format"] == output_format
+                and job["explanations"] == explanations and not orphaned(job)
+            ]
+        return self.get(max(matches)[1]) if matches else None
+
+    def expire_results(self, paths):
+        """Mark completed jobs whose result file was deleted as expired"""
+        paths = set(paths)
+        with self._lock:
+            for job in self._jobs.values():
+                if job["status"] == "completed" and job["results_path"] in paths:
+                    job["status"] = "expired"
+
+    def active_paths(self):
+        """Upload and result paths still needed by unfinished jobs"""
+        with self._lock:
+            return {path for job in self._jobs.values() if job["status"] in ACTIVE_STATUSES
+                    for path in (job["file_path"], job["results_path"]) if path}
+
+    def completed_results(self):
+        """
+        (id, results_path) of completed jobs that produced their own result,
+        the first one of each upload content and model version
+        """
+        with self._lock:
+            results, seen = [], set()
+            for job_id, job in self._jobs.items():
+                if job["status"] != "completed" or job["reused_from"] is not None or not job["results_path"]:
+                    continue
+                upload = (job["content_hash"], job["model_version"])
+                if job["content_hash"] is not None and upload in seen:
+                    continue
+                seen.add(upload)
+                results.append((job_id, job["results_path"]))
+            return results
+
+    def fail_orphans(self, error):
+        """Fail unfinished jobs whose owning process has exited, returns how many"""
+        with self._lock:
+            orphans = [job for job in self._jobs.values() if orphaned(job)]
+            for job in orphans:
+                job.update(status="failed", error=error)
+            return len(orphans)
+
+class SQLiteJobStore:
+    """
+    Job store in a SQLite database in WAL mode.
+
+    Every server and worker process opens its own connections, one per
+    thread, so status polls and updates work whichever process handles them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        # Bring databases created by older versions up to date
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, definition in ADDED_COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+        conn.execute(CONTENT_INDEX)
+
+    def _connect(self):
+        # Connections must not cross a fork or a thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, job_id, **fields):
+        _check_fields(fields)
+        columns = ["id", *fields]
+        self._connect().execute(
+            f"INSERT INTO jobs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [job_id, *fields.values()],
+        )
+
+    def get(self, job_id):
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def update(self, job_id, **fields):
+        _check_fields(fields)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._connect().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+
+    def delete(self, job_id):
+        self._connect().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def cancel_requested(self, job_id):
+        row = self._connect().execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def queue_position(self, job_id):
+        """1-based position of a queued job among all queued jobs, or None"""
+        row = self._connect().execute(
+            """
+            SELECT 1 + (SELECT COUNT(*) FROM jobs AS other
+                        WHERE other.status = 'queued'
+                        AND (other.priority > job.priority
+                             OR (other.priority = job.priority AND other.seq < job.seq)))
+            FROM jobs AS job WHERE job.id = ? AND job.status = 'queued'
+            """,
+            (job_id,),
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def counts(self):
+        """Number of jobs in each status"""
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def find_duplicate(self, content_hash, model_version, output_format, explanations=0):
+        """
+        Latest queued, running or completed job for the same upload, model,
+        format and explanations. Unfinished jobs whose owner has exited are
+        skipped, they will never complete.
+        """
+        rows = self._connect().execute(
+            f"""
+            SELECT * FROM jobs
+            WHERE content_hash = ? AND model_version = ? AND output_format = ? AND explanations = ?
+            AND status IN ({', '.join('?' * len(REUSABLE_STATUSES))})
+            ORDER BY seq DESC
+            """,
+            (content_hash, model_version, output_format, explanations, *REUSABLE_STATUSES),
+        )
+        return next((dict(row) for row in rows if not orphaned(row)), None)
+
+    def expire_results(self, paths):
+        """Mark completed jobs whose result file was deleted as expired"""
+        self._connect().executemany(
+            "UPDATE jobs SET status = 'expired' WHERE status = 'completed' AND results_path = ?",
+            [(path,) for path in paths],
+        )
+
+    def active_paths(self):
+        """Upload and result paths still needed by unfinished jobs"""
+        rows = self._connect().execute(
+            f"SELECT file_path, results_path FROM jobs WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))})",
+            ACTIVE_STATUSES,
+        ).fetchall()
+        return {path for row in rows for path in row if path}
+
+    def completed_results(self):
+        """
+        (id, results_path) of completed jobs that produced their own result,
+        the first one of each upload content and model version
+        """
+        rows = self._connect().execute(
+            "SELECT id, results_path FROM jobs WHERE status = 'completed' AND reused_from IS NULL "
+            "AND results_path IS NOT NULL AND NOT EXISTS ("
+            "SELECT 1 FROM jobs AS earlier WHERE earlier.status = 'completed' AND earlier.reused_from IS NULL "
+            "AND earlier.results_path IS NOT NULL AND earlier.content_hash = jobs.content_hash "
+            "AND earlier.model_version = jobs.model_version AND earlier.seq < jobs.seq) ORDER BY seq"
+        ).fetchall()
+        return [(job_id, results_path) for job_id, results_path in rows]
+
+    def fail_orphans(self, error):
+        """Fail unfinished jobs whose owning process has exited, returns how many"""
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT id, owner_pid FROM jobs WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))})",
+            ACTIVE_STATUSES,
+        ).fetchall()
+        orphans = [job_id for job_id, pid in rows if not pid_alive(pid)]
+        for job_id in orphans:
+            self.update(job_id, status="failed", error=error)
+        return len(orphans)
+
+# Stores opened in this process, by URL
+_stores = {}
+_stores_lock = threading.Lock()
+
+def open_job_store(url):
+    """
+    Return the job store for a URL, opened once per process.
+
+    'sqlite:///path/to/jobs.db' selects the SQLite store and 'memory://' the
+    in-process one. 'memory://name' is another in-process store per name.
+    """
+    with _stores_lock:
+        store = _stores.get(url)
+        if store is None:
+            if url.startswith("sqlite:///"):
+                store = SQLiteJobStore(url[len("sqlite:///"):])
+            elif url.startswith("memory://"):
+                store = MemoryJobStore()
+            else:
+                raise ValueError(f"Unsupported job store URL: {url}")
+            _stores[url] = store
+        return store
@@ -0,0 +1,346 @@
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Upper bounds of the throughput buckets, in rows per second
+THROUGHPUT_BUCKETS = (100, 1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+
+# How the values of a collector are combined across server processes:
+# 'sum' adds up every process, including exited ones, 'livesum' adds up the
+# running ones, 'min' takes the lowest of the running ones, and 'local'
+# reports this process only, for values read from state all processes share
+MULTIPROCESS_MODES = ('sum', 'livesum', 'min', 'local')
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def snapshot(self):
+        """Picklable copy of the counts"""
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, snapshot):
+        """Add the counts of another counter"""
+        with self._lock:
+            for key, value in snapshot.items():
+                self._values[tuple(key)] += value
+
+    def empty_copy(self):
+        return Counter(self.name, self.documentation, self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, None, value) for key, value in sorted(self._values.items())]
+
+class Histogram:
+    """
+    Observations counted into cumulative buckets per label set, as
+    Prometheus histograms are.
+
+    snapshot() and merge() move observations between processes, such as
+    from a batch worker back to the server.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _series(self, key):
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        return series
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series(key)
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        """Picklable copy of the observations"""
+        with self._lock:
+            return {key: list(series) for key, series in self._values.items()}
+
+    def merge(self, snapshot):
+        """Add the observations of another histogram with the same buckets"""
+        with self._lock:
+            for key, counts in snapshot.items():
+                series = self._series(tuple(key))
+                for i, count in enumerate(counts):
+                    series[i] += count
+
+    def empty_copy(self):
+        return Histogram(self.name, self.documentation, self.labelnames, self.buckets)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(series)) for key, series in self._values.items())
+        samples = []
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                samples.append((self.name + '_bucket', key, ('le', _format_value(float(bound))), cumulative))
+            samples.append((self.name + '_sum', key, None, series[-1]))
+            samples.append((self.name + '_count', key, None, cumulative))
+        return samples
+
+class Collector:
+    """Gauge or counter whose values are read from the app when the metrics are scraped"""
+
+    def __init__(self, name, documentation, labelnames, collect, kind='gauge', multiprocess_mode=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Returns (label values, value) pairs
+        self.collect = collect
+        self.kind = kind
+        self.multiprocess_mode = multiprocess_mode or ('sum' if kind == 'counter' else 'livesum')
+        if self.multiprocess_mode not in MULTIPROCESS_MODES:
+            raise ValueError(f"Unknown multiprocess mode {self.multiprocess_mode}")
+
+    def snapshot(self):
+        """The current values, keyed by label values"""
+        return {tuple(str(value) for value in key): value for key, value in self.collect()}
+
+    def samples(self):
+        return [(self.name, key, None, value) for key, value in sorted(self.snapshot().items())]
+
+def _metric_files(directory, exclude_pid=None):
+    """Metric files of every process in directory but exclude_pid"""
+    own = f"metrics-{exclude_pid}.json"
+    return [path for path in sorted(glob.glob(os.path.join(directory, "*.json")))
+            if os.path.basename(path) != own]
+
+def _read_metric_file(path):
+    """{metric name: {label values: value or series}} of one process file"""
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        # Removed, or replaced while being read
+        return {}
+    return {name: {tuple(key): value for key, value in values} for name, values in saved.items()}
+
+def mark_process_dead(pid, directory):
+    """
+    Keep the counts of an exited server process and drop its live values.
+    Called by the gunicorn master for every worker that exits.
+    """
+    path = os.path.join(directory, f"metrics-{pid}.json")
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return
+    kept = {name: values for name, values in saved.items() if not name.startswith("live:")}
+    # A new name, so a later process with the same pid does not replace it
+    with open(os.path.join(directory, f"exited-{pid}-{time.time_ns()}.json"), 'w') as f:
+        json.dump(kept, f)
+    os.remove(path)
+
+class MetricsRegistry:
+    """
+    The metrics of this process, rendered in the Prometheus text format.
+
+    With a multiprocess directory, such as PROMETHEUS_MULTIPROC_DIR under
+    gunicorn, every process saves its metrics to a file there at most every
+    flush_seconds, and render() adds up the files of the other processes.
+    Counts of exited processes are kept, see mark_process_dead.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self.directory = None
+        self.flush_seconds = 1.0
+        self._flushed = 0.0
+        self._flush_pending = False
+        self._flush_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, name, documentation, labelnames, collect, kind='gauge', multiprocess_mode=None):
+        return self.register(Collector(name, documentation, labelnames, collect, kind, multiprocess_mode))
+
+    def configure_multiprocess(self, directory, flush_seconds=1.0):
+        """Share the metrics of all server processes through files in directory"""
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+
+    def flush(self):
+        """Save the metrics of this process to its file in the multiprocess directory"""
+        if not self.directory:
+            return
+        saved = {}
+        for metric in self._metrics.values():
+            mode = getattr(metric, 'multiprocess_mode', 'sum')
+            if mode == 'local':
+                continue
+            # Values that only count while the process runs are dropped when it exits
+            name = metric.name if mode == 'sum' else f"live:{metric.name}"
+            saved[name] = [[list(key), value] for key, value in metric.snapshot().items()]
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        with self._write_lock:
+            with open(path + ".tmp", 'w') as f:
+                json.dump(saved, f)
+            os.replace(path + ".tmp", path)
+            self._flushed = time.monotonic()
+
+    def schedule_flush(self):
+        """
+        Flush on a timer thread within flush_seconds of the last flush, so
+        request threads never write and an idle process has saved its
+        latest metrics.
+        """
+        if not self.directory:
+            return
+        with self._flush_lock:
+            if self._flush_pending:
+                return
+            self._flush_pending = True
+        timer = threading.Timer(max(0.0, self._flushed + self.flush_seconds - time.monotonic()), self._timed_flush)
+        timer.daemon = True
+        timer.start()
+
+    def _timed_flush(self):
+        with self._flush_lock:
+            self._flush_pending = False
+        self.flush()
+
+    def _samples(self, metric, others):
+        """Samples of a metric, combined with the saved values of other processes"""
+        mode = getattr(metric, 'multiprocess_mode', 'sum')
+        if not others or mode == 'local':
+            return metric.samples()
+        name = metric.name if mode == 'sum' else f"live:{metric.name}"
+        if isinstance(metric, Collector):
+            values = defaultdict(list)
+            for saved in [metric.snapshot()] + [other.get(name, {}) for other in others]:
+                for key, value in saved.items():
+                    values[key].append(value)
+            combine = min if mode == 'min' else sum
+            return [(metric.name, key, None, combine(value)) for key, value in sorted(values.items())]
+        merged = metric.empty_copy()
+        merged.merge(metric.snapshot())
+        for other in others:
+            merged.merge(other.get(name, {}))
+        return merged.samples()
+
+    def render(self):
+        others = []
+        if self.directory:
+            others = [_read_metric_file(path) for path in _metric_files(self.directory, os.getpid())]
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in self._samples(metric, others):
+                lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+class StageTimer:
+    """
+    Wall time spent in each named stage of one request or job. A stage
+    entered several times, such as once per chunk, adds up.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def server_timing(self):
+        """Server-Timing header value, durations in milliseconds"""
+        return ", ".join(f"{name};dur={seconds * 1000.0:.3f}" for name, seconds in self.stages.items())
+
+class _NullTimer:
+    """Stand-in for a StageTimer when nothing is measured"""
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+NULL_TIMER = _NullTimer()
+
+# Metrics of the API process
+metrics = MetricsRegistry()
+
+REQUEST_SECONDS = metrics.histogram(
+    'api_request_duration_seconds', "Time to build the response of an API request",
+    ('endpoint', 'method', 'status'))
+STAGE_SECONDS = metrics.histogram(
+    'prediction_stage_duration_seconds', "Time spent per prediction stage, batch stages are per chunk",
+    ('endpoint', 'stage'))
+PREDICTED_ROWS = metrics.counter(
+    'predicted_rows_total', "Rows scored", ('endpoint', 'model'))
+BATCH_JOBS = metrics.counter(
+    'batch_jobs_finished_total', "Batch jobs that reached a final status", ('status',))
+BATCH_ROWS_PER_SECOND = metrics.histogram(
+    'batch_job_rows_per_second', "Throughput of completed batch jobs", (), THROUGHPUT_BUCKETS)
@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import numpy as np
+
+# Queued by close() to stop the worker thread
+_STOP = None
+
+class MicroBatcher:
+    """
+    Coalesces single-row predictions from concurrent requests.
+
+    The background thread takes the first waiting row together with every
+    row already queued behind it, up to max_rows, and scores them with one
+    predict call. Rows that arrive while a batch runs make up the next one,
+    so batches grow with load and a lone request never waits. A window_ms
+    above 0 additionally lingers that long for more rows once the queue is
+    empty. A caller that is not served within timeout_ms gets a TimeoutError.
+
+    After close() rows are scored in the calling thread, for requests still
+    holding a model that a hot reload has swapped out.
+    """
+
+    def __init__(self, predict, max_rows=64, window_ms=0.0, timeout_ms=1000.0):
+        self.predict_fn = predict
+        self.max_rows = max_rows
+        self.window = window_ms / 1000.0
+        self.timeout = timeout_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.requests = 0
+        self.batches = 0
+        self.timeouts = 0
+        self.max_batch_rows = 0
+        self._latencies = deque(maxlen=2048)
+        self._batch_sizes = deque(maxlen=2048)
+
+    def _submit(self, row, future):
+        """Queue a row for the worker thread, returns False once closed"""
+        with self._lock:
+            if self._closed:
+                return False
+            # Started on first use, so a forking server does not copy a live thread
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+            self._queue.put((row, future))
+            return True
+
+    def predict(self, row):
+        """Score one encoded feature row, blocking until its batch has run"""
+        future = Future()
+        submitted = time.perf_counter()
+        if not self._submit(row, future):
+            return float(self.predict_fn(np.array([row], dtype=np.float64))[0])
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # A cancelled future is skipped if its batch has not started yet
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Prediction not served within {self.timeout * 1000.0:.0f} ms") from None
+        with self._lock:
+            self.requests += 1
+            self._latencies.append(time.perf_counter() - submitted)
+        return result
+
+    def close(self):
+        """Stop the worker thread once the rows already queued are scored, for good"""
+        with self._lock:
+            self._closed = True
+            # Rows are queued under the lock, so none can follow the stop
+            if self._thread is not None:
+                self._queue.put(_STOP)
+
+    def _collect(self):
+        """
+        Block for the first row, then take the rows queued behind it until
+        the queue is empty, the window closes or the batch is full. Returns
+        the rows and whether close() was called.
+        """
+        items = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(items) < self.max_rows and items[-1] is not _STOP:
+            try:
+                items.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        stop = items[-1] is _STOP
+        return [(row, future) for row, future in items[:-1 if stop else None]
+                if future.set_running_or_notify_cancel()], stop
+
+    def _run(self):
+        while True:
+            items, stop = self._collect()
+            if not items:
+                if stop:
+                    return
+                continue
+            try:
+                predictions = self.predict_fn(np.array([row for row, _ in items], dtype=np.float64))
+                for (_, future), prediction in zip(items, predictions):
+                    future.set_result(float(prediction))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+            with self._lock:
+                self.batches += 1
+                self.max_batch_rows = max(self.max_batch_rows, len(items))
+                self._batch_sizes.append(len(items))
+            if stop:
+                return
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.0
+            sizes = np.array(self._batch_sizes)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "requests": self.requests,
+                "batches": self.batches,
+                "timeouts": self.timeouts,
+                "max_batch_rows": self.max_batch_rows,
+                "mean_batch_rows": float(sizes.mean()) if len(sizes) else 0.0,
+                "latency_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+                "latency_ms_p99": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+                "window_ms": self.window * 1000.0,
+                "max_rows": self.max_rows,
+                "timeout_ms": self.timeout * 1000.0,
+            }
@@ -0,0 +1,178 @@
+import cProfile
+import gc
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+# Output formats of request profiles: cProfile stats, or sampled stacks for
+# https://www.speedscope.app
+PROFILE_FORMATS = ('pstats', 'speedscope')
+
+class StackSampler:
+    """
+    Records the Python stack of one thread every interval seconds from a
+    background thread. Slower functions show up in more samples, and the
+    calls are not instrumented, so the profiled code runs at full speed.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.frames = {}
+        self.samples = []
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._started = self._last = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_name, code.co_filename, code.co_firstlineno)
+                stack.append(self.frames.setdefault(key, len(self.frames)))
+                frame = frame.f_back
+            if stack:
+                # Outermost call first
+                self.samples.append(stack[::-1])
+                self.weights.append(now - self._last)
+            self._last = now
+
+    def speedscope(self, name):
+        """The samples as a speedscope file"""
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": [{"name": function, "file": filename, "line": line}
+                                  for function, filename, line in self.frames]},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": self.samples,
+                "weights": self.weights,
+            }],
+            "name": name,
+            "activeProfileIndex": 0,
+            "exporter": "employee-performance-api",
+        }
+
+class RequestProfiler:
+    """
+    Profiles single requests on demand, or a sample_rate fraction of all
+    requests, and writes each profile to directory. Profiles are pstats
+    files from cProfile, or speedscope files from a StackSampler.
+    """
+
+    def __init__(self, directory, fmt='pstats', sample_rate=0.0, interval_ms=5.0):
+        if fmt not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format {fmt}, use one of: {', '.join(PROFILE_FORMATS)}")
+        self.directory = directory
+        self.format = fmt
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000.0
+        self.written = 0
+
+    def sampled(self):
+        """Whether to profile a request that did not ask for it"""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        """Start profiling the calling thread, returns the session, or None if another profile is running"""
+        if self.format == 'speedscope':
+            session = StackSampler(threading.get_ident(), self.interval)
+            session.start()
+            return session
+        session = cProfile.Profile()
+        try:
+            session.enable()
+        except ValueError:
+            return None
+        return session
+
+    def stop(self, session, name):
+        """Stop a session and write its profile, returns the file name"""
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.directory, exist_ok=True)
+        if isinstance(session, StackSampler):
+            session.stop()
+            filename += '.speedscope.json'
+            with open(os.path.join(self.directory, filename), 'w') as f:
+                json.dump(session.speedscope(name), f)
+        else:
+            session.disable()
+            filename += '.prof'
+            session.dump_stats(os.path.join(self.directory, filename))
+        self.written += 1
+        return filename
+
+    def discard(self, session):
+        """Stop a session without writing its profile"""
+        if isinstance(session, StackSampler):
+            session.stop()
+        else:
+            session.disable()
+
+@contextmanager
+def track_allocations(report_path=None, top=25):
+    """
+    Trace allocations with tracemalloc for the duration of the block. The
+    yielded dict gets the current and peak traced bytes at the end. With a
+    report_path, the top allocation sites are written there as text.
+    """
+    result = {}
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield result
+    finally:
+        result["current_bytes"], result["peak_bytes"] = tracemalloc.get_traced_memory()
+        if report_path is not None:
+            stats = tracemalloc.take_snapshot().statistics('lineno')[:top]
+            os.makedirs(os.path.dirname(report_path), exist_ok=True)
+            with open(report_path, 'w') as f:
+                f.write(f"Peak traced memory: {result['peak_bytes']} bytes\n")
+                f.writelines(f"{stat}\n" for stat in stats)
+        if started:
+            tracemalloc.stop()
+
+def memory_stats(top=20):
+    """
+    Object counts of this process, and traced memory when tracemalloc is on.
+    live_figures includes the figures of the chart render processes.
+    """
+    from app.charts import live_figures, render_worker_figures
+
+    objects = gc.get_objects()
+    types = Counter(type(obj).__name__ for obj in objects)
+    stats = {
+        "live_figures": live_figures(),
+        "render_worker_figures": render_worker_figures(),
+        "gc_objects": len(objects),
+        "gc_counts": gc.get_count(),
+        "top_types": dict(types.most_common(top)),
+    }
+    if tracemalloc.is_tracing():
+        stats["traced_current_bytes"], stats["traced_peak_bytes"] = tracemalloc.get_traced_memory()
+    return stats
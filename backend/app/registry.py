@@ -0,0 +1,208 @@
+import glob
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+
+from app.artifacts import MANIFEST, load_artifact
+from app.features import prepare_model_input
+
+# Model artifacts are pickles and exported folders named model_<name>, an
+# exported folder is used over a pickle of the same name
+ARTIFACT_PATTERNS = ('model_*.pkl', os.path.join('model_*', MANIFEST))
+
+# Scored once before a model is put in service, so a broken artifact is
+# caught before it answers requests
+WARMUP_RECORD = {
+    "date": date(2015, 1, 1),
+    "department": "Sewing",
+    "team": "Team 1",
+    "targeted_productivity": 0.8,
+    "smv_minutes": 26.16,
+    "over_time_hours": 7,
+    "incentive_level": "Standard",
+    "idle_time_minutes": 0.0,
+    "idle_men_count": 0,
+    "style_change_count": 0,
+    "worker_count": 59,
+}
+
+class UnknownModel(LookupError):
+    """No artifact with the requested model name or version"""
+
+class ModelUnavailable(RuntimeError):
+    """The model artifact exists but could not be loaded"""
+
+class LoadedModel:
+    """
+    One version of a model in service, with its own micro-batcher and
+    prediction cache.
+
+    Never changed after it is built: a hot swap replaces the whole object,
+    and requests holding the old one finish with it.
+    """
+
+    def __init__(self, name, path, version, model, load_seconds, batcher=None, cache=None):
+        self.name = name
+        self.path = path
+        self.version = version
+        self.model = model
+        self.load_seconds = load_seconds
+        self.loaded_at = datetime.now().isoformat()
+        self.batcher = batcher
+        self.cache = cache
+
+    def predict(self, X):
+        return self.model.predict(X)
+
+    def predict_one(self, row):
+        """Score one encoded feature row, through the micro-batcher when there is one"""
+        if self.batcher is not None:
+            return self.batcher.predict(row)
+        return self.model.predict(np.asarray([row], dtype=np.float64))[0]
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+class ModelRegistry:
+    """
+    The model artifacts in a folder, each loaded on first use.
+
+    get() returns the LoadedModel for a name, loading the artifact the first
+    time. reload() loads an artifact again, checks it with a warm-up
+    prediction and only then swaps it in. A model that fails to load stays
+    in an error state until the next reload.
+    """
+
+    def __init__(self, folder, default='rf', make_batcher=None, make_cache=None):
+        self.folder = folder
+        self.default = default
+        self.make_batcher = make_batcher
+        self.make_cache = make_cache
+        self.reloads = 0
+        self._paths = {}
+        self._models = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.discover()
+
+    def discover(self):
+        """Find the artifacts in the folder, returns the model names"""
+        paths = {}
+        for pattern in ARTIFACT_PATTERNS:
+            for path in sorted(glob.glob(os.path.join(self.folder, pattern))):
+                if path.endswith(MANIFEST):
+                    path = os.path.dirname(path)
+                    if os.path.splitext(path)[1]:
+                        # .tmp and .old folders of an export in progress
+                        continue
+                name = os.path.splitext(os.path.basename(path))[0][len('model_'):]
+                paths[name] = os.path.abspath(path)
+        with self._lock:
+            self._paths = paths
+        return sorted(paths)
+
+    def get(self, name=None, version=None):
+        """
+        The model in service under name, the default model without one.
+
+        Raises UnknownModel if there is no such artifact, or version is given
+        and is not the version in service, and ModelUnavailable if the
+        artifact could not be loaded.
+        """
+        name = name or self.default
+        loaded = self._models.get(name)
+        if loaded is None:
+            with self._load_lock:
+                loaded = self._models.get(name)
+                if loaded is None and name not in self._errors:
+                    self._load(name)
+                    loaded = self._models.get(name)
+        if loaded is None:
+            if name in self._errors:
+                raise ModelUnavailable(f"Model {name} could not be loaded: {self._errors[name]}")
+            raise UnknownModel(f"Unknown model: {name}")
+        if version is not None and version != loaded.version:
+            raise UnknownModel(f"Model {name} is at version {loaded.version}, not {version}")
+        return loaded
+
+    def reload(self, name):
+        """
+        Load the artifact of name again and swap it in once it has scored the
+        warm-up record. On failure the model in service, if any, is kept and
+        the error is raised.
+        """
+        with self._load_lock:
+            if name not in self._paths:
+                self.discover()
+            return self._load(name, keep_current=True)
+
+    def _load(self, name, keep_current=False):
+        path = self._paths.get(name)
+        if path is None:
+            raise UnknownModel(f"Unknown model: {name}")
+
+        try:
+            started = time.perf_counter()
+            model, version = load_artifact(path)
+            prediction = model.predict(np.asarray(prepare_model_input(WARMUP_RECORD), dtype=np.float64))
+            if len(prediction) != 1 or not np.isfinite(prediction[0]):
+                raise ValueError(f"Warm-up prediction returned {prediction!r}")
+        except Exception as e:
+            print(f"Error loading model {name} from {path}: {e}")
+            if not (keep_current and name in self._models):
+                with self._lock:
+                    self._errors[name] = str(e)
+            raise ModelUnavailable(f"Model {name} could not be loaded: {e}") from e
+
+        loaded = LoadedModel(
+            name, path, version, model,
+            load_seconds=time.perf_counter() - started,
+            batcher=self.make_batcher(model.predict) if self.make_batcher else None,
+            cache=self.make_cache() if self.make_cache else None,
+        )
+        with self._lock:
+            previous = self._models.get(name)
+            self._models[name] = loaded
+            self._errors.pop(name, None)
+            if previous is not None:
+                self.reloads += 1
+        print(f"Loaded model {name} version {version} in {loaded.load_seconds * 1000.0:.0f} ms")
+
+        if previous is not None:
+            # Rows already queued on the old batcher are still scored
+            previous.close()
+        return loaded
+
+    def stats(self):
+        """State of every known model: unloaded, ready or error"""
+        with self._lock:
+            paths = dict(self._paths)
+            models = dict(self._models)
+            errors = dict(self._errors)
+
+        stats = {}
+        for name in sorted(set(paths) | set(models)):
+            entry = {"path": paths.get(name), "default": name == self.default}
+            if name in models:
+                loaded = models[name]
+                entry.update(
+                    state="ready",
+                    version=loaded.version,
+                    loaded_at=loaded.loaded_at,
+                    load_ms=round(loaded.load_seconds * 1000.0, 1),
+                )
+                if loaded.batcher is not None:
+                    entry["microbatch"] = loaded.batcher.stats()
+                if loaded.cache is not None:
+                    entry["prediction_cache"] = loaded.cache.stats()
+            elif name in errors:
+                entry.update(state="error", error=errors[name])
+            else:
+                entry["state"] = "unloaded"
+            stats[name] = entry
+        return stats
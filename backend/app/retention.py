@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+def being_written(name):
+    """
+    Whether a file name is an upload still being spooled ('.part', see
+    UploadSpool) or a batch output not yet moved into place ('.tmp', see
+    BatchHistoryWriter)
+    """
+    return name.endswith('.part') or '.tmp.' in name or name.endswith('.tmp')
+
+def enforce_retention(folder, max_bytes=None, max_age_seconds=None, keep=(), now=None):
+    """
+    Delete files from folder that are too old, then the oldest files until
+    the folder fits in max_bytes.
+
+    Paths in keep are never deleted, nor counted towards the size limit.
+    Files still being written are left out of the size limit too, and only
+    deleted once too old, as leftovers of a process that exited.
+    Returns the absolute paths of the deleted files.
+    """
+    now = now or time.time()
+    keep = {os.path.abspath(path) for path in keep}
+    files = []
+    for entry in os.scandir(folder):
+        path = os.path.abspath(entry.path)
+        if not entry.is_file() or path in keep:
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    # Oldest first
+    files.sort()
+    total = sum(size for _, size, path in files if not being_written(path))
+    removed = []
+    for mtime, size, path in files:
+        too_old = max_age_seconds is not None and now - mtime > max_age_seconds
+        too_big = max_bytes is not None and total > max_bytes and not being_written(path)
+        if not (too_old or too_big):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Already removed by another server process
+            pass
+        if not being_written(path):
+            total -= size
+        removed.append(path)
+    return removed
+
+class RetentionPolicy:
+    """
+    Size and age limits for the upload and result folders.
+
+    apply() is cheap to call often: it does the folder scans at most once per
+    interval seconds.
+    """
+
+    def __init__(self, upload_folder, results_folder, max_upload_bytes, max_result_bytes,
+                 max_age_seconds, interval=60.0):
+        self.upload_folder = upload_folder
+        self.results_folder = results_folder
+        self.max_upload_bytes = max_upload_bytes
+        self.max_result_bytes = max_result_bytes
+        self.max_age_seconds = max_age_seconds
+        self.interval = interval
+        self.removed_files = 0
+        self._last_run = None
+        self._lock = threading.Lock()
+
+    def apply(self, job_store, force=False):
+        """Enforce the limits, keeping the files of unfinished jobs"""
+        with self._lock:
+            if not force and self._last_run is not None and time.monotonic() - self._last_run < self.interval:
+                return
+            self._last_run = time.monotonic()
+
+            keep = job_store.active_paths()
+            uploads = enforce_retention(self.upload_folder, self.max_upload_bytes, self.max_age_seconds, keep)
+            results = enforce_retention(self.results_folder, self.max_result_bytes, self.max_age_seconds, keep)
+            if results:
+                # Their jobs can no longer be downloaded or reused
+                job_store.expire_results(results)
+            self.removed_files += len(uploads) + len(results)
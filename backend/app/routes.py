@@ -1,12 +1,9 @@
-from flask import Blueprint, request, jsonify, current_app, url_for, send_from_directory
+from flask import Blueprint, request, jsonify, current_app, url_for, send_from_directory, send_file, make_response, Response, stream_with_context, g
 import os
 import pickle
+import gzip
 import uuid
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import io
-import base64
 import datetime
 from werkzeug.utils import secure_filename
 import threading
@@ -14,424 +11,692 @@ from functools import wraps
 import time
 import json
 from datetime import datetime, date
-import seaborn as sns
 from pathlib import Path
-from MultiColumnLabelEncoder import MultiColumnLabelEncoder
+from app.features import VALID_DEPARTMENTS, validate_input, prepare_model_input, get_productivity_category
+from app.batch import predict_chunk, run_batch
+from app.cache import PredictionCache
+from app.jobs import JobCancelled, JobScheduler, QueueFull
+from app.jobstore import ACTIVE_STATUSES, open_job_store
+from app.ingest import save_upload
+from app.writers import RESULT_WRITERS, available_formats
+from app.events import batch_events
+from app.retention import RetentionPolicy
+from app.microbatch import MicroBatcher
+from app.metrics import (BATCH_JOBS, BATCH_ROWS_PER_SECOND, PREDICTED_ROWS, REQUEST_SECONDS, STAGE_SECONDS,
+                         StageTimer, metrics)
+from app.registry import ModelRegistry, ModelUnavailable, UnknownModel
+from app.sweep import parse_sweep, sweep_grid
+from app.explain import check_explainable, explain_rows, explanation
+from app.admission import AdmissionController
+from app.profiling import RequestProfiler, memory_stats
+from app.history import GROUPINGS, HISTORY_SUFFIX, SOURCES, HistoryStore
+from app.charts import (CHART_FORMATS, CHARTS, COMPOSITE_CHART, IMAGE_MIMETYPES, chart_cache, chart_data,
+                        chart_key, chart_values, configure_renderer, get_chart, live_figures, parse_chart_key)
 
 # Create blueprint
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
-# Load ML models
-model_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'model_rf.pkl')
-try:
-    with open(model_path, 'rb') as f:
-        model = pickle.load(f)
-except Exception as e:
-    print(f"Error loading model: {e}")
-    model = None
+# ML models, each loaded on first use, set up with the app config
+registry = None
 
-# Global storage for batch jobs
-batch_jobs = {}
+# Batch job records, shared by all server processes, set up with the app config
+job_store = None
 
-# Helper functions
-def validate_date(date_str):
-    try:
-        input_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-        today = date.today()
-        if input_date > today:
-            return False, "Date cannot be in the future"
-        return True, input_date
-    except ValueError:
-        return False, "Invalid date format. Use YYYY-MM-DD"
+# Runs batch jobs on a pool of worker processes, set up with the app config
+scheduler = None
+
+# Size and age limits of the upload and result folders, set up with the app config
+retention = None
+
+# Historical records and batch predictions in memory, set up with the app config
+history = None
+
+# Concurrency limits per route class, set up with the app config
+admission = None
+
+# Writes sampled and requested request profiles, set up with the app config
+profiler = None
 
-def validate_numeric(value, name, min_val=None, max_val=None):
+@api_bp.record_once
+def configure_charts(state):
+    chart_cache.max_bytes = state.app.config['CHART_CACHE_MAX_BYTES']
+    configure_renderer(state.app.config['CHART_RENDER_WORKERS'])
+
+@api_bp.record_once
+def configure_models(state):
+    global registry
+    config = state.app.config
+    
+    # Every model gets its own batcher, coalescing concurrent single
+    # predictions, and its own cache of recently seen feature vectors
+    def make_batcher(predict):
+        if config['MICROBATCH_ENABLED']:
+            return MicroBatcher(
+                predict,
+                max_rows=config['MICROBATCH_MAX_ROWS'],
+                window_ms=config['MICROBATCH_WINDOW_MS'],
+                timeout_ms=config['MICROBATCH_TIMEOUT_MS'],
+            )
+        return None
+    
+    def make_cache():
+        if config['PREDICTION_CACHE_SIZE'] > 0:
+            return PredictionCache(config['PREDICTION_CACHE_SIZE'], config['PREDICTION_CACHE_TTL'])
+        return None
+    
+    registry = ModelRegistry(config['MODEL_FOLDER'], default=config['DEFAULT_MODEL'],
+                             make_batcher=make_batcher, make_cache=make_cache)
+    # The default model is loaded up front, so the first request is not a cold start
     try:
-        value = float(value)
-        
-        if min_val is not None and value < min_val:
-            return False, f"{name} must be at least {min_val}"
-            
-        if max_val is not None and value > max_val:
-            return False, f"{name} cannot exceed {max_val}"
-            
-        return True, value
-    except ValueError:
-        return False, f"{name} must be a number"
-
-def validate_input(data):
-    errors = []
-    validated_data = {}
-    
-    # Check date
-    if "date" in data:
-        is_valid, date_result = validate_date(data["date"])
-        if not is_valid:
-            errors.append(date_result)
-        else:
-            validated_data["date"] = date_result
-    else:
-        errors.append("Date is required")
-    
-    # Check department
-    if "department" in data:
-        dept = data["department"]
-        if dept not in ["Sewing", "Finishing", "Cutting", "QC"]:
-            errors.append("Invalid department")
-        else:
-            validated_data["department"] = dept
-    else:
-        errors.append("Department is required")
-    
-    # Check team
-    if "team" in data:
-        team = data["team"]
-        if not team.startswith("Team "):
-            errors.append("Invalid team format. Should be 'Team X'")
-        else:
-            validated_data["team"] = team
-    else:
-        errors.append("Team is required")
-    
-    # Check targeted_productivity
-    if "targeted_productivity" in data:
-        is_valid, value = validate_numeric(data["targeted_productivity"], "Targeted productivity", 0, 150)
-        if not is_valid:
-            errors.append(value)
-        else:
-            validated_data["targeted_productivity"] = value
-    else:
-        errors.append("Targeted productivity is required")
-    
-    # Check smv_minutes
-    if "smv_minutes" in data:
-        is_valid, value = validate_numeric(data["smv_minutes"], "SMV minutes", 0)
-        if not is_valid:
-            errors.append(value)
-        else:
-            validated_data["smv_minutes"] = value
-    else:
-        errors.append("SMV minutes is required")
-    
-    # Check over_time_hours
-    if "over_time_hours" in data:
-        is_valid, value = validate_numeric(data["over_time_hours"], "Overtime hours", 0, 8)
-        if not is_valid:
-            errors.append(value)
-        else:
-            validated_data["over_time_hours"] = value
-    else:
-        errors.append("Overtime hours is required")
-    
-    # Check incentive_level
-    if "incentive_level" in data:
-        level = data["incentive_level"]
-        if level not in ["None", "Low", "Standard", "High"]:
-            errors.append("Invalid incentive level")
-        else:
-            validated_data["incentive_level"] = level
-    else:
-        errors.append("Incentive level is required")
-    
-    # Check idle_time_minutes
-    if "idle_time_minutes" in data:
-        is_valid, value = validate_numeric(data["idle_time_minutes"], "Idle time minutes", 0)
-        if not is_valid:
-            errors.append(value)
-        else:
-            validated_data["idle_time_minutes"] = value
-    else:
-        errors.append("Idle time minutes is required")
-    
-    # Check idle_men_count
-    if "idle_men_count" in data:
-        is_valid, value = validate_numeric(data["idle_men_count"], "Idle men count", 0)
-        if not is_valid:
-            errors.append(value)
-        else:
-            validated_data["idle_men_count"] = int(value)
-    else:
-        errors.append("Idle men count is required")
-    
-    # Check style_change_count
-    if "style_change_count" in data:
-        is_valid, value = validate_numeric(data["style_change_count"], "Style change count", 0)
-        if not is_valid:
-            errors.append(value)
-        else:
-            validated_data["style_change_count"] = int(value)
-    else:
-        errors.append("Style change count is required")
-    
-    # Check worker_count
-    if "worker_count" in data:
-        is_valid, value = validate_numeric(data["worker_count"], "Worker count", 1)
-        if not is_valid:
-            errors.append(value)
-        else:
-            validated_data["worker_count"] = int(value)
+        registry.get()
+    except (UnknownModel, ModelUnavailable) as e:
+        print(f"Error loading model: {e}")
+
+@api_bp.record_once
+def configure_job_store(state):
+    global job_store
+    job_store = open_job_store(state.app.config['JOB_STORE_URL'])
+    # Jobs left unfinished by a server that has since exited will never complete
+    interrupted = job_store.fail_orphans("Interrupted by a server restart")
+    if interrupted:
+        print(f"Marked {interrupted} interrupted batch jobs as failed")
+
+@api_bp.record_once
+def configure_retention(state):
+    global retention
+    config = state.app.config
+    retention = RetentionPolicy(
+        config['UPLOAD_FOLDER'],
+        config['RESULTS_FOLDER'],
+        max_upload_bytes=config['UPLOADS_MAX_BYTES'],
+        max_result_bytes=config['RESULTS_MAX_BYTES'],
+        max_age_seconds=config['RETENTION_MAX_AGE_SECONDS'],
+        interval=config['RETENTION_INTERVAL_SECONDS'],
+    )
+    retention.apply(job_store, force=True)
+
+@api_bp.record_once
+def configure_history(state):
+    global history
+    config = state.app.config
+    history = HistoryStore.from_dataset(config['HISTORY_DATASET'], config['HISTORY_REFRESH_SECONDS'])
+    if config['HISTORY_INCLUDE_BATCHES']:
+        history.refresh(job_store, force=True)
+
+@api_bp.record_once
+def configure_admission(state):
+    global admission
+    config = state.app.config
+    if config['ADMISSION_ENABLED']:
+        admission = AdmissionController(
+            config['ADMISSION_LIMITS'],
+            queue_size=config['ADMISSION_QUEUE_SIZE'],
+            queue_timeout_ms=config['ADMISSION_QUEUE_TIMEOUT_MS'],
+            max_requests=config['ADMISSION_MAX_REQUESTS'],
+        )
+
+@api_bp.record_once
+def configure_metrics(state):
+    config = state.app.config
+    metrics.configure_multiprocess(config['METRICS_MULTIPROC_DIR'], config['METRICS_FLUSH_SECONDS'])
+
+@api_bp.record_once
+def configure_profiler(state):
+    global profiler
+    config = state.app.config
+    profiler = RequestProfiler(
+        config['PROFILE_DIR'],
+        fmt=config['PROFILE_FORMAT'],
+        sample_rate=config['PROFILE_SAMPLE_RATE'],
+        interval_ms=config['PROFILE_SAMPLE_INTERVAL_MS'],
+    )
+
+def batch_started(batch_id):
+    job_store.update(batch_id, status='processing', started_at=datetime.now().isoformat())
+
+def batch_finished(batch_id, result, error):
+    finished_at = datetime.now()
+    if isinstance(error, JobCancelled):
+        status = 'cancelled'
+        job_store.update(batch_id, status=status, finished_at=finished_at.isoformat())
+    elif error is not None:
+        status = 'failed'
+        job_store.update(batch_id, status=status, error=str(error), finished_at=finished_at.isoformat())
+        print(f"Error processing batch {batch_id}: {error}")
     else:
-        errors.append("Worker count is required")
-    
-    return len(errors) == 0, errors, validated_data
+        status = 'completed'
+        # Stage timings of the worker process join this process's metrics
+        STAGE_SECONDS.merge(result.pop("stage_seconds"))
+        job_store.update(batch_id, status=status, finished_at=finished_at.isoformat(), **result)
+        job = job_store.get(batch_id)
+        PREDICTED_ROWS.inc(result["valid_rows"], endpoint='batch', model=job["model_name"])
+        if job["started_at"]:
+            elapsed = (finished_at - datetime.fromisoformat(job["started_at"])).total_seconds()
+            if elapsed > 0:
+                BATCH_ROWS_PER_SECOND.observe(result["rows_done"] / elapsed)
+    BATCH_JOBS.inc(status=status)
+    metrics.schedule_flush()
+    retention.apply(job_store)
+    if status == 'completed' and history is not None:
+        history.refresh(job_store, force=True)
+
+@api_bp.record_once
+def configure_scheduler(state):
+    global scheduler
+    config = state.app.config
+    # Every server process runs its own pool, so each gets a share of the host's limits
+    processes = max(1, config['SERVER_PROCESSES'])
+    scheduler = JobScheduler(
+        workers=max(1, config['BATCH_WORKERS'] // processes),
+        max_queued=max(1, config['BATCH_QUEUE_MAX'] // processes),
+        nice=config['BATCH_WORKER_NICE'],
+        on_start=batch_started,
+        on_done=batch_finished,
+    )
+
+def model_samples(read):
+    """(model name, value) pairs of read(model stats) for the loaded models"""
+    if registry is None:
+        return []
+    return [((name,), read(entry)) for name, entry in registry.stats().items() if entry["state"] == "ready"]
+
+metrics.collector(
+    'model_ready', "1 for a model in service, 0 for one not loaded or failed", ('model',),
+    lambda: [((name,), int(entry["state"] == "ready")) for name, entry in registry.stats().items()]
+    if registry is not None else [], multiprocess_mode='min')
+metrics.collector(
+    'microbatch_queue_depth', "Single predictions waiting for a coalesced model call", ('model',),
+    lambda: model_samples(lambda entry: entry.get("microbatch", {}).get("queue_depth", 0)))
+metrics.collector(
+    'prediction_cache_hits_total', "Predictions answered from the cache", ('model',),
+    lambda: model_samples(lambda entry: entry.get("prediction_cache", {}).get("hits", 0)), kind='counter')
+metrics.collector(
+    'prediction_cache_misses_total', "Predictions not found in the cache", ('model',),
+    lambda: model_samples(lambda entry: entry.get("prediction_cache", {}).get("misses", 0)), kind='counter')
+metrics.collector(
+    'prediction_cache_entries', "Feature vectors held in the cache", ('model',),
+    lambda: model_samples(lambda entry: entry.get("prediction_cache", {}).get("entries", 0)))
+metrics.collector(
+    'admission_active_requests', "Requests being served per route class", ('route_class',),
+    lambda: [((name,), entry["active"]) for name, entry in admission.stats().items()] if admission is not None else [])
+metrics.collector(
+    'admission_waiting_requests', "Requests waiting for a slot per route class", ('route_class',),
+    lambda: [((name,), entry["waiting"]) for name, entry in admission.stats().items()] if admission is not None else [])
+metrics.collector(
+    'admission_rejected_total', "Requests turned away with a 429 per route class", ('route_class',),
+    lambda: [((name,), entry["rejected"]) for name, entry in admission.stats().items()] if admission is not None else [],
+    kind='counter')
+metrics.collector(
+    'live_figures', "Chart figures not yet garbage collected, render processes included", (),
+    lambda: [((), live_figures())])
+metrics.collector(
+    'batch_scheduler_jobs', "Batch jobs waiting for or running on a worker", ('state',),
+    lambda: [(("queued",), scheduler.stats()["queued"]), (("running",), scheduler.stats()["running"])]
+    if scheduler is not None else [])
+metrics.collector(
+    'batch_jobs', "Batch jobs in the job store by status", ('status',),
+    lambda: [((status,), count) for status, count in job_store.counts().items()] if job_store is not None else [],
+    multiprocess_mode='local')
+
+@api_bp.before_request
+def start_timing():
+    g.timer = StageTimer()
+    g.request_started = time.perf_counter()
+    # Profile admin requests that ask for it, and a sample of the rest
+    g.profile = None
+    g.profile_requested = False
+    if profiler.sample_rate or 'X-Profile' in request.headers:
+        token = current_app.config['ADMIN_TOKEN']
+        requested = (bool(token) and request.headers.get('X-Admin-Token') == token
+                     and parse_flag(request.headers.get('X-Profile')))
+        g.profile_requested = requested
+        if requested or profiler.sampled():
+            g.profile = profiler.start()
+
+@api_bp.after_request
+def record_timing(response):
+    """Feed the request and stage timings to the metrics, and to a Server-Timing header when enabled"""
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.endpoint.split('.')[-1]
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    for stage, seconds in g.timer.stages.items():
+        STAGE_SECONDS.observe(seconds, endpoint=endpoint, stage=stage)
+    if current_app.config['SERVER_TIMING']:
+        timings = [g.timer.server_timing(), f"total;dur={elapsed * 1000.0:.3f}"]
+        response.headers['Server-Timing'] = ", ".join(timing for timing in timings if timing)
+    if g.profile is not None:
+        filename = profiler.stop(g.profile, endpoint)
+        g.profile = None
+        # Sampled requests are profiled silently, only admins learn the file name
+        if g.profile_requested:
+            response.headers['X-Profile-File'] = filename
+    metrics.schedule_flush()
+    return response
+
+@api_bp.teardown_request
+def stop_profile(error):
+    """Stop the profile of a request that failed before its response, nothing is written"""
+    session = g.pop('profile', None)
+    if session is not None:
+        profiler.discard(session)
 
 # Visualization functions
-def generate_visualizations(data):
-    visualizations = {}
-    
-    # Extract key metrics
-    targeted_productivity = data.get("targeted_productivity", 0)
-    smv_minutes = data.get("smv_minutes", 0)
-    over_time_hours = data.get("over_time_hours", 0)
-    idle_time_minutes = data.get("idle_time_minutes", 0)
-    
-    # Bar chart
-    plt.figure(figsize=(10, 6))
-    categories = ['Targeted Productivity', 'SMV', 'Over Time', 'Idle Time']
-    values = [targeted_productivity, smv_minutes, over_time_hours, idle_time_minutes]
-    plt.bar(categories, values, color=['blue', 'green', 'red', 'orange'])
-    plt.xlabel('Parameters')
-    plt.ylabel('Values')
-    plt.title('Employee Productivity Parameters')
-    
-    # Save as base64
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-    visualizations['bar_chart_url'] = f"data:image/png;base64,{img_base64}"
-    plt.close()
-    
-    # Scatter plot
-    plt.figure(figsize=(10, 6))
-    plt.scatter([1, 2, 3, 4], [targeted_productivity, smv_minutes, over_time_hours, idle_time_minutes], 
-                s=100, alpha=0.7)
-    plt.xticks([1, 2, 3, 4], categories)
-    plt.xlabel('Parameters')
-    plt.ylabel('Values')
-    plt.title('Scatter Plot of Employee Parameters')
-    plt.grid(True, linestyle='--', alpha=0.7)
-    
-    # Save as base64
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-    visualizations['scatter_plot_url'] = f"data:image/png;base64,{img_base64}"
-    plt.close()
-    
-    # Line plot
-    plt.figure(figsize=(10, 6))
-    plt.plot([1, 2, 3, 4], [targeted_productivity, smv_minutes, over_time_hours, idle_time_minutes], 
-             marker='o', linestyle='-', linewidth=2, markersize=10)
-    plt.xticks([1, 2, 3, 4], categories)
-    plt.xlabel('Parameters')
-    plt.ylabel('Values')
-    plt.title('Line Plot of Employee Parameters')
-    plt.grid(True, linestyle='--', alpha=0.7)
-    
-    # Save as base64
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-    visualizations['line_graph_url'] = f"data:image/png;base64,{img_base64}"
-    plt.close()
-    
-    # Pie chart
-    plt.figure(figsize=(10, 6))
-    sizes = [targeted_productivity, smv_minutes, over_time_hours, idle_time_minutes]
-    plt.pie(sizes, labels=categories, autopct='%1.1f%%', startangle=90, 
-            shadow=True, explode=(0.05, 0, 0, 0))
-    plt.axis('equal')
-    plt.title('Distribution of Employee Parameters')
-    
-    # Save as base64
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-    visualizations['pie_chart_url'] = f"data:image/png;base64,{img_base64}"
-    plt.close()
-    
-    return visualizations
-
-def prepare_model_input(data):
+def generate_visualizations(data, chart_format='png'):
+    """Return the visualizations of a validated record in the requested format"""
+    values = chart_values(data)
+    if chart_format == 'data':
+        return chart_data(values)
+    
+    key = chart_key(values)
+    if chart_format == 'composite':
+        return {"composite_url": url_for('api.get_visualization', key=key, chart=COMPOSITE_CHART, ext='png', _external=True)}
+    
+    return {
+        name: url_for('api.get_visualization', key=key, chart=chart, ext=chart_format, _external=True)
+        for name, chart in CHARTS.items()
+    }
+
+def requested_chart_format(*sources):
     """
-    Convert the user input to the format expected by the model
+    Return the chart format asked for in the query string or body, or None.
+
+    Visualizations are requested with a truthy 'visualizations' flag, which
+    means png, or with an explicit 'chart_format'.
     """
-    # Encode categorical features
-    quarter = data.get("date").month // 3 + 1 if hasattr(data.get("date"), "month") else 1
-    month = data.get("date").month if hasattr(data.get("date"), "month") else datetime.now().month
-    
-    # Map department to numeric value (use the encoding used during training)
-    department_map = {"Sewing": 1, "Finishing": 0}
-    department = department_map.get(data.get("department"), 1)  # Default to Sewing if unknown
-    
-    # Map day of week (1=Monday, 7=Sunday)
-    day = data.get("date").weekday() + 1 if hasattr(data.get("date"), "weekday") else 1
-    
-    # Extract team number
-    team = int(data.get("team").split(" ")[1]) if isinstance(data.get("team"), str) and "Team " in data.get("team") else 1
-    
-    # Map incentive level
-    incentive_map = {"None": 0, "Low": 1, "Standard": 2, "High": 3}
-    incentive = incentive_map.get(data.get("incentive_level"), 2)  # Default to Standard if unknown
-    
-    # Prepare the input array for model prediction
-    model_input = [
-        quarter, 
-        department, 
-        day, 
-        team,
-        float(data.get("targeted_productivity")), 
-        float(data.get("smv_minutes")), 
-        int(data.get("over_time_hours")), 
-        incentive,  
-        float(data.get("idle_time_minutes")), 
-        int(data.get("idle_men_count")), 
-        int(data.get("style_change_count")), 
-        float(data.get("worker_count")),
-        month
-    ]
-    
-    return [model_input]  # Model expects a 2D array
-
-def get_productivity_category(productivity):
-    """Return the productivity category based on the model's output"""
-    if productivity <= 0.3:
-        return "Below Average Productivity"
-    elif 0.3 < productivity <= 0.8:
-        return "Medium Productivity"
-    else:
-        return "High Productivity"
+    for source in sources:
+        chart_format = source.get('chart_format')
+        if chart_format is not None:
+            if chart_format not in CHART_FORMATS:
+                raise ValueError(f"Invalid chart format. Use one of: {', '.join(CHART_FORMATS)}")
+            return chart_format
+    if any(parse_flag(source.get('visualizations')) for source in sources):
+        return 'png'
+    return None
+
+def parse_flag(value):
+    """Interpret a query string or form flag such as ?visualizations=true"""
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+def requested_model(*sources):
+    """
+    Return the model asked for with 'model' and optionally 'model_version'
+    in the query string, body or form, or the default model.
+
+    Raises UnknownModel or ModelUnavailable.
+    """
+    name = next((source.get('model') for source in sources if source.get('model')), None)
+    version = next((source.get('model_version') for source in sources if source.get('model_version')), None)
+    return registry.get(name, version)
 
-def process_batch(batch_id, file_path, app_context):
+def model_error(e):
+    """Error response for a model that cannot be used"""
+    if isinstance(e, UnknownModel):
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"error": f"ML model not loaded: {e}"}), 503
+
+def admin_required(f):
+    """Only allow requests carrying the ADMIN_TOKEN in an X-Admin-Token header"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = current_app.config['ADMIN_TOKEN']
+        if not token:
+            return jsonify({"error": "Admin endpoints are disabled, set ADMIN_TOKEN to enable them"}), 403
+        if request.headers.get('X-Admin-Token') != token:
+            return jsonify({"error": "Invalid admin token"}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+def admitted(route_class):
+    """
+    Serve the route within the concurrency limit of its route class. A
+    request that gets no slot within the queue timeout is answered with a
+    429 and a Retry-After header. The slot is held until the response is
+    closed, so streamed responses keep it while they stream.
     """
-    Process a batch job in a background thread
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            controller = admission
+            if controller is None:
+                return f(*args, **kwargs)
+            with g.timer.stage("admission"):
+                allowed = controller.acquire(route_class)
+            if not allowed:
+                response = jsonify({"error": "The server is busy, try again later"})
+                response.headers['Retry-After'] = str(current_app.config['ADMISSION_RETRY_AFTER_SECONDS'])
+                return response, 429
+            try:
+                response = make_response(f(*args, **kwargs))
+            except BaseException:
+                controller.release(route_class)
+                raise
+            on_response_closed(response, lambda: controller.release(route_class))
+            return response
+        return decorated
+    return decorator
+
+def on_response_closed(response, callback):
+    """
+    Call callback once the server has closed the response. A passthrough
+    body, such as a file from send_file, is handed to the server as it is
+    so it can use sendfile, and only the body is closed, so its close calls
+    callback instead.
     """
-    with app_context:
+    if not response.direct_passthrough:
+        response.call_on_close(callback)
+        return
+    body = response.response
+    close = getattr(body, 'close', None)
+    
+    def closed():
         try:
-            # Update job status
-            batch_jobs[batch_id]['status'] = 'processing'
-            
-            # Load the CSV file
-            df = pd.read_csv(file_path)
-            
-            # Prepare DataFrame to store results
-            results = pd.DataFrame()
-            
-            # Process each row
-            for _, row in df.iterrows():
-                # Prepare input data in the expected format
-                data = {
-                    'date': row.get('date'),
-                    'department': row.get('department'),
-                    'team': row.get('team'),
-                    'targeted_productivity': row.get('targeted_productivity'),
-                    'smv_minutes': row.get('smv_minutes'),
-                    'over_time_hours': row.get('over_time_hours'),
-                    'incentive_level': row.get('incentive_level'),
-                    'idle_time_minutes': row.get('idle_time_minutes'),
-                    'idle_men_count': row.get('idle_men_count'),
-                    'style_change_count': row.get('style_change_count'),
-                    'worker_count': row.get('worker_count')
-                }
-                
-                # Validate input
-                is_valid, errors, validated_data = validate_input(data)
-                
-                if is_valid:
-                    # Prepare model input
-                    model_input = prepare_model_input(validated_data)
-                    
-                    # Make prediction
-                    productivity = model.predict(model_input)[0]
-                    
-                    # Add to results
-                    row_result = row.copy()
-                    row_result['actual_productivity'] = productivity
-                    row_result['category'] = get_productivity_category(productivity)
-                    results = pd.concat([results, pd.DataFrame([row_result])], ignore_index=True)
-                else:
-                    # Handle invalid data
-                    row_result = row.copy()
-                    row_result['actual_productivity'] = None
-                    row_result['category'] = 'Invalid input data'
-                    row_result['errors'] = '; '.join(errors)
-                    results = pd.concat([results, pd.DataFrame([row_result])], ignore_index=True)
-            
-            # Save results
-            results_path = os.path.join(current_app.config['RESULTS_FOLDER'], f"{batch_id}.xlsx")
-            results.to_excel(results_path, index=False)
-            
-            # Get the file's URL path
-            results_url = url_for('api.download_batch_result', batch_id=batch_id, _external=True)
-            
-            # Update job status
-            batch_jobs[batch_id]['status'] = 'completed'
-            batch_jobs[batch_id]['results_url'] = results_url
-            
-        except Exception as e:
-            # Handle any errors
-            batch_jobs[batch_id]['status'] = 'failed'
-            batch_jobs[batch_id]['error'] = str(e)
-            print(f"Error processing batch {batch_id}: {e}")
+            if close is not None:
+                close()
+        finally:
+            callback()
+    try:
+        body.close = closed
+    except AttributeError:
+        # Served through the response instead, which calls callback
+        response.direct_passthrough = False
+        response.call_on_close(callback)
+
+def under_load():
+    """Whether prediction or chart requests are at their limit, charts are then left out"""
+    return admission is not None and (admission.busy('prediction') or admission.busy('visualization'))
 
 # Routes
 @api_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    if model is None:
-        return jsonify({"status": "error", "message": "ML model not loaded"}), 500
-    return jsonify({"status": "ok", "message": "Service is up and running"}), 200
+    models = registry.stats()
+    if models.get(registry.default, {}).get("state") != "ready":
+        return jsonify({"status": "error", "message": "ML model not loaded", "models": models}), 500
+    
+    response = {"status": "ok", "message": "Service is up and running", "models": models}
+    if scheduler is not None:
+        response["batch_scheduler"] = scheduler.stats()
+    if job_store is not None:
+        response["batch_jobs"] = job_store.counts()
+    if retention is not None:
+        response["retention"] = {"removed_files": retention.removed_files}
+    if admission is not None:
+        response["admission"] = admission.stats()
+    return jsonify(response), 200
+
+@api_bp.route('/metrics', methods=['GET'])
+@admitted('operations')
+def prometheus_metrics():
+    """Metrics of all server processes in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @api_bp.route('/predict', methods=['POST'])
+@admitted('prediction')
 def predict():
     """Make a single prediction"""
-    # Check if model is loaded
-    if model is None:
-        return jsonify({"error": "ML model not loaded"}), 500
+    timer = g.timer
     
     # Get JSON data
-    data = request.json
+    with timer.stage("parse"):
+        data = request.json
     if not data:
         return jsonify({"error": "No data provided"}), 400
     
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    
+    # Pick the model, the default one unless asked otherwise
+    try:
+        loaded = requested_model(request.args, data)
+    except (UnknownModel, ModelUnavailable) as e:
+        return model_error(e)
+    
     # Validate input
-    is_valid, errors, validated_data = validate_input(data)
+    with timer.stage("validate"):
+        is_valid, errors, validated_data = validate_input(data)
     if not is_valid:
         return jsonify({"error": "Invalid input data", "details": errors}), 400
     
+    try:
+        chart_format = requested_chart_format(request.args, data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
     # Prepare input for model
-    model_input = prepare_model_input(validated_data)
+    with timer.stage("prepare"):
+        model_input = prepare_model_input(validated_data)
+    
+    # Per-feature contributions only when asked for, in the query string or the body
+    explanation_response = None
+    if any(parse_flag(source.get('explain')) for source in (request.args, data)):
+        try:
+            with timer.stage("explain"):
+                bias, contributions = explain_rows(loaded.model, model_input)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        explanation_response = explanation(bias, contributions[0])
     
-    # Make prediction
+    # Make prediction, repeated inputs are answered from the cache and the
+    # rest batched together with concurrent requests when enabled
     try:
-        prediction = model.predict(model_input)[0]
+        cache = loaded.cache
+        with timer.stage("cache"):
+            prediction = cache.get(model_input[0], loaded.version) if cache is not None else None
+        if prediction is None:
+            with timer.stage("predict"):
+                prediction = loaded.predict_one(model_input[0])
+            if cache is not None:
+                cache.put(model_input[0], loaded.version, prediction)
+        PREDICTED_ROWS.inc(endpoint='predict', model=loaded.name)
         # Get category based on prediction
         category = get_productivity_category(prediction)
         
-        # Generate visualizations
-        visualizations = generate_visualizations(validated_data)
-        
         # Prepare response
         response = {
             "actual_productivity": float(prediction),
             "category": category,
-            "visualizations": visualizations
+            "model": loaded.name,
+            "model_version": loaded.version
         }
+        if explanation_response is not None:
+            response["explanation"] = explanation_response
+        
+        # Add visualizations only when asked for, in the query string or the body,
+        # and leave them empty while the server is under load
+        if chart_format is not None:
+            if under_load():
+                response["visualizations"] = {}
+                response["degraded"] = ["visualizations"]
+            else:
+                with timer.stage("visualizations"):
+                    response["visualizations"] = generate_visualizations(validated_data, chart_format)
         
-        return jsonify(response), 200
+        with timer.stage("serialize"):
+            return jsonify(response), 200
+    
+    except TimeoutError:
+        return jsonify({"error": "Prediction timed out, the server is overloaded"}), 503
     
     except Exception as e:
         return jsonify({"error": f"Prediction error: {str(e)}"}), 500
 
+@api_bp.route('/predict/bulk', methods=['POST'])
+@admitted('prediction')
+def predict_bulk():
+    """Make predictions for an array of records with a single model call"""
+    # Pick the model, the default one unless asked otherwise
+    try:
+        loaded = requested_model(request.args)
+    except (UnknownModel, ModelUnavailable) as e:
+        return model_error(e)
+    
+    # Get JSON data
+    records = request.json
+    if not records:
+        return jsonify({"error": "No data provided"}), 400
+    
+    if not isinstance(records, list):
+        return jsonify({"error": "Expected an array of records"}), 400
+    
+    max_records = current_app.config['BULK_MAX_RECORDS']
+    if len(records) > max_records:
+        return jsonify({"error": f"Too many records, the limit is {max_records}"}), 413
+    
+    try:
+        chart_format = requested_chart_format(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Charts are left empty while the server is under load
+    degraded = chart_format is not None and under_load()
+    
+    # Per-feature contributions of every record only when asked for
+    explain = parse_flag(request.args.get('explain'))
+    if explain:
+        try:
+            check_explainable(loaded.model)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    
+    # Imported on first use, only the bulk and batch paths need pandas
+    import pandas as pd
+    
+    try:
+        # Validate, encode and predict all records at once
+        df = pd.DataFrame([record if isinstance(record, dict) else {} for record in records])
+        scored = predict_chunk(df, loaded.model, loaded.cache, loaded.version, g.timer, explain)
+        predictions, categories, errors = scored[:3]
+        
+        results = []
+        for index, record in enumerate(records):
+            if not isinstance(record, dict):
+                results.append({"index": index, "error": "Invalid input data", "details": ["Record must be an object"]})
+            elif errors[index]:
+                results.append({"index": index, "error": "Invalid input data", "details": errors[index].split("; ")})
+            else:
+                result = {
+                    "index": index,
+                    "actual_productivity": float(predictions[index]),
+                    "category": categories[index]
+                }
+                if explain:
+                    bias, contributions = scored[3]
+                    result["explanation"] = explanation(bias, contributions[index])
+                if degraded:
+                    result["visualizations"] = {}
+                elif chart_format is not None:
+                    with g.timer.stage("visualizations"):
+                        result["visualizations"] = generate_visualizations(record, chart_format)
+                results.append(result)
+        
+        valid = int(sum(1 for result in results if "error" not in result))
+        PREDICTED_ROWS.inc(valid, endpoint='predict_bulk', model=loaded.name)
+        response = {
+            "model": loaded.name,
+            "model_version": loaded.version,
+            "count": len(records),
+            "valid": valid,
+            "results": results
+        }
+        if degraded:
+            response["degraded"] = ["visualizations"]
+        with g.timer.stage("serialize"):
+            return jsonify(response), 200
+    
+    except Exception as e:
+        return jsonify({"error": f"Prediction error: {str(e)}"}), 500
+
+@api_bp.route('/predict/sweep', methods=['POST'])
+@admitted('prediction')
+def predict_sweep():
+    """Predict a base record over a grid of one or two parameters with a single model call"""
+    timer = g.timer
+    
+    data = request.json
+    if not isinstance(data, dict) or not isinstance(data.get("base"), dict):
+        return jsonify({"error": "Expected a 'base' record and a 'sweep' of parameter ranges"}), 400
+    
+    # Pick the model, the default one unless asked otherwise
+    try:
+        loaded = requested_model(request.args, data)
+    except (UnknownModel, ModelUnavailable) as e:
+        return model_error(e)
+    
+    with timer.stage("validate"):
+        try:
+            axes = parse_sweep(data.get("sweep"), current_app.config['SWEEP_MAX_POINTS'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Swept fields may be left out of the base record
+        base = dict(data["base"])
+        for name, values, _, _ in axes:
+            base.setdefault(name, values[0])
+        is_valid, errors, validated_data = validate_input(base)
+    if not is_valid:
+        return jsonify({"error": "Invalid input data", "details": errors}), 400
+    
+    try:
+        # The base record goes last, scored in the same call as the grid
+        with timer.stage("prepare"):
+            base_row = prepare_model_input(validated_data)[0]
+            grid, shape = sweep_grid(base_row, axes)
+            model_input = np.vstack([grid, np.asarray([base_row], dtype=np.float64)])
+        
+        with timer.stage("predict"):
+            predictions = np.asarray(loaded.predict(model_input), dtype=np.float64)
+        PREDICTED_ROWS.inc(len(model_input), endpoint='predict_sweep', model=loaded.name)
+        
+        surface = predictions[:-1].reshape(shape)
+        best = np.unravel_index(int(np.argmax(surface)), shape)
+        
+        with timer.stage("serialize"):
+            return jsonify({
+                "model": loaded.name,
+                "model_version": loaded.version,
+                "parameters": [{"name": name, "values": values} for name, values, _, _ in axes],
+                "points": int(surface.size),
+                "predictions": surface.tolist(),
+                "base": {
+                    "actual_productivity": float(predictions[-1]),
+                    "category": get_productivity_category(predictions[-1])
+                },
+                "best": {
+                    "settings": {name: values[i] for (name, values, _, _), i in zip(axes, best)},
+                    "actual_productivity": float(surface[best]),
+                    "category": get_productivity_category(surface[best])
+                }
+            }), 200
+    
+    except Exception as e:
+        return jsonify({"error": f"Prediction error: {str(e)}"}), 500
+
+@api_bp.route('/visualizations/<key>/<chart>.<ext>', methods=['GET'])
+@admitted('visualization')
+def get_visualization(key, chart, ext):
+    """Serve a chart image, addressed by the values it plots"""
+    values = parse_chart_key(key)
+    if values is None or ext not in IMAGE_MIMETYPES or (chart not in CHARTS.values() and chart != COMPOSITE_CHART):
+        return jsonify({"error": "Visualization not found"}), 404
+    
+    response = make_response(get_chart(chart, values, ext))
+    response.mimetype = IMAGE_MIMETYPES[ext]
+    # The URL fully determines the image, so clients may cache it forever
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    response.add_etag()
+    return response.make_conditional(request)
+
 @api_bp.route('/batch', methods=['POST'])
+@admitted('batch_upload')
 def create_batch():
     """Upload a batch job"""
-    # Check if model is loaded
-    if model is None:
-        return jsonify({"error": "ML model not loaded"}), 500
+    # Pick the model, the default one unless asked otherwise
+    try:
+        loaded = requested_model(request.form)
+    except (UnknownModel, ModelUnavailable) as e:
+        return model_error(e)
     
     # Check if file is provided
     if 'file' not in request.files:
@@ -447,6 +712,27 @@ def create_batch():
     if not file.filename.endswith('.csv'):
         return jsonify({"error": "Only CSV files are allowed"}), 400
     
+    # Jobs with a higher priority (0-9) run first
+    try:
+        priority = int(request.form.get('priority', 0))
+    except ValueError:
+        priority = -1
+    if not 0 <= priority <= 9:
+        return jsonify({"error": "Priority must be an integer from 0 to 9"}), 400
+    
+    # Result file format, Excel unless asked otherwise
+    output_format = request.form.get('output_format', 'xlsx')
+    if output_format not in available_formats():
+        return jsonify({"error": f"Invalid output format. Use one of: {', '.join(available_formats())}"}), 400
+    
+    # Contribution columns in the results only when asked for
+    explain = parse_flag(request.form.get('explain'))
+    if explain:
+        try:
+            check_explainable(loaded.model)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    
     try:
         # Generate a unique ID for this batch job
         batch_id = str(uuid.uuid4())
@@ -454,83 +740,333 @@ def create_batch():
         # Save the file
         filename = secure_filename(f"{batch_id}_{file.filename}")
         file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        # Already hashed and counted as it arrived, moved into place without a copy
+        _, rows_total, content_hash = save_upload(file, file_path)
         
-        # Initialize job status
-        batch_jobs[batch_id] = {
-            "status": "queued",
-            "file_path": file_path,
-            "created_at": datetime.now().isoformat()
-        }
+        # An identical upload for the same model, output format and explanations shares its result
+        duplicate = job_store.find_duplicate(content_hash, loaded.version, output_format, int(explain))
+        if duplicate is not None and (duplicate["status"] != "completed" or os.path.exists(duplicate["results_path"])):
+            os.remove(file_path)
+            if duplicate["status"] != "completed":
+                # Attach to the job already queued or running
+                return jsonify(dict(describe_batch(duplicate), deduplicated=True)), 202
+            
+            # Complete at once, pointing at the existing result
+            now = datetime.now().isoformat()
+            job_store.create(
+                batch_id,
+                status="completed",
+                results_path=duplicate["results_path"],
+                output_format=output_format,
+                priority=priority,
+                rows_total=duplicate["rows_total"],
+                rows_done=duplicate["rows_done"],
+                valid_rows=duplicate["valid_rows"],
+                created_at=now,
+                started_at=now,
+                finished_at=now,
+                content_hash=content_hash,
+                model_name=loaded.name,
+                model_version=loaded.version,
+                reused_from=duplicate["id"],
+                explanations=int(explain)
+            )
+            return jsonify(dict(describe_batch(job_store.get(batch_id)), deduplicated=True)), 202
         
-        # Start processing in a background thread
-        thread = threading.Thread(
-            target=process_batch,
-            args=(batch_id, file_path, current_app.app_context())
+        # Initialize job status
+        extension = RESULT_WRITERS[output_format].extension
+        results_path = os.path.join(current_app.config['RESULTS_FOLDER'], f"{batch_id}.{extension}")
+        job_store.create(
+            batch_id,
+            status="queued",
+            file_path=os.path.abspath(file_path),
+            results_path=os.path.abspath(results_path),
+            output_format=output_format,
+            priority=priority,
+            rows_total=rows_total,
+            rows_done=0,
+            created_at=datetime.now().isoformat(),
+            owner_pid=os.getpid(),
+            content_hash=content_hash,
+            model_name=loaded.name,
+            model_version=loaded.version,
+            explanations=int(explain)
         )
-        thread.start()
+        
+        # Queue the job for the worker pool
+        try:
+            scheduler.submit(batch_id, run_batch, batch_id, current_app.config['JOB_STORE_URL'],
+                             os.path.abspath(file_path), os.path.abspath(results_path),
+                             loaded.path, current_app.config['BATCH_CHUNK_SIZE'], output_format,
+                             results_path + HISTORY_SUFFIX if current_app.config['HISTORY_INCLUDE_BATCHES'] else None,
+                             explain,
+                             os.path.abspath(os.path.join(current_app.config['PROFILE_DIR'], f"batch-{batch_id}.allocations.txt"))
+                             if current_app.config['BATCH_TRACK_MEMORY'] else None,
+                             priority=priority)
+        except QueueFull as e:
+            job_store.delete(batch_id)
+            os.remove(file_path)
+            response = jsonify({"error": str(e)})
+            response.headers['Retry-After'] = '30'
+            return response, 429
         
         # Return job ID
-        return jsonify({
+        job = job_store.get(batch_id)
+        response = {
             "batch_id": batch_id,
-            "status": "processing"
-        }), 202
+            "status": job["status"]
+        }
+        position = job_store.queue_position(batch_id)
+        if position is not None:
+            response["queue_position"] = position
+        return jsonify(response), 202
     
     except Exception as e:
         return jsonify({"error": f"Batch creation error: {str(e)}"}), 500
 
+def describe_batch(job):
+    """Public status of a batch job record"""
+    response = {
+        "batch_id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"]
+    }
+    
+    # Add queue position while waiting for a worker
+    if job["status"] == "queued":
+        position = job_store.queue_position(job["id"])
+        if position is not None:
+            response["queue_position"] = position
+    
+    # Add progress and timings once the job has started
+    for field in ("model_name", "model_version", "rows_done", "rows_total", "valid_rows",
+                  "started_at", "finished_at", "reused_from", "peak_memory_bytes"):
+        if job[field] is not None:
+            response[field] = job[field]
+    if job["explanations"]:
+        response["explanations"] = True
+    
+    # Add results URL if job is completed
+    if job["status"] == "completed":
+        response["results_url"] = url_for('api.download_batch_result', batch_id=job["id"], _external=True)
+    
+    # Add error if job failed
+    if job["status"] == "failed" and job["error"]:
+        response["error"] = job["error"]
+    
+    return response
+
 @api_bp.route('/batch/<batch_id>', methods=['GET'])
+@admitted('batch_status')
 def get_batch_status(batch_id):
     """Get status of a batch job"""
-    if batch_id not in batch_jobs:
+    job = job_store.get(batch_id)
+    if job is None:
         return jsonify({"error": "Batch job not found"}), 404
     
-    job = batch_jobs[batch_id]
+    return jsonify(describe_batch(job)), 200
+
+@api_bp.route('/batch/<batch_id>/events', methods=['GET'])
+@admitted('batch_events')
+def batch_event_stream(batch_id):
+    """Stream status changes and progress of a batch job as Server-Sent Events"""
+    if job_store.get(batch_id) is None:
+        return jsonify({"error": "Batch job not found"}), 404
     
-    response = {
-        "batch_id": batch_id,
-        "status": job["status"]
-    }
+    events = batch_events(
+        lambda: job_store.get(batch_id),
+        describe_batch,
+        poll_interval=current_app.config['BATCH_EVENTS_POLL_SECONDS'],
+        max_seconds=current_app.config['BATCH_EVENTS_MAX_SECONDS'],
+    )
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_bp.route('/batch/<batch_id>/cancel', methods=['POST'])
+@admitted('batch_status')
+def cancel_batch(batch_id):
+    """Cancel a queued or running batch job"""
+    job = job_store.get(batch_id)
+    if job is None:
+        return jsonify({"error": "Batch job not found"}), 404
     
-    # Add results URL if job is completed
-    if job["status"] == "completed" and "results_url" in job:
-        response["results_url"] = job["results_url"]
+    if job["status"] not in ACTIVE_STATUSES:
+        return jsonify({"error": f"Batch job already {job['status']}"}), 409
     
-    # Add error if job failed
-    if job["status"] == "failed" and "error" in job:
-        response["error"] = job["error"]
+    # Seen by the job wherever it runs, before it starts and between chunks
+    job_store.update(batch_id, cancel_requested=1)
     
-    return jsonify(response), 200
+    if scheduler.cancel(batch_id) == "queued":
+        # Never started, nothing left to stop. The scheduler has already
+        # recorded it as cancelled through batch_finished
+        os.remove(job["file_path"])
+        return jsonify({"batch_id": batch_id, "status": "cancelled"}), 200
+    
+    # The worker stops before its next chunk
+    return jsonify({"batch_id": batch_id, "status": "cancelling"}), 202
 
 @api_bp.route('/batch/<batch_id>/download', methods=['GET'])
+@admitted('batch_status')
 def download_batch_result(batch_id):
     """Download batch results"""
-    if batch_id not in batch_jobs:
+    job = job_store.get(batch_id)
+    if job is None:
         return jsonify({"error": "Batch job not found"}), 404
     
-    job = batch_jobs[batch_id]
+    if job["status"] == "expired":
+        return jsonify({"error": "Batch results have expired"}), 410
     
     if job["status"] != "completed":
         return jsonify({"error": "Batch job not completed"}), 400
     
-    results_path = os.path.join(current_app.config['RESULTS_FOLDER'], f"{batch_id}.xlsx")
+    results_path = job["results_path"]
     
     if not os.path.exists(results_path):
         return jsonify({"error": "Results file not found"}), 404
     
-    return send_from_directory(
-        current_app.config['RESULTS_FOLDER'],
-        f"{batch_id}.xlsx",
-        as_attachment=True,
-        download_name=f"employee_performance_batch_{batch_id}.xlsx"
-    )
+    writer = RESULT_WRITERS[job["output_format"] or 'xlsx']
+    download_name = f"employee_performance_batch_{batch_id}.{writer.extension.replace('.gz', '')}"
+    
+    if writer.gzipped and not request.accept_encodings['gzip']:
+        # Decompress on the fly for the rare client that cannot take gzip
+        return send_file(gzip.open(results_path, 'rb'), mimetype=writer.mimetype,
+                         as_attachment=True, download_name=download_name)
+    
+    # Conditional responses give clients ETag and Range support
+    response = send_file(results_path, mimetype=writer.mimetype, as_attachment=True,
+                         download_name=download_name, conditional=True)
+    if writer.gzipped:
+        # The stored file is the gzip encoding of the result
+        response.content_encoding = 'gzip'
+        response.vary.add('Accept-Encoding')
+    return response
+
+@api_bp.route('/models', methods=['GET'])
+@admitted('metadata')
+def list_models():
+    """Get the model artifacts and their state"""
+    registry.discover()
+    return jsonify({"default": registry.default, "models": registry.stats()})
+
+@api_bp.route('/models/<name>/reload', methods=['POST'])
+@admitted('operations')
+@admin_required
+def reload_model(name):
+    """Load a model artifact again and swap it in once it has passed a warm-up prediction"""
+    try:
+        loaded = registry.reload(name)
+    except UnknownModel as e:
+        return jsonify({"error": str(e)}), 404
+    except ModelUnavailable as e:
+        # The previous version, if any, stays in service
+        return jsonify({"error": str(e)}), 422
+    
+    return jsonify({
+        "model": loaded.name,
+        "model_version": loaded.version,
+        "loaded_at": loaded.loaded_at,
+        "load_ms": round(loaded.load_seconds * 1000.0, 1)
+    }), 200
+
+@api_bp.route('/debug/memory', methods=['GET'])
+@admitted('operations')
+@admin_required
+def debug_memory():
+    """Live chart figures, object counts by type and traced memory of this server process"""
+    return jsonify(dict(memory_stats(), profiles_written=profiler.written)), 200
+
+def cached_json(payload, etag, max_age):
+    """JSON response clients may keep for max_age seconds, then revalidate by ETag, a hash of the body by default"""
+    response = jsonify(payload)
+    if etag is None:
+        response.add_etag()
+    else:
+        response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
+
+def current_history():
+    """The history, with the records of batch jobs completed since the last check"""
+    if current_app.config['HISTORY_INCLUDE_BATCHES']:
+        history.refresh(job_store)
+    return history.data
+
+@api_bp.route('/history', methods=['GET'])
+@admitted('metadata')
+def history_records():
+    """Historical records filtered by team, department, date range and source"""
+    data = current_history()
+    args = request.args
+    
+    team = args.get('team')
+    if team is not None:
+        number = team[len("Team "):] if team.startswith("Team ") else ""
+        if not number.isdigit():
+            return jsonify({"error": "Invalid team format. Should be 'Team X'"}), 400
+        team = int(number)
+    
+    dates = {}
+    for key in ('start', 'end'):
+        if args.get(key):
+            try:
+                dates[key] = np.datetime64(args[key], 'D')
+            except ValueError:
+                return jsonify({"error": f"Invalid {key} date. Use YYYY-MM-DD"}), 400
+    
+    source = args.get('source')
+    if source is not None and source not in SOURCES:
+        return jsonify({"error": f"Invalid source. Use one of: {', '.join(SOURCES)}"}), 400
+    
+    max_records = current_app.config['HISTORY_MAX_RECORDS']
+    try:
+        limit = int(args.get('limit', 100))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        limit = offset = -1
+    if not 0 <= limit <= max_records or offset < 0:
+        return jsonify({"error": f"Limit must be from 0 to {max_records} and offset at least 0"}), 400
+    
+    with g.timer.stage("query"):
+        positions = data.select(team, args.get('department'), dates.get('start'), dates.get('end'), source)
+        response = {
+            "version": data.version,
+            "summary": data.summary(positions),
+            "offset": offset,
+            "records": data.records(positions[offset:offset + limit])
+        }
+    return cached_json(response, None, current_app.config['HISTORY_MAX_AGE_SECONDS'])
+
+@api_bp.route('/history/aggregates', methods=['GET'])
+@admitted('metadata')
+def history_aggregates():
+    """Productivity summaries per team, department, week or incentive band"""
+    data = current_history()
+    by = request.args.get('by', 'team')
+    if by not in GROUPINGS:
+        return jsonify({"error": f"Invalid grouping. Use one of: {', '.join(GROUPINGS)}"}), 400
+    source = request.args.get('source')
+    if source is not None and source not in SOURCES:
+        return jsonify({"error": f"Invalid source. Use one of: {', '.join(SOURCES)}"}), 400
+    
+    with g.timer.stage("aggregate"):
+        groups = data.aggregate(by, source)
+    return cached_json({"version": data.version, "by": by, "source": source, "groups": groups},
+                       f"{data.version}-{by}-{source}", current_app.config['HISTORY_MAX_AGE_SECONDS'])
 
 @api_bp.route('/meta/departments', methods=['GET'])
+@admitted('metadata')
 def list_departments():
-    """Get list of valid departments"""
-    return jsonify(["Sewing", "Finishing", "Cutting", "QC"])
+    """Get the departments a prediction accepts, the options of the prediction form"""
+    return cached_json(VALID_DEPARTMENTS, None, current_app.config['META_MAX_AGE_SECONDS'])
 
 @api_bp.route('/meta/teams', methods=['GET'])
+@admitted('metadata')
 def list_teams():
-    """Get list of valid teams"""
-    return jsonify(["Team 1", "Team 2", "Team 3", "Team 4", "Team 5"])
\ No newline at end of file
+    """Get the teams found in the history"""
+    data = current_history()
+    return cached_json([f"Team {team}" for team in data.teams], f"{data.version}-teams",
+                       current_app.config['META_MAX_AGE_SECONDS'])
\ No newline at end of file
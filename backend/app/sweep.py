@@ -0,0 +1,105 @@
+import numpy as np
+
+from app.features import FEATURE_NAMES, INCENTIVE_MAP, NUMERIC_FIELDS, VALID_INCENTIVE_LEVELS
+
+# Record fields a sweep can vary, with the model input column each one sets
+SWEEP_COLUMNS = {
+    "targeted_productivity": FEATURE_NAMES.index("targeted_productivity"),
+    "smv_minutes": FEATURE_NAMES.index("smv"),
+    "over_time_hours": FEATURE_NAMES.index("over_time"),
+    "incentive_level": FEATURE_NAMES.index("incentive"),
+    "idle_time_minutes": FEATURE_NAMES.index("idle_time"),
+    "idle_men_count": FEATURE_NAMES.index("idle_men"),
+    "style_change_count": FEATURE_NAMES.index("no_of_style_change"),
+    "worker_count": FEATURE_NAMES.index("no_of_workers"),
+}
+
+MAX_PARAMETERS = 2
+
+def parse_range(name, spec, max_points):
+    """
+    Values of one swept parameter, from an explicit list or an inclusive
+    start/stop range with a step or a number of points.
+
+    Returns (values, encoded) where encoded are the model input values.
+    Raises ValueError with a message for the client.
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"Range of {name} must be an object")
+
+    if name == "incentive_level":
+        values = spec.get("values", VALID_INCENTIVE_LEVELS)
+        if not isinstance(values, list) or not values or any(value not in VALID_INCENTIVE_LEVELS for value in values):
+            raise ValueError(f"Values of incentive_level must be a list of: {', '.join(VALID_INCENTIVE_LEVELS)}")
+        return list(values), np.array([INCENTIVE_MAP[value] for value in values], dtype=np.float64)
+
+    _, label, min_val, max_val, integer = next(field for field in NUMERIC_FIELDS if field[0] == name)
+    try:
+        if "values" in spec:
+            values = np.asarray(spec["values"], dtype=np.float64)
+            if values.ndim != 1 or len(values) == 0:
+                raise ValueError
+        else:
+            start, stop = float(spec["start"]), float(spec["stop"])
+            if "num" in spec:
+                num = int(spec["num"])
+                if not 1 <= num <= max_points:
+                    raise ValueError
+                values = np.linspace(start, stop, num)
+            else:
+                step = float(spec.get("step", 1))
+                if step <= 0 or stop < start or (stop - start) / step + 1 > max_points:
+                    raise ValueError
+                # Inclusive of stop, within rounding
+                values = np.arange(start, stop + step / 2, step)
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"Invalid range for {name}. Use 'values', or 'start' and 'stop' with 'step' or 'num'")
+
+    if not np.isfinite(values).all():
+        raise ValueError(f"{label} values must be numbers")
+    if len(values) > max_points:
+        raise ValueError(f"Too many values for {name}, the limit is {max_points}")
+    if min_val is not None and (values < min_val).any():
+        raise ValueError(f"{label} must be at least {min_val}")
+    if max_val is not None and (values > max_val).any():
+        raise ValueError(f"{label} must be at most {max_val}")
+
+    values = np.round(values, 6)
+    if integer or name == "over_time_hours":
+        # Encoded as integers, like prepare_model_input does
+        encoded = np.trunc(values)
+    else:
+        encoded = values
+    if integer:
+        values = encoded
+    return [int(value) if integer else float(value) for value in values], encoded
+
+def parse_sweep(sweep, max_points):
+    """Parse {field: range} into a list of (field, values, column, encoded)"""
+    if not isinstance(sweep, dict) or not 1 <= len(sweep) <= MAX_PARAMETERS:
+        raise ValueError(f"Sweep must name one or {MAX_PARAMETERS} parameters")
+
+    axes = []
+    for name, spec in sweep.items():
+        if name not in SWEEP_COLUMNS:
+            raise ValueError(f"Cannot sweep {name}. Use one of: {', '.join(SWEEP_COLUMNS)}")
+        values, encoded = parse_range(name, spec, max_points)
+        axes.append((name, values, SWEEP_COLUMNS[name], encoded))
+
+    points = int(np.prod([len(values) for _, values, _, _ in axes]))
+    if points > max_points:
+        raise ValueError(f"Sweep has {points} points, the limit is {max_points}")
+    return axes
+
+def sweep_grid(base_row, axes):
+    """
+    Model input for every combination of the swept values: the encoded base
+    record repeated, with the swept columns set. Rows run over the last
+    parameter fastest, so predictions reshape to the grid shape.
+    """
+    shape = tuple(len(encoded) for _, _, _, encoded in axes)
+    grid = np.tile(np.asarray(base_row, dtype=np.float64), (int(np.prod(shape)), 1))
+    mesh = np.meshgrid(*[encoded for _, _, _, encoded in axes], indexing='ij')
+    for (_, _, column, _), values in zip(axes, mesh):
+        grid[:, column] = values.ravel()
+    return grid, shape
@@ -0,0 +1,363 @@
+"""
+Training pipeline for the productivity models, the scripted form of
+`Machine Learning.ipynb`.
+
+The dataset is cleaned the way the notebook does it, encoded once into
+cached NumPy arrays, and every candidate of a hyperparameter grid is fitted
+and cross-validated in parallel across cores. Each candidate's inference
+latency and throughput is measured through the same compiled predictor the
+API uses, so a model can be picked by latency budget as well as by R².
+
+The chosen models are written as model_<name>.pkl next to a
+model_<name>.report.json, and re-exported as array artifacts when an export
+exists. Run from the backend directory:
+
+    python -m app.training
+    python -m app.training --models rf --latency-budget-ms 0.5 --export
+    python -m app.training --incremental   # after rows were appended to the dataset
+"""
+import argparse
+import hashlib
+import io
+import itertools
+import json
+import os
+import pickle
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app.artifacts import artifact_version, export_model
+from app.features import DEPARTMENT_MAP, FEATURE_NAMES, INCENTIVE_MAP
+from app.history import incentive_band
+from app.inference import CompiledForest, compile_model
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_PATH = os.path.join(BACKEND_DIR, 'content', 'garments_worker_productivity.csv')
+CACHE_DIR = os.path.join(BACKEND_DIR, '.training_cache')
+
+# Bumped whenever clean_dataset changes, so arrays cleaned the old way are not reused
+CLEANING_VERSION = 2
+
+TARGET = 'actual_productivity'
+
+# Category codes the notebook's MultiColumnLabelEncoder is seeded with. They
+# are the codes app.features gives requests, instead of the encoder's own
+# order of first appearance, so the categories agree between training and
+# serving. Numeric columns in other units are converted by clean_dataset.
+CATEGORY_CODES = {
+    'quarter': {f'Quarter{i}': i for i in range(1, 6)},
+    'department': {'sweing': DEPARTMENT_MAP['Sewing'], 'finishing': DEPARTMENT_MAP['Finishing']},
+    'day': {day: i for i, day in enumerate(
+        ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], start=1)},
+}
+
+# Hyperparameter grid of each model family
+PARAM_GRIDS = {
+    'lr': {},
+    'rf': {'n_estimators': [50, 100, 200], 'max_depth': [5, 8, 12]},
+    'xgb': {'n_estimators': [100, 200], 'max_depth': [3, 5], 'learning_rate': [0.05, 0.1]},
+}
+
+def make_estimator(family, params, seed):
+    """An unfitted estimator of a model family, one thread each as candidates run in parallel"""
+    if family == 'lr':
+        from sklearn.linear_model import LinearRegression
+        return LinearRegression(**params)
+    if family == 'rf':
+        from sklearn.ensemble import RandomForestRegressor
+        return RandomForestRegressor(random_state=seed, n_jobs=1, **params)
+    if family == 'xgb':
+        import xgboost as xgb
+        return xgb.XGBRegressor(random_state=seed, n_jobs=1, **params)
+    raise ValueError(f"Unknown model family {family}")
+
+def available_families():
+    """Model families whose libraries are installed"""
+    families = ['lr', 'rf']
+    try:
+        import xgboost  # noqa: F401
+        families.append('xgb')
+    except ImportError:
+        pass
+    return families
+
+def clean_dataset(data):
+    """
+    The notebook's cleaning steps: drop wip, replace the date by its month,
+    normalize the department spellings and label-encode the text columns.
+    Overtime and incentives are converted to the units requests use.
+    Returns the features in FEATURE_NAMES order and the target.
+    """
+    import pandas as pd
+    from MultiColumnLabelEncoder import MultiColumnLabelEncoder
+
+    data = data.drop(['wip'], axis=1)
+    data['month'] = pd.to_datetime(data['date'], format='%m/%d/%Y').dt.month
+    data = data.drop(['date'], axis=1)
+    data['department'] = data['department'].apply(lambda x: 'finishing' if x.replace(" ", "") == 'finishing' else 'sweing')
+
+    # The dataset has the team's overtime in minutes and incentive amounts.
+    # Requests give whole overtime hours per worker and an incentive level,
+    # the level of an amount is its history.INCENTIVE_BANDS band.
+    data['over_time'] = np.trunc(data['over_time'] / 60.0 / data['no_of_workers'])
+    data['incentive'] = pd.Series(incentive_band(data['incentive']), index=data.index).map(INCENTIVE_MAP)
+
+    encoder = MultiColumnLabelEncoder()
+    encoder.encoding_params = CATEGORY_CODES
+    data = encoder.fit_transform(data, columns=list(CATEGORY_CODES))
+    unknown = data[list(CATEGORY_CODES)].isna().any()
+    if unknown.any():
+        raise ValueError(f"Unknown categories in columns: {', '.join(unknown[unknown].index)}")
+
+    X = data[FEATURE_NAMES].to_numpy(dtype=np.float64)
+    y = data[TARGET].to_numpy(dtype=np.float64)
+    return X, y
+
+def cached_arrays_folder(cache_dir, digest):
+    """Folder of the cleaned arrays of the dataset with this SHA-256"""
+    return os.path.join(cache_dir, f"{digest[:16]}-v{CLEANING_VERSION}")
+
+def load_arrays(dataset_path=DATASET_PATH, cache_dir=CACHE_DIR, incremental=False):
+    """
+    The cleaned dataset as (X, y, info), cached as .npy files by content hash.
+
+    With incremental, when the dataset starts with the bytes cached last
+    time, only the appended rows are cleaned and added to the cached arrays.
+    Rows are encoded independently of each other, so the result is the same
+    as cleaning the whole file.
+    """
+    import pandas as pd
+
+    with open(dataset_path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    folder = cached_arrays_folder(cache_dir, digest)
+    state_path = os.path.join(cache_dir, 'state.json')
+    info = {"path": os.path.abspath(dataset_path), "sha256": digest, "bytes": len(content)}
+
+    if os.path.exists(os.path.join(folder, 'y.npy')):
+        X, y = np.load(os.path.join(folder, 'X.npy')), np.load(os.path.join(folder, 'y.npy'))
+        return X, y, dict(info, rows=len(y), cached=True)
+
+    state = None
+    if incremental and os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        previous = cached_arrays_folder(cache_dir, state["sha256"])
+        if (len(content) <= state["bytes"] or not os.path.exists(os.path.join(previous, 'y.npy'))
+                or hashlib.sha256(content[:state["bytes"]]).hexdigest() != state["sha256"]):
+            state = None
+
+    if state is not None:
+        header = content[:content.index(b'\n') + 1]
+        X_new, y_new = clean_dataset(pd.read_csv(io.BytesIO(header + content[state["bytes"]:])))
+        X = np.concatenate([np.load(os.path.join(previous, 'X.npy')), X_new])
+        y = np.concatenate([np.load(os.path.join(previous, 'y.npy')), y_new])
+        info["appended_rows"] = len(y_new)
+    else:
+        X, y = clean_dataset(pd.read_csv(io.BytesIO(content)))
+
+    os.makedirs(folder, exist_ok=True)
+    np.save(os.path.join(folder, 'X.npy'), X)
+    np.save(os.path.join(folder, 'y.npy'), y)
+    with open(state_path, 'w') as f:
+        json.dump(info, f)
+    return X, y, dict(info, rows=len(y), cached=False)
+
+def expand_grid(grid):
+    """Every combination of a parameter grid, as a list of dicts"""
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def fit_candidate(family, params, arrays_folder, train, test, folds, seed):
+    """
+    Cross-validate one candidate on the training rows, then fit it on them
+    and score the test rows. Runs in a worker process that maps the cached
+    arrays instead of receiving a copy.
+    """
+    from sklearn.base import clone
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+    from sklearn.model_selection import KFold, cross_val_score
+
+    X = np.load(os.path.join(arrays_folder, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(arrays_folder, 'y.npy'), mmap_mode='r')
+    X_train, y_train = np.asarray(X[train]), np.asarray(y[train])
+    estimator = make_estimator(family, params, seed)
+    cv_scores = cross_val_score(clone(estimator), X_train, y_train, scoring='r2',
+                                cv=KFold(folds, shuffle=True, random_state=seed))
+    estimator.fit(X_train, y_train)
+    predictions = estimator.predict(np.asarray(X[test]))
+    return estimator, {
+        "cv_r2": float(np.mean(cv_scores)),
+        "test_r2": float(r2_score(y[test], predictions)),
+        "test_mse": float(mean_squared_error(y[test], predictions)),
+        "test_mae": float(mean_absolute_error(y[test], predictions)),
+    }
+
+def measure_latency(model, X, single_rows=300, batch_rows=100000):
+    """Single-row latency percentiles and batch throughput through the API's compiled predictor"""
+    compiled = compile_model(model)
+    rows = np.asarray(X[np.arange(single_rows) % len(X)], dtype=np.float64)
+    for row in rows[:20]:
+        compiled.predict(row[None])
+    timings = []
+    for row in rows:
+        started = time.perf_counter()
+        compiled.predict(row[None])
+        timings.append(time.perf_counter() - started)
+    batch = np.asarray(X[np.arange(batch_rows) % len(X)], dtype=np.float64)
+    started = time.perf_counter()
+    compiled.predict(batch)
+    seconds = time.perf_counter() - started
+    timings = np.array(timings) * 1000.0
+    size = {}
+    if isinstance(compiled, CompiledForest):
+        size = {"trees": int(len(compiled.roots)), "nodes": int(len(compiled.feature))}
+    return {
+        "single_row_ms": {"p50": round(float(np.percentile(timings, 50)), 4),
+                          "p99": round(float(np.percentile(timings, 99)), 4)},
+        "batch_rows_per_second": round(batch_rows / seconds, 1),
+    }, size
+
+def choose(candidates, latency_budget_ms):
+    """Best cross-validated candidate within the single-row p99 latency budget"""
+    eligible = [c for c in candidates
+                if latency_budget_ms is None or c["latency"]["single_row_ms"]["p99"] <= latency_budget_ms]
+    if not eligible:
+        return None
+    return max(eligible, key=lambda c: c["metrics"]["cv_r2"])
+
+def write_atomic(path, data):
+    """Write bytes to path through a temporary file, so a hot reload never sees half a file"""
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+def reload_model(server_url, name):
+    """Ask a running API to hot reload a model, with the ADMIN_TOKEN of this environment"""
+    from urllib.error import HTTPError, URLError
+    from urllib.request import Request, urlopen
+
+    request = Request(f"{server_url.rstrip('/')}/api/models/{name}/reload", method='POST',
+                      headers={'X-Admin-Token': os.environ.get('ADMIN_TOKEN', '')})
+    try:
+        with urlopen(request, timeout=60) as response:
+            print(f"Reloaded {name} on {server_url}: {json.load(response)}")
+    except (HTTPError, URLError) as e:
+        print(f"Could not reload {name} on {server_url}: {e}")
+
+def train(families, dataset_path=DATASET_PATH, output=BACKEND_DIR, cache_dir=CACHE_DIR, jobs=-1, seed=42,
+          test_size=0.2, folds=5, latency_budget_ms=None, grids=None, incremental=False, export=False):
+    """
+    Search, fit and write the models of the given families. Returns the
+    reports written, one per model.
+    """
+    import sklearn
+    from joblib import Parallel, delayed
+    from sklearn.model_selection import train_test_split
+
+    grids = dict(PARAM_GRIDS, **(grids or {}))
+    X, y, dataset = load_arrays(dataset_path, cache_dir, incremental)
+    arrays_folder = cached_arrays_folder(cache_dir, dataset["sha256"])
+    train_rows, test_rows = train_test_split(np.arange(len(y)), test_size=test_size, random_state=seed)
+    print(f"Dataset: {dataset['rows']} rows"
+          + (f", {dataset['appended_rows']} appended" if "appended_rows" in dataset else "")
+          + (" (cached arrays)" if dataset["cached"] else ""))
+
+    # With incremental, a model keeps the parameters chosen by its last search
+    searches = {}
+    for family in families:
+        report_path = os.path.join(output, f"model_{family}.report.json")
+        if incremental and os.path.exists(report_path):
+            with open(report_path) as f:
+                searches[family] = [json.load(f)["params"]]
+        else:
+            searches[family] = expand_grid(grids[family])
+
+    tasks = [(family, params) for family in families for params in searches[family]]
+    print(f"Fitting {len(tasks)} candidates on {jobs if jobs > 0 else os.cpu_count()} cores")
+    fitted = Parallel(n_jobs=jobs)(
+        delayed(fit_candidate)(family, params, arrays_folder, train_rows, test_rows, folds, seed)
+        for family, params in tasks
+    )
+
+    # Latency is measured one candidate at a time, so the timings do not compete for cores
+    candidates = {family: [] for family in families}
+    for (family, params), (estimator, metrics) in zip(tasks, fitted):
+        latency, size = measure_latency(estimator, X)
+        candidates[family].append({"params": params, "metrics": metrics, "latency": latency, "size": size})
+        print(f"{family:>4} {json.dumps(params):<58} cv R² {metrics['cv_r2']:.4f}  test R² {metrics['test_r2']:.4f}"
+              f"  p99 {latency['single_row_ms']['p99']:.3f} ms  {latency['batch_rows_per_second']:>12,.0f} rows/s")
+
+    versions = {"numpy": np.__version__, "scikit-learn": sklearn.__version__}
+    if 'xgb' in families:
+        import xgboost
+        versions["xgboost"] = xgboost.__version__
+
+    reports = []
+    for family in families:
+        chosen = choose(candidates[family], latency_budget_ms)
+        if chosen is None:
+            print(f"No {family} candidate is within the latency budget of {latency_budget_ms} ms, not written")
+            continue
+
+        # The artifact is fitted on every row, with the same seed, so the same
+        # data and parameters give the same file
+        model = make_estimator(family, chosen["params"], seed).fit(X, y)
+        path = os.path.join(output, f"model_{family}.pkl")
+        write_atomic(path, pickle.dumps(model, protocol=4))
+        version = artifact_version(path)
+        exported = os.path.join(output, f"model_{family}")
+        if export or os.path.isdir(exported):
+            # An existing export would otherwise keep serving the old model
+            export_model(compile_model(model), exported, version=version)
+
+        latency, size = measure_latency(model, X)
+        report = {
+            "model": family,
+            "version": version,
+            "estimator": type(model).__name__,
+            "params": chosen["params"],
+            "trained_at": datetime.now().isoformat(timespec='seconds'),
+            "seed": seed,
+            "dataset": {key: dataset[key] for key in ("path", "sha256", "rows")},
+            "metrics": chosen["metrics"],
+            "latency": latency,
+            "size": dict(size, pickle_bytes=os.path.getsize(path)),
+            "latency_budget_ms": latency_budget_ms,
+            "library_versions": versions,
+            "candidates": candidates[family],
+        }
+        with open(os.path.join(output, f"model_{family}.report.json"), 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {path} (version {version}, {json.dumps(chosen['params'])})")
+        reports.append(report)
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='+', default=available_families(), choices=list(PARAM_GRIDS))
+    parser.add_argument('--dataset', default=DATASET_PATH)
+    parser.add_argument('--output', default=BACKEND_DIR, help="Folder the artifacts and reports are written to")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="Cleaned dataset arrays, by content hash")
+    parser.add_argument('--jobs', type=int, default=-1, help="Candidates fitted at once, -1 for every core")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--latency-budget-ms', type=float, help="Max single-row p99 latency of a chosen model")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Clean only appended rows and refit with the last chosen parameters")
+    parser.add_argument('--export', action='store_true', help="Also write model_<name>/ array artifacts")
+    parser.add_argument('--reload', metavar='URL', help="Hot reload the models on a running API afterwards")
+    args = parser.parse_args()
+
+    reports = train(args.models, args.dataset, args.output, args.cache_dir, args.jobs, args.seed,
+                    folds=args.folds, latency_budget_ms=args.latency_budget_ms,
+                    incremental=args.incremental, export=args.export)
+    if args.reload:
+        for report in reports:
+            reload_model(args.reload, report["model"])
+
+if __name__ == "__main__":
+    main()
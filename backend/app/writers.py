@@ -0,0 +1,197 @@
+import gzip
+import os
+
+# Rows per worksheet, including the header
+XLSX_MAX_ROWS = 1048576
+
+# Text results are stored gzip-compressed and served with Content-Encoding: gzip
+GZIP_LEVEL = 6
+
+class ResultWriter:
+    """
+    Writes a batch result table one chunk at a time.
+
+    Used as a context manager: the file is finished on a clean exit and
+    removed if the job fails or is cancelled part way.
+    """
+
+    extension = None
+    mimetype = None
+    # True when the file on disk is the gzip-encoded form of the format
+    gzipped = False
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+
+    def write(self, df):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class CsvResultWriter(ResultWriter):
+    """Comma separated values, gzip-compressed on disk"""
+
+    extension = 'csv.gz'
+    mimetype = 'text/csv'
+    gzipped = True
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = gzip.open(path, 'wt', compresslevel=GZIP_LEVEL, newline='')
+
+    def write(self, df):
+        df.to_csv(self.file, header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        self.file.close()
+
+    def discard(self):
+        self.file.close()
+        super().discard()
+
+class NdjsonResultWriter(CsvResultWriter):
+    """One JSON object per line, gzip-compressed on disk"""
+
+    extension = 'ndjson.gz'
+    mimetype = 'application/x-ndjson'
+
+    def write(self, df):
+        if len(df):
+            lines = df.to_json(orient='records', lines=True, double_precision=15)
+            self.file.write(lines if lines.endswith("\n") else lines + "\n")
+        self.rows += len(df)
+
+class ParquetResultWriter(ResultWriter):
+    """
+    Apache Parquet file with one row group per chunk. Needs pyarrow, which is
+    imported only when this format is used.
+
+    The schema is fixed by the first chunk: numeric columns are stored as
+    doubles and all others as strings. A value that does not fit, such as
+    text in a numeric column of a later chunk, is written as null. The errors
+    column reports those rows.
+    """
+
+    extension = 'parquet'
+    mimetype = 'application/vnd.apache.parquet'
+
+    def __init__(self, path):
+        super().__init__(path)
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.writer = None
+
+    def _conform(self, df):
+        import pandas as pd
+        columns = {}
+        for field in self.writer.schema:
+            column = df[field.name] if field.name in df.columns else pd.Series(None, index=df.index, dtype=object)
+            if self.pa.types.is_floating(field.type):
+                columns[field.name] = pd.to_numeric(column, errors='coerce').astype(float)
+            else:
+                columns[field.name] = column.where(column.isna(), column.astype(str))
+        return self.pa.Table.from_pydict(
+            {name: self.pa.array(column, type=field.type, from_pandas=True)
+             for (name, column), field in zip(columns.items(), self.writer.schema)},
+            schema=self.writer.schema,
+        )
+
+    def write(self, df):
+        pa = self.pa
+        if self.writer is None:
+            schema = pa.schema([
+                (str(name), pa.float64() if dtype.kind in 'iufb' else pa.string())
+                for name, dtype in df.dtypes.items()
+            ])
+            self.writer = pa.parquet.ParquetWriter(self.path, schema)
+        self.writer.write_table(self._conform(df))
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is None:
+            self.pa.parquet.write_table(self.pa.table({}), self.path)
+        else:
+            self.writer.close()
+
+    def discard(self):
+        if self.writer is not None:
+            self.writer.close()
+        super().discard()
+
+class XlsxResultWriter(ResultWriter):
+    """
+    Excel workbook in openpyxl's write-only mode, which streams rows to a
+    temporary file instead of keeping the sheet in memory. Results longer
+    than one sheet continue on Sheet2, Sheet3 and so on.
+    """
+
+    extension = 'xlsx'
+    mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    def __init__(self, path):
+        super().__init__(path)
+        from openpyxl import Workbook
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+        self.sheet_rows = 0
+
+    def _new_sheet(self, columns):
+        self.sheet = self.workbook.create_sheet(f"Sheet{len(self.workbook.sheetnames) + 1}")
+        self.sheet.append(list(columns))
+        self.sheet_rows = 1
+
+    def write(self, df):
+        # Empty cells for missing values, as DataFrame.to_excel writes them
+        values = df.astype(object).where(df.notna(), None)
+        if self.sheet is None:
+            self._new_sheet(df.columns)
+        for row in values.itertuples(index=False, name=None):
+            if self.sheet_rows >= XLSX_MAX_ROWS:
+                self._new_sheet(df.columns)
+            self.sheet.append(row)
+            self.sheet_rows += 1
+        self.rows += len(df)
+
+    def close(self):
+        if self.sheet is None:
+            self._new_sheet([])
+        self.workbook.save(self.path)
+
+    def discard(self):
+        self.workbook.close()
+        super().discard()
+
+# Output formats accepted by /api/batch
+RESULT_WRITERS = {
+    'xlsx': XlsxResultWriter,
+    'csv': CsvResultWriter,
+    'ndjson': NdjsonResultWriter,
+    'parquet': ParquetResultWriter,
+}
+
+def available_formats():
+    """Output formats usable in this installation"""
+    formats = list(RESULT_WRITERS)
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        formats.remove('parquet')
+    return formats
@@ -0,0 +1,371 @@
+"""
+API load test: latency percentiles and throughput of /api/predict (with and
+without visualizations), /api/predict/bulk and batch jobs, with requests
+resampled from the bundled productivity dataset (see workload.py).
+
+The app is driven in-process through Flask's test client, or with --gunicorn
+through a local gunicorn started with gunicorn.conf.py. Results are saved as
+JSON; --compare reports the change against an earlier run and exits with 1
+when a scenario got slower than --tolerance allows.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_api
+    python -m benchmarks.bench_api --gunicorn --concurrency 8
+    python -m benchmarks.bench_api --batch-rows 1000 100000 1000000 --compare benchmarks/results/before.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+import numpy as np
+
+from benchmarks.workload import load_records, sample_payloads, write_batch_csv
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+
+class InProcessClient:
+    """
+    Requests through Flask's test client, one client per thread. Responses
+    are closed once read, which releases their admission slot.
+    """
+
+    def __init__(self):
+        from app.app import create_app
+        self.app = create_app()
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def get(self, path):
+        with self._client().get(path) as response:
+            return response.status_code, response.data
+
+    def post_json(self, path, payload):
+        with self._client().post(path, json=payload) as response:
+            return response.status_code, response.data
+
+    def post_file(self, path, file_path, fields):
+        with open(file_path, 'rb') as f, \
+                self._client().post(path, data=dict(fields, file=(f, os.path.basename(file_path)))) as response:
+            return response.status_code, response.data
+
+    def close(self):
+        import app.routes
+        app.routes.scheduler.shutdown()
+
+class HttpClient:
+    """Requests over HTTP to a local server, one keep-alive connection per thread"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._local = threading.local()
+
+    def _request(self, method, path, body=None, headers=None):
+        for attempt in range(2):
+            if not hasattr(self._local, 'connection'):
+                self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=600)
+            connection = self._local.connection
+            try:
+                connection.request(method, path, body=body, headers=headers or {})
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (ConnectionError, http.client.HTTPException):
+                # The server closed the idle connection, retry once on a new one
+                connection.close()
+                del self._local.connection
+                if attempt:
+                    raise
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post_json(self, path, payload):
+        return self._request('POST', path, json.dumps(payload).encode(), {'Content-Type': 'application/json'})
+
+    def post_file(self, path, file_path, fields):
+        # Multipart body streamed from disk, large uploads are not read into memory
+        boundary = uuid.uuid4().hex
+        head = "".join(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+                       for name, value in fields.items())
+        head += (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+                 f'filename="{os.path.basename(file_path)}"\r\nContent-Type: text/csv\r\n\r\n')
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+        head = head.encode()
+
+        def body():
+            yield head
+            with open(file_path, 'rb') as f:
+                while True:
+                    block = f.read(1024 * 1024)
+                    if not block:
+                        break
+                    yield block
+            yield tail
+
+        length = len(head) + os.path.getsize(file_path) + len(tail)
+        return self._request('POST', path, body(), {
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+            'Content-Length': str(length),
+        })
+
+    def close(self):
+        pass
+
+def start_gunicorn(workers):
+    """A gunicorn running main:app with gunicorn.conf.py on a free local port"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, BIND=f'127.0.0.1:{port}', WEB_CONCURRENCY=str(workers))
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'main:app'],
+                               cwd=BACKEND_DIR, env=env)
+    client = HttpClient('127.0.0.1', port)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            if client.get('/api/health')[0] == 200:
+                return process, client
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not answer /api/health within 60 seconds")
+
+def summarize(latencies, errors, seconds, rows=None):
+    """Latency percentiles in ms and throughput of one scenario"""
+    latencies_ms = np.array(latencies) * 1000.0
+    summary = {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "requests_per_second": round(len(latencies) / seconds, 1) if seconds else None,
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 3),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p90": round(float(np.percentile(latencies_ms, 90)), 3),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3),
+            "max": round(float(latencies_ms.max()), 3),
+        },
+    }
+    if rows is not None:
+        summary["rows_per_second"] = round(rows / seconds, 1) if seconds else None
+    return summary
+
+def run_requests(send, payloads, concurrency):
+    """Send every payload, concurrency at a time. Returns the latencies, the error count and the wall time"""
+    def timed(payload):
+        started = time.perf_counter()
+        ok = send(payload)
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(timed, payloads))
+    else:
+        results = [timed(payload) for payload in payloads]
+    seconds = time.perf_counter() - started
+    return [latency for latency, _ in results], sum(1 for _, ok in results if not ok), seconds
+
+def bench_predict(client, payloads, concurrency, warmup, visualizations=False):
+    """Single predictions; with visualizations every returned chart is fetched as well"""
+    path = '/api/predict' + ('?' + urlencode({'visualizations': 'true'}) if visualizations else '')
+
+    def send(payload):
+        status, body = client.post_json(path, payload)
+        if status != 200:
+            return False
+        for url in json.loads(body).get("visualizations", {}).values():
+            parts = urlsplit(url)
+            if client.get(parts.path)[0] != 200:
+                return False
+        return True
+
+    run_requests(send, payloads[:warmup], concurrency)
+    return summarize(*run_requests(send, payloads[warmup:], concurrency))
+
+def bench_bulk(client, payloads, bulk_size, concurrency):
+    """/api/predict/bulk with bulk_size records per request"""
+    bodies = [payloads[start:start + bulk_size] for start in range(0, len(payloads), bulk_size)]
+
+    def send(records):
+        status, body = client.post_json('/api/predict/bulk', records)
+        return status == 200 and json.loads(body)["valid"] == len(records)
+
+    send(bodies[0])
+    latencies, errors, seconds = run_requests(send, bodies, concurrency)
+    return dict(summarize(latencies, errors, seconds, rows=sum(len(body) for body in bodies)),
+                records_per_request=bulk_size)
+
+def bench_batch(client, n_rows, seed, output_format, folder):
+    """One batch job of n_rows rows, from upload to a completed result"""
+    file_path = write_batch_csv(os.path.join(folder, f'bench_{n_rows}.csv'), n_rows, seed)
+    started = time.perf_counter()
+    status, body = client.post_file('/api/batch', file_path, {'output_format': output_format})
+    uploaded = time.perf_counter()
+    job = json.loads(body)
+    if status != 202:
+        raise RuntimeError(f"Batch upload of {n_rows} rows failed with {status}: {job}")
+
+    while job["status"] not in ("completed", "failed", "cancelled", "expired"):
+        time.sleep(0.05)
+        job = json.loads(client.get(f'/api/batch/{job["batch_id"]}')[1])
+    seconds = time.perf_counter() - started
+    os.remove(file_path)
+    return {
+        "rows": n_rows,
+        "status": job["status"],
+        # A rerun with the same --seed uploads the same file and gets the earlier result
+        "deduplicated": "reused_from" in job,
+        "upload_seconds": round(uploaded - started, 3),
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(n_rows / seconds, 1),
+    }
+
+# Metric of each scenario checked by --compare, and whether higher is better
+COMPARED = (
+    (("latency_ms", "p50"), False),
+    (("latency_ms", "p99"), False),
+    (("requests_per_second",), True),
+    (("rows_per_second",), True),
+)
+
+def compare(results, baseline, tolerance):
+    """Print the change of every scenario against a baseline run, return the number of regressions"""
+    regressions = 0
+    for key in ("server", "cpu_count", "commit"):
+        if results["meta"].get(key) != baseline["meta"].get(key):
+            print(f"Note: {key} differs, baseline {baseline['meta'].get(key)}, now {results['meta'].get(key)}")
+    if results["meta"]["args"] != baseline["meta"]["args"]:
+        print("Note: the runs used different arguments")
+    print(f"\n{'scenario':>28} {'metric':>22} {'baseline':>12} {'now':>12} {'change':>8}")
+    for scenario, current in results["scenarios"].items():
+        before = baseline["scenarios"].get(scenario)
+        if before is None:
+            continue
+        for keys, higher_is_better in COMPARED:
+            old, new = before, current
+            for key in keys:
+                old = old.get(key) if isinstance(old, dict) else None
+                new = new.get(key) if isinstance(new, dict) else None
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = " REGRESSION" if worse > tolerance else ""
+            regressions += bool(flag)
+            print(f"{scenario:>28} {'.'.join(keys):>22} {old:>12.1f} {new:>12.1f} {change:>+8.1%}{flag}")
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gunicorn', action='store_true', help="Drive a local gunicorn instead of the test client")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="gunicorn workers")
+    parser.add_argument('--requests', type=int, default=2000, help="/api/predict requests per scenario")
+    parser.add_argument('--visualization-requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=1, help="Requests in flight at once")
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--bulk-size', type=int, default=1000, help="Records per /api/predict/bulk request")
+    parser.add_argument('--bulk-requests', type=int, default=20)
+    parser.add_argument('--batch-rows', type=int, nargs='*', default=[1000, 100000, 1000000])
+    parser.add_argument('--batch-format', default='csv', help="Result format of the batch jobs")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Workload seed, a new one per run unless given so batch uploads are not deduplicated")
+    parser.add_argument('--output', help="Results file, benchmarks/results/api-<time>.json by default")
+    parser.add_argument('--compare', metavar='BASELINE', help="Earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed slowdown before a regression")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else int(time.time())
+    records = load_records()
+    payloads = sample_payloads(args.warmup + args.requests, seed, records=records)
+    bulk_payloads = sample_payloads(args.bulk_size * args.bulk_requests, seed + 1, records=records)
+    visualization_payloads = sample_payloads(args.warmup + args.visualization_requests, seed + 2, records=records)
+
+    process = None
+    if args.gunicorn:
+        process, client = start_gunicorn(args.workers)
+    else:
+        client = InProcessClient()
+
+    scenarios = {}
+    try:
+        print(f"Driving {'gunicorn with %d workers' % args.workers if args.gunicorn else 'the Flask test client'}, "
+              f"concurrency {args.concurrency}, seed {seed}")
+        scenarios["predict"] = bench_predict(client, payloads, args.concurrency, args.warmup)
+        print("predict", scenarios["predict"]["latency_ms"], scenarios["predict"]["requests_per_second"], "req/s")
+        scenarios["predict_visualizations"] = bench_predict(
+            client, visualization_payloads, args.concurrency, args.warmup, visualizations=True)
+        print("predict_visualizations", scenarios["predict_visualizations"]["latency_ms"],
+              scenarios["predict_visualizations"]["requests_per_second"], "req/s")
+        if args.bulk_requests:
+            scenarios["predict_bulk"] = bench_bulk(client, bulk_payloads, args.bulk_size, args.concurrency)
+            print("predict_bulk", scenarios["predict_bulk"]["latency_ms"],
+                  scenarios["predict_bulk"]["rows_per_second"], "rows/s")
+        with tempfile.TemporaryDirectory() as folder:
+            for n_rows in args.batch_rows:
+                name = f"batch_{n_rows}"
+                scenarios[name] = bench_batch(client, n_rows, seed, args.batch_format, folder)
+                print(name, scenarios[name])
+    finally:
+        client.close()
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    results = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec='seconds'),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "server": "gunicorn" if args.gunicorn else "test_client",
+            "seed": seed,
+            "args": {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'seed')},
+        },
+        "scenarios": scenarios,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"api-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{regressions} regressions beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
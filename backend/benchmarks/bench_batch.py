@@ -0,0 +1,135 @@
+"""
+Batch engine benchmark: rows/sec of the former per-row loop against the
+columnar predict_frame path.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_batch --rows 1000 10000 100000
+"""
+import argparse
+import os
+import pickle
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from app.batch import DEFAULT_CHUNK_SIZE, predict_chunk
+from app.features import validate_input, prepare_model_input, get_productivity_category
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'model_rf.pkl')
+
+def make_batch_frame(n_rows, invalid_ratio=0.05, seed=0):
+    """Build a synthetic batch upload with a share of invalid rows"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2015-01-01", "2015-03-31").strftime("%Y-%m-%d").to_numpy()
+    df = pd.DataFrame({
+        'date': rng.choice(dates, n_rows),
+        'department': rng.choice(["Sewing", "Finishing"], n_rows),
+        'team': rng.choice([f"Team {i}" for i in range(1, 13)], n_rows),
+        'targeted_productivity': rng.choice([0.35, 0.5, 0.6, 0.65, 0.7, 0.75, 0.8], n_rows),
+        'smv_minutes': rng.uniform(2.9, 54.6, n_rows).round(2),
+        'over_time_hours': rng.integers(0, 9, n_rows),
+        'incentive_level': rng.choice(["None", "Low", "Standard", "High"], n_rows),
+        'idle_time_minutes': rng.choice([0, 0, 0, 2, 5, 30], n_rows),
+        'idle_men_count': rng.choice([0, 0, 0, 10, 15], n_rows),
+        'style_change_count': rng.integers(0, 3, n_rows),
+        'worker_count': rng.integers(2, 90, n_rows),
+    })
+    invalid = rng.random(n_rows) < invalid_ratio
+    df.loc[invalid, 'department'] = "Packing"
+    df.loc[invalid, 'targeted_productivity'] = 200
+    return df
+
+def predict_frame(df, model, chunk_size=DEFAULT_CHUNK_SIZE, cache=None, model_version=None):
+    """
+    Score a whole batch DataFrame with one model.predict call per chunk.
+
+    Produces the same result table as the former per-row loop: the input
+    columns followed by actual_productivity, category and, when any row
+    failed validation, errors. The server streams batches through
+    run_batch instead, this in-memory version is kept as a reference.
+    """
+    results = df.copy()
+    predictions = np.full(len(df), np.nan)
+    categories = np.empty(len(df), dtype=object)
+    errors = np.empty(len(df), dtype=object)
+
+    for start in range(0, len(df), chunk_size):
+        stop = min(start + chunk_size, len(df))
+        chunk = df.iloc[start:stop]
+        predictions[start:stop], categories[start:stop], errors[start:stop] = predict_chunk(
+            chunk, model, cache, model_version)
+
+    results["actual_productivity"] = predictions
+    results["category"] = categories
+    invalid = errors != ""
+    if invalid.any():
+        results["errors"] = np.where(invalid, errors, None)
+
+    return results
+
+def legacy_predict_frame(df, model):
+    """The per-row iterrows/pd.concat loop process_batch used to run"""
+    warnings.simplefilter("ignore", FutureWarning)
+    results = pd.DataFrame()
+    for _, row in df.iterrows():
+        data = {key: row.get(key) for key in [
+            'date', 'department', 'team', 'targeted_productivity', 'smv_minutes',
+            'over_time_hours', 'incentive_level', 'idle_time_minutes',
+            'idle_men_count', 'style_change_count', 'worker_count']}
+        is_valid, errors, validated_data = validate_input(data)
+        row_result = row.copy()
+        if is_valid:
+            productivity = model.predict(prepare_model_input(validated_data))[0]
+            row_result['actual_productivity'] = productivity
+            row_result['category'] = get_productivity_category(productivity)
+        else:
+            row_result['actual_productivity'] = None
+            row_result['category'] = 'Invalid input data'
+            row_result['errors'] = '; '.join(errors)
+        results = pd.concat([results, pd.DataFrame([row_result])], ignore_index=True)
+    return results
+
+def check_equivalence(model, n_rows=300):
+    """Both paths must produce the same per-row outputs"""
+    df = make_batch_frame(n_rows, invalid_ratio=0.2, seed=1)
+    expected = legacy_predict_frame(df, model)
+    actual = predict_frame(df, model)
+    np.testing.assert_allclose(
+        expected['actual_productivity'].astype(float), actual['actual_productivity'], rtol=1e-12)
+    assert (expected['category'] == actual['category']).all()
+    assert (expected['errors'].fillna('') == actual['errors'].fillna('')).all()
+
+def measure(fn, df, model):
+    start = time.perf_counter()
+    fn(df, model)
+    elapsed = time.perf_counter() - start
+    return len(df) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--legacy-max-rows', type=int, default=2000,
+                        help="Largest size to time the quadratic per-row loop on")
+    args = parser.parse_args()
+
+    with open(MODEL_PATH, 'rb') as f:
+        model = pickle.load(f)
+
+    check_equivalence(model)
+    print("Outputs match the per-row loop\n")
+
+    print(f"{'rows':>10} {'per-row rows/s':>16} {'columnar rows/s':>16} {'speedup':>9}")
+    for n_rows in args.rows:
+        df = make_batch_frame(n_rows)
+        columnar = measure(predict_frame, df, model)
+        if n_rows <= args.legacy_max_rows:
+            legacy = measure(legacy_predict_frame, df, model)
+            print(f"{n_rows:>10} {legacy:>16,.0f} {columnar:>16,.0f} {columnar / legacy:>8.0f}x")
+        else:
+            print(f"{n_rows:>10} {'skipped':>16} {columnar:>16,.0f} {'':>9}")
+
+if __name__ == "__main__":
+    main()
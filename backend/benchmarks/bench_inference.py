@@ -0,0 +1,88 @@
+"""
+Inference engine benchmark: single-row latency (p50/p99) and batch
+throughput of the compiled tree engine against the library's model.predict.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_inference --models model_rf.pkl --xgboost
+"""
+import argparse
+import os
+import pickle
+import time
+
+import numpy as np
+
+from app.features import validate_frame, prepare_model_frame
+from app.inference import compile_model
+from benchmarks.bench_batch import make_batch_frame
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(__file__))
+
+def make_features(n_rows, seed=0):
+    """Encoded model inputs for realistic batch rows"""
+    valid, _, columns = validate_frame(make_batch_frame(n_rows, invalid_ratio=0, seed=seed))
+    return prepare_model_frame(columns, valid)
+
+def train_xgboost(X):
+    """Fit a booster shaped like the notebook's XGBRegressor on the given inputs"""
+    import xgboost as xgb
+    rng = np.random.default_rng(0)
+    y = 0.5 + 0.01 * X[:, 4] - 0.005 * X[:, 5] + rng.normal(0, 0.05, len(X))
+    return xgb.XGBRegressor(n_estimators=200, max_depth=5, learning_rate=0.1).fit(X, y)
+
+def latency(predict, X, repeats):
+    """p50 and p99 of single-row predict calls, in milliseconds"""
+    timings = []
+    for i in range(repeats):
+        row = X[i % len(X)][None, :]
+        start = time.perf_counter()
+        predict(row)
+        timings.append(time.perf_counter() - start)
+    return np.percentile(timings, 50) * 1e3, np.percentile(timings, 99) * 1e3
+
+def throughput(predict, X):
+    start = time.perf_counter()
+    predict(X)
+    return len(X) / (time.perf_counter() - start)
+
+def report(name, model, batch_sizes, repeats):
+    compiled = compile_model(model)
+    if compiled is model:
+        print(f"{name}: cannot be compiled, skipped")
+        return
+
+    # Time the array engine itself, without the large-batch hand-off
+    engine = getattr(compiled, 'predict_compiled', compiled.predict)
+
+    X = make_features(max(batch_sizes), seed=1)
+    difference = np.abs(model.predict(X) - engine(X)).max()
+    print(f"\n{name} ({type(model).__name__}), max |difference| = {difference:.3g}")
+
+    print(f"{'single row':>14} {'p50 ms':>10} {'p99 ms':>10}")
+    for label, predict in [("model.predict", model.predict), ("compiled", engine)]:
+        p50, p99 = latency(predict, X, repeats)
+        print(f"{label:>14} {p50:>10.3f} {p99:>10.3f}")
+
+    print(f"{'batch rows':>14} {'model rows/s':>14} {'compiled rows/s':>16}")
+    for n_rows in batch_sizes:
+        batch = X[:n_rows]
+        print(f"{n_rows:>14} {throughput(model.predict, batch):>14,.0f} {throughput(engine, batch):>16,.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', nargs='*', default=['model_rf.pkl', 'model_lr.pkl'])
+    parser.add_argument('--xgboost', action='store_true', help="Also benchmark a freshly trained XGBRegressor")
+    parser.add_argument('--batch', type=int, nargs='+', default=[100, 10000, 100000])
+    parser.add_argument('--repeats', type=int, default=500)
+    args = parser.parse_args()
+
+    for path in args.models:
+        with open(os.path.join(BACKEND_DIR, path), 'rb') as f:
+            report(path, pickle.load(f), args.batch, args.repeats)
+
+    if args.xgboost:
+        report('xgboost', train_xgboost(make_features(5000)), args.batch, args.repeats)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Startup benchmark: how long a fresh worker takes from `python` to its first
+/api/health response, and how long a worker forked from a preloaded master
+takes (what gunicorn.conf.py does with preload_app).
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --exported     # model_<name>/ array artifacts
+    python -m benchmarks.bench_startup --importtime   # import time per module
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def boot():
+    """Import and create the app, then answer one health check. Returns the timings in ms"""
+    started = time.perf_counter()
+    from app.app import create_app
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+    response = app.test_client().get('/api/health')
+    served = time.perf_counter()
+    if response.status_code != 200:
+        raise RuntimeError(f"Health check failed: {response.get_json()}")
+    return {
+        "import_ms": (imported - started) * 1000.0,
+        "create_app_ms": (created - imported) * 1000.0,
+        "first_request_ms": (served - created) * 1000.0,
+        "ready_ms": (served - started) * 1000.0,
+    }
+
+def child():
+    """Entry point of the fresh interpreter started by cold_start"""
+    timings = boot()
+    import app.routes
+    app.routes.scheduler.shutdown()
+    print(json.dumps(timings))
+
+def cold_start(env, repeats):
+    """Timings of repeats fresh interpreters, each importing everything from scratch"""
+    runs = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_startup', '--child'],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        timings["process_ms"] = (time.perf_counter() - started) * 1000.0
+        runs.append(timings)
+    return runs
+
+def forked_start(repeats):
+    """Milliseconds from fork to the first health response of workers forked from a preloaded app"""
+    from app.app import create_app
+    app = create_app()
+    timings = []
+    for _ in range(repeats):
+        read_end, write_end = os.pipe()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            status = app.test_client().get('/api/health').status_code
+            elapsed = (time.perf_counter() - started) * 1000.0 if status == 200 else -1.0
+            os.write(write_end, repr(elapsed).encode())
+            os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end) as f:
+            timings.append(float(f.read()))
+        os.waitpid(pid, 0)
+    import app.routes
+    app.routes.scheduler.shutdown()
+    return timings
+
+def import_profile(env, top):
+    """Cumulative import time per module of the app, from python -X importtime"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'from app.app import create_app; import app.routes'],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+        if match:
+            modules.append((int(match.group(2)), int(match.group(1)), len(match.group(3)) // 2, match.group(4)))
+
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module (top level imports marked *)")
+    for cumulative, own, depth, name in sorted(modules, reverse=True)[:top]:
+        print(f"{cumulative / 1000.0:>14.1f} {own / 1000.0:>9.1f}  {'*' if depth == 0 else ' '} {name}")
+    total = sum(cumulative for cumulative, _, depth, _ in modules if depth == 0)
+    print(f"{total / 1000.0:>14.1f} {'':>9}  total")
+
+def export_models():
+    """Temporary model folder with array artifacts of the shipped pickles"""
+    from app.artifacts import export_model, load_artifact
+    folder = tempfile.mkdtemp()
+    for name in os.listdir(BACKEND_DIR):
+        if re.fullmatch(r'model_\w+\.pkl', name):
+            path = os.path.join(BACKEND_DIR, name)
+            shutil.copy(path, folder)
+            model, version = load_artifact(path)
+            try:
+                export_model(model, os.path.join(folder, name[:-len('.pkl')]), version=version)
+            except TypeError:
+                pass
+    return folder
+
+def summarize(label, values):
+    print(f"{label:>18} {statistics.median(values):>10.1f} {min(values):>10.1f} {max(values):>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--exported', action='store_true', help="Load the models from exported array artifacts")
+    parser.add_argument('--importtime', action='store_true', help="Report import time per module")
+    parser.add_argument('--top', type=int, default=25, help="Modules listed by --importtime")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR)
+    if args.exported:
+        env['MODEL_FOLDER'] = os.environ['MODEL_FOLDER'] = export_models()
+
+    if args.importtime:
+        import_profile(env, args.top)
+        return
+
+    print(f"Models from {'exported array artifacts' if args.exported else 'pickles'}, {args.repeats} runs")
+    print(f"{'fresh process':>18} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    runs = cold_start(env, args.repeats)
+    for key in ("import_ms", "create_app_ms", "first_request_ms", "ready_ms", "process_ms"):
+        summarize(key, [run[key] for run in runs])
+
+    if hasattr(os, 'fork'):
+        print(f"{'preloaded master':>18} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+        summarize("forked worker", forked_start(args.repeats))
+
+if __name__ == "__main__":
+    main()
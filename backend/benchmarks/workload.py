@@ -0,0 +1,71 @@
+"""
+Request payloads and batch CSVs resampled from the bundled garment
+productivity dataset (content/garments_worker_productivity.csv).
+
+Dataset rows are mapped to the API's input fields:
+
+- date: m/d/yyyy to YYYY-MM-DD
+- department: 'sweing' and 'finishing ' to Sewing and Finishing
+- team: 8 to 'Team 8'
+- over_time: minutes for the whole team, turned into hours per worker and capped at 8
+- incentive: the bonus amount, bucketed into the levels of app.history.INCENTIVE_BANDS
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.history import incentive_band
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'content', 'garments_worker_productivity.csv')
+
+def load_records(path=DATASET_PATH):
+    """The dataset as a DataFrame of API input fields, one row per dataset row"""
+    raw = pd.read_csv(path)
+    workers = raw["no_of_workers"].clip(lower=1)
+    return pd.DataFrame({
+        "date": pd.to_datetime(raw["date"], format="%m/%d/%Y").dt.strftime("%Y-%m-%d"),
+        "department": raw["department"].str.strip().map({"sweing": "Sewing", "finishing": "Finishing"}),
+        "team": "Team " + raw["team"].astype(str),
+        "targeted_productivity": raw["targeted_productivity"],
+        "smv_minutes": raw["smv"],
+        "over_time_hours": (raw["over_time"] / workers / 60.0).round().clip(0, 8).astype(int),
+        "incentive_level": incentive_band(raw["incentive"]),
+        "idle_time_minutes": raw["idle_time"],
+        "idle_men_count": raw["idle_men"],
+        "style_change_count": raw["no_of_style_change"],
+        "worker_count": workers.round().astype(int),
+    })
+
+def sample_frame(n_rows, seed=0, jitter=True, records=None):
+    """
+    n_rows dataset rows drawn with replacement.
+
+    With jitter, smv_minutes is moved by up to half a minute, so most rows
+    are distinct feature vectors and are not all answered by the prediction
+    cache.
+    """
+    records = load_records() if records is None else records
+    rng = np.random.default_rng(seed)
+    frame = records.iloc[rng.integers(0, len(records), n_rows)].reset_index(drop=True)
+    if jitter:
+        smv = frame["smv_minutes"] + rng.uniform(-0.5, 0.5, n_rows)
+        frame["smv_minutes"] = smv.clip(lower=0.1).round(2)
+    return frame
+
+def sample_payloads(n_payloads, seed=0, jitter=True, records=None):
+    """JSON-ready /api/predict bodies"""
+    frame = sample_frame(n_payloads, seed, jitter, records)
+    # to_dict gives numpy scalars, json needs plain Python numbers
+    return [{key: value.item() if hasattr(value, "item") else value for key, value in row.items()}
+            for row in frame.to_dict(orient="records")]
+
+def write_batch_csv(path, n_rows, seed=0, jitter=True, block_rows=100000):
+    """Write an n_rows batch upload to path, block by block to bound memory"""
+    records = load_records()
+    with open(path, "w", newline="") as f:
+        for block, start in enumerate(range(0, n_rows, block_rows)):
+            frame = sample_frame(min(block_rows, n_rows - start), seed + block, jitter, records)
+            frame.to_csv(f, header=start == 0, index=False)
+    return path
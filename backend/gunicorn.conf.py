@@ -0,0 +1,66 @@
+"""
+Gunicorn settings for the API. Run from the backend directory:
+
+    gunicorn -c gunicorn.conf.py main:app
+"""
+import gc
+import glob
+import os
+import tempfile
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+# One worker per core, model inference is CPU bound. The app splits the
+# host's batch worker and queue limits among them, see SERVER_PROCESSES
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+# Every worker saves its metrics here, so /api/metrics reports all of them
+# whichever worker serves the scrape
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='api-metrics-')
+
+# Threaded workers, so batch event streams do not hold a whole worker each.
+# Admission control keeps one thread free for health checks, see
+# ADMISSION_MAX_REQUESTS
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Import the app and load the default model once in the master. Workers are
+# forked from it ready to serve and share its memory copy-on-write.
+preload_app = True
+
+# Large batch uploads are streamed to disk, give them time
+timeout = 120
+
+def on_starting(server):
+    # Metrics of a previous run of the server do not count
+    for path in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.json')):
+        os.remove(path)
+
+def when_ready(server):
+    # Keep the garbage collector off the preloaded objects, so collections in
+    # the workers do not write to, and copy, the shared pages
+    gc.freeze()
+
+def post_fork(server, worker):
+    # A worker forked to replace one that died fails the dead worker's batch
+    # jobs, their status updates would otherwise never come
+    from app import routes
+
+    if routes.job_store is not None:
+        interrupted = routes.job_store.fail_orphans("Interrupted, the server process running it exited")
+        if interrupted:
+            server.log.info("Marked %d interrupted batch jobs as failed", interrupted)
+
+def worker_exit(server, worker):
+    # Save the last metrics of a worker shutting down
+    from app.metrics import metrics
+
+    metrics.flush()
+
+def child_exit(server, worker):
+    # Keep the counts of an exited worker, drop its gauges
+    from app.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid, os.environ['PROMETHEUS_MULTIPROC_DIR'])
@@ -0,0 +1,55 @@
+import threading
+import time
+
+from app.admission import AdmissionController
+
+def test_full_class_queues_then_rejects():
+    """Requests over the limit wait in a bounded queue, and give up after the timeout"""
+    admission = AdmissionController({"prediction": 1}, queue_size=1, queue_timeout_ms=2000.0)
+    assert admission.acquire("prediction")
+    assert admission.busy("prediction")
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(admission.acquire("prediction")))
+    waiter.start()
+    while admission.stats()["prediction"]["waiting"] == 0:
+        time.sleep(0.001)
+    # The queue is full, so the next request is turned away at once
+    started = time.perf_counter()
+    assert not admission.acquire("prediction")
+    assert time.perf_counter() - started < 0.5
+
+    admission.release("prediction")
+    waiter.join()
+    assert results == [True]
+    stats = admission.stats()["prediction"]
+    assert (stats["active"], stats["waiting"], stats["admitted"], stats["queued"], stats["rejected"]) == (1, 0, 2, 1, 1)
+
+    admission.timeout = 0.05
+    started = time.perf_counter()
+    assert not admission.acquire("prediction")
+    assert time.perf_counter() - started >= 0.05
+    admission.release("prediction")
+    assert not admission.busy("prediction")
+
+def test_unlimited_routes_keep_a_free_slot():
+    """max_requests caps every limited class together, routes without a class are always served"""
+    admission = AdmissionController({"prediction": 4, "metadata": 4}, max_requests=2)
+    assert admission.acquire("prediction")
+    assert admission.acquire("metadata")
+    assert not admission.acquire("prediction")
+    assert not admission.acquire("metadata")
+    assert admission.acquire("health")
+    admission.release("health")
+
+    admission.release("metadata")
+    assert admission.acquire("prediction")
+    assert admission.stats()["prediction"]["active"] == 2
+
+if __name__ == "__main__":
+    print("Running admission control tests...")
+
+    test_full_class_queues_then_rejects()
+    test_unlimited_routes_keep_a_free_slot()
+
+    print("\nTests completed!")
@@ -44,7 +44,7 @@ def test_prediction():
     
     # Make prediction request
     response = requests.post(
-        f"{base_url}/api/predict",
+        f"{base_url}/api/predict?visualizations=true",
         json=input_data,
         headers={"Content-Type": "application/json"}
     )
@@ -64,6 +64,80 @@ def test_prediction():
     else:
         print(f"Error: {response.json()}")
 
+def test_bulk_prediction():
+    """Test bulk prediction endpoint"""
+    record = {
+        "date": "2023-05-15",
+        "department": "Sewing",
+        "team": "Team 3",
+        "targeted_productivity": 75,
+        "smv_minutes": 2.5,
+        "over_time_hours": 1,
+        "incentive_level": "Standard",
+        "idle_time_minutes": 30,
+        "idle_men_count": 1,
+        "style_change_count": 2,
+        "worker_count": 50
+    }
+    
+    # One valid record and one with an invalid department
+    response = requests.post(
+        f"{base_url}/api/predict/bulk",
+        json=[record, dict(record, department="Packing")],
+        headers={"Content-Type": "application/json"}
+    )
+    
+    print("\n5. Bulk Prediction Response:")
+    print(f"Status Code: {response.status_code}")
+    
+    if response.status_code == 200:
+        result = response.json()
+        print(f"Valid records: {result['valid']} of {result['count']}")
+        for item in result['results']:
+            if "error" in item:
+                print(f"  - #{item['index']}: {item['error']} ({'; '.join(item['details'])})")
+            else:
+                print(f"  - #{item['index']}: {item['actual_productivity']} ({item['category']})")
+    else:
+        print(f"Error: {response.json()}")
+
+def test_sweep_prediction():
+    """Test the what-if sweep endpoint"""
+    base = {
+        "date": "2023-05-15",
+        "department": "Sewing",
+        "team": "Team 3",
+        "targeted_productivity": 75,
+        "smv_minutes": 2.5,
+        "incentive_level": "Standard",
+        "idle_time_minutes": 30,
+        "idle_men_count": 1,
+        "style_change_count": 2
+    }
+    
+    # Overtime from 0 to 8 hours against 30 to 60 workers
+    response = requests.post(
+        f"{base_url}/api/predict/sweep",
+        json={
+            "base": base,
+            "sweep": {
+                "over_time_hours": {"start": 0, "stop": 8, "step": 1},
+                "worker_count": {"start": 30, "stop": 60, "step": 5}
+            }
+        },
+        headers={"Content-Type": "application/json"}
+    )
+    
+    print("\n6. Sweep Prediction Response:")
+    print(f"Status Code: {response.status_code}")
+    
+    if response.status_code == 200:
+        result = response.json()
+        print(f"Grid points: {result['points']}")
+        print(f"Best settings: {result['best']['settings']} -> {result['best']['actual_productivity']}")
+    else:
+        print(f"Error: {response.json()}")
+
 if __name__ == "__main__":
     print("Running API Tests...")
     
@@ -71,5 +145,7 @@ if __name__ == "__main__":
     test_health_check()
     test_metadata()
     test_prediction()
+    test_bulk_prediction()
+    test_sweep_prediction()
     
     print("\nTests completed!")
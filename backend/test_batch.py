@@ -0,0 +1,161 @@
+import gzip
+import hashlib
+import io
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from app.batch import run_batch
+from app.events import batch_events
+from app.explain import BIAS_COLUMN, CONTRIBUTION_COLUMNS
+from app.history import load_batch_history
+from app.ingest import UploadSpool, save_upload
+from app.jobstore import open_job_store
+from app.writers import RESULT_WRITERS, available_formats
+from benchmarks.bench_batch import make_batch_frame, predict_frame
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BACKEND_DIR, 'model_rf.pkl')
+
+class Upload:
+    """Minimal stand-in for werkzeug's FileStorage"""
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+
+def test_streamed_batch_matches_in_memory():
+    """Scoring a CSV chunk by chunk gives the same table as the whole frame at once"""
+    df = make_batch_frame(1000, invalid_ratio=0.2, seed=2)
+    directory = tempfile.mkdtemp()
+    csv_path = os.path.join(directory, "upload.csv")
+    data = df.to_csv(index=False).encode()
+    size, rows, digest = save_upload(Upload(data), csv_path)
+    assert size == os.path.getsize(csv_path)
+    assert rows == len(df)
+    assert digest == hashlib.sha256(data).hexdigest()
+
+    store = open_job_store("memory://")
+    store.create("stream", status="processing")
+    results_path = os.path.join(directory, "results.xlsx")
+    history_path = os.path.join(directory, "results.history.npz")
+    summary = run_batch("stream", "memory://", csv_path, results_path, MODEL_PATH, chunk_size=128,
+                        history_path=history_path)
+    assert summary["rows_done"] == len(df)
+    assert store.get("stream")["rows_done"] == len(df)
+
+    with open(MODEL_PATH, 'rb') as f:
+        expected = predict_frame(df, pickle.load(f))
+    actual = pd.read_excel(results_path)
+    assert summary["valid_rows"] == expected["actual_productivity"].notna().sum()
+    np.testing.assert_allclose(actual["actual_productivity"], expected["actual_productivity"], rtol=1e-12)
+    assert (actual["category"] == expected["category"]).all()
+    assert (actual["errors"].fillna("") == expected["errors"].fillna("")).all()
+    # The incentive level "None" is a value, not a missing cell
+    assert (actual["incentive_level"].fillna("None") == df["incentive_level"]).all()
+
+    # The history has the valid rows of every chunk, in order
+    history = load_batch_history(history_path)
+    valid = expected["actual_productivity"].notna().to_numpy()
+    np.testing.assert_allclose(history["actual_productivity"], expected["actual_productivity"][valid], rtol=1e-12)
+    assert (history["department"] == df["department"][valid].to_numpy()).all()
+    assert not os.path.exists(os.path.join(directory, "results.history.tmp.npz"))
+
+def test_spooled_upload_is_moved_into_place():
+    """A spooled upload is hashed and counted as it is written, then renamed, and a discarded one is deleted"""
+    directory = tempfile.mkdtemp()
+    data = make_batch_frame(300, seed=3).to_csv(index=False).encode()
+    spool = UploadSpool(directory)
+    for start in range(0, len(data), 1000):
+        spool.write(data[start:start + 1000])
+    spool.seek(0)
+    assert spool.read(10) == data[:10]
+    upload = Upload(b"")
+    upload.stream = spool
+    path = os.path.join(directory, "upload.csv")
+    assert save_upload(upload, path) == save_upload(Upload(data), os.path.join(directory, "copy.csv"))
+    with open(path, 'rb') as f:
+        assert f.read() == data
+    spool.close()
+    assert sorted(os.listdir(directory)) == ["copy.csv", "upload.csv"]
+
+    discarded = UploadSpool(directory)
+    discarded.write(data)
+    discarded.close()
+    assert sorted(os.listdir(directory)) == ["copy.csv", "upload.csv"]
+
+def test_explained_batch_adds_contributions():
+    """An explained job writes a bias and a contribution per feature that add up to each prediction"""
+    df = make_batch_frame(500, invalid_ratio=0.2, seed=5)
+    directory = tempfile.mkdtemp()
+    csv_path = os.path.join(directory, "upload.csv")
+    df.to_csv(csv_path, index=False)
+    store = open_job_store("memory://")
+    store.create("explained", status="processing", explanations=1)
+    results_path = os.path.join(directory, "results.csv.gz")
+    run_batch("explained", "memory://", csv_path, results_path, MODEL_PATH, chunk_size=128,
+              output_format='csv', explain=True)
+
+    actual = read_result(results_path, 'csv')
+    assert list(actual.columns[-len(CONTRIBUTION_COLUMNS) - 1:]) == [BIAS_COLUMN] + CONTRIBUTION_COLUMNS
+    valid = actual["actual_productivity"].notna()
+    assert actual.loc[~valid, [BIAS_COLUMN] + CONTRIBUTION_COLUMNS].isna().all().all()
+    total = actual.loc[valid, BIAS_COLUMN] + actual.loc[valid, CONTRIBUTION_COLUMNS].sum(axis=1)
+    np.testing.assert_allclose(total, actual.loc[valid, "actual_productivity"], atol=1e-9)
+
+def read_result(path, output_format):
+    if output_format == 'csv':
+        with gzip.open(path) as f:
+            return pd.read_csv(f, keep_default_na=False, na_values=[""])
+    if output_format == 'ndjson':
+        with gzip.open(path) as f:
+            return pd.read_json(f, lines=True)
+    if output_format == 'parquet':
+        return pd.read_parquet(path)
+    return pd.read_excel(path)
+
+def test_result_formats_round_trip():
+    """Every output format written in chunks reads back as the same table"""
+    df = make_batch_frame(300, invalid_ratio=0.2, seed=4)
+    with open(MODEL_PATH, 'rb') as f:
+        expected = predict_frame(df, pickle.load(f))
+    directory = tempfile.mkdtemp()
+    for output_format in available_formats():
+        writer_class = RESULT_WRITERS[output_format]
+        path = os.path.join(directory, f"results.{writer_class.extension}")
+        with writer_class(path) as writer:
+            for start in range(0, len(expected), 128):
+                writer.write(expected.iloc[start:start + 128])
+        actual = read_result(path, output_format)
+        assert len(actual) == len(expected), output_format
+        np.testing.assert_allclose(actual["actual_productivity"], expected["actual_productivity"], rtol=1e-12)
+        assert (actual["category"] == expected["category"]).all(), output_format
+
+def test_event_stream_sequence():
+    """Status changes and progress are pushed once each, ending with the final event"""
+    base = {"id": "job", "rows_total": 100, "rows_done": None, "started_at": None}
+    records = iter([
+        dict(base, status="queued"),
+        dict(base, status="queued"),
+        dict(base, status="processing", rows_done=0, started_at="2025-01-01T00:00:00"),
+        dict(base, status="processing", rows_done=50, started_at="2025-01-01T00:00:00"),
+        dict(base, status="processing", rows_done=50, started_at="2025-01-01T00:00:00"),
+        dict(base, status="completed", rows_done=100),
+    ])
+    stream = batch_events(lambda: next(records), lambda job: {"status": job["status"]}, poll_interval=0)
+    events = [line[len("event: "):] for message in stream for line in message.splitlines()
+              if line.startswith("event: ")]
+    assert events == ["status", "status", "progress", "progress", "complete"]
+
+if __name__ == "__main__":
+    print("Running batch streaming tests...")
+
+    test_streamed_batch_matches_in_memory()
+    test_spooled_upload_is_moved_into_place()
+    test_explained_batch_adds_contributions()
+    test_result_formats_round_trip()
+    test_event_stream_sequence()
+
+    print("\nTests completed!")
@@ -0,0 +1,58 @@
+import time
+
+import numpy as np
+
+from app.cache import PredictionCache, predict_cached
+
+class CountingModel:
+    """Stand-in model that records how many rows it was asked to score"""
+
+    def __init__(self):
+        self.rows = 0
+
+    def predict(self, X):
+        X = np.asarray(X)
+        self.rows += len(X)
+        return X.sum(axis=1)
+
+def test_repeated_rows_skip_the_model():
+    """Duplicate and previously seen feature vectors are not scored again"""
+    cache = PredictionCache(max_entries=100)
+    model = CountingModel()
+    X = np.array([[1.0, 2.0], [3.0, 4.0], [1.0, 2.0]])
+    assert np.array_equal(predict_cached(model, X, cache, "v1"), [3.0, 7.0, 3.0])
+    assert model.rows == 2
+    assert np.array_equal(predict_cached(model, X[::-1], cache, "v1"), [3.0, 7.0, 3.0])
+    assert model.rows == 2
+    assert cache.stats()["hits"] == 2
+
+def test_model_change_invalidates():
+    """Entries stored under another model version are never returned"""
+    cache = PredictionCache(max_entries=100)
+    cache.put([1.0, 2.0], "v1", 0.5)
+    assert cache.get([1.0, 2.0], "v1") == 0.5
+    assert cache.get([1.0, 2.0], "v2") is None
+    assert cache.stats()["invalidations"] == 1
+
+def test_lru_eviction_and_ttl():
+    """The least recently used entry goes first and entries expire"""
+    cache = PredictionCache(max_entries=2, ttl_seconds=0.05)
+    cache.put([1.0], "v", 1.0)
+    cache.put([2.0], "v", 2.0)
+    cache.get([1.0], "v")
+    cache.put([3.0], "v", 3.0)
+    assert cache.get([2.0], "v") is None
+    assert cache.get([1.0], "v") == 1.0
+    assert cache.stats()["evictions"] == 1
+    time.sleep(0.1)
+    assert cache.get([3.0], "v") is None
+    assert cache.stats()["expirations"] == 1
+
+if __name__ == "__main__":
+    print("Running prediction cache tests...")
+
+    test_repeated_rows_skip_the_model()
+    test_model_change_invalidates()
+    test_lru_eviction_and_ttl()
+
+    print("\nTests completed!")
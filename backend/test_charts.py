@@ -0,0 +1,104 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.charts import (CHARTS, ChartCache, chart_cache, chart_key, configure_renderer, get_chart, live_figures,
+                        parse_chart_key, render_chart, render_charts, render_worker_figures, shutdown_renderer)
+
+# Value sets of (targeted productivity, SMV, overtime, idle time)
+VALUE_SETS = [
+    (75.0, 2.5, 1.0, 30.0),
+    (0.8, 26.16, 7.0, 0.0),
+    (0.35, 54.56, 0.0, 90.0),
+    (120.0, 11.41, 3.0, 5.5),
+]
+
+def reference_images():
+    """Render every chart one at a time in the calling thread"""
+    return {
+        (chart, values): render_chart(chart, values)
+        for values in VALUE_SETS
+        for chart in CHARTS.values()
+    }
+
+def test_render_is_deterministic():
+    """Rendering the same chart twice gives identical bytes"""
+    for chart in CHARTS.values():
+        assert render_chart(chart, VALUE_SETS[0]) == render_chart(chart, VALUE_SETS[0])
+    for fmt in ('png', 'svg'):
+        assert render_chart('composite', VALUE_SETS[1], fmt) == render_chart('composite', VALUE_SETS[1], fmt)
+
+def test_threaded_render_matches_single_threaded():
+    """Many threads rendering on their own figures match the single-threaded output"""
+    expected = reference_images()
+    jobs = list(expected) * 2
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda job: render_chart(*job), jobs))
+    for job, image in zip(jobs, results):
+        assert image == expected[job], f"{job} differs from the single-threaded render"
+
+def test_pool_render_matches_single_threaded():
+    """Concurrent requests through the process pool and cache match the single-threaded output"""
+    configure_renderer(2)
+    expected = reference_images()
+    chart_cache.__init__(chart_cache.max_bytes)
+    barrier = threading.Barrier(16)
+    failures = []
+
+    def client(index):
+        values = VALUE_SETS[index % len(VALUE_SETS)]
+        barrier.wait()
+        for chart in CHARTS.values():
+            if get_chart(chart, values) != expected[(chart, values)]:
+                failures.append((chart, values))
+        # Bypass the cache to exercise the pool directly
+        for chart, image in render_charts(values, ['bar']).items():
+            if image != expected[(chart, values)]:
+                failures.append((chart, values))
+
+    try:
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The render processes report the figures they hold with every image
+        workers = render_worker_figures()
+        assert workers and live_figures() >= sum(workers.values())
+    finally:
+        shutdown_renderer()
+    assert render_worker_figures() == {}
+
+    assert not failures, f"{len(failures)} images differ from the single-threaded render"
+    # Concurrent misses on one value set share a single render
+    assert chart_cache.stats()["entries"] == len(expected)
+
+def test_zero_values_render_and_bad_keys_are_rejected():
+    """All-zero values draw a placeholder pie, keys no record can produce parse to None"""
+    values = (0.0, 0.0, 0.0, 0.0)
+    assert parse_chart_key(chart_key(values)) == values
+    for chart in list(CHARTS.values()) + ['composite']:
+        assert render_chart(chart, values)
+    for key in ("1.0_2.0_nan_4.0", "1.0_2.0_inf_4.0", "1.0_-2.0_3.0_4.0", "1.0_2.0_3.0", "a_b_c_d"):
+        assert parse_chart_key(key) is None, key
+
+def test_cache_evicts_least_recently_used():
+    """The image cache stays within its byte bound"""
+    cache = ChartCache(max_bytes=10)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    cache.get("a")
+    cache.put("c", b"12345")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"12345"
+    assert cache.stats()["evictions"] == 1
+
+if __name__ == "__main__":
+    print("Running chart rendering tests...")
+    
+    test_render_is_deterministic()
+    test_threaded_render_matches_single_threaded()
+    test_pool_render_matches_single_threaded()
+    test_zero_values_render_and_bad_keys_are_rejected()
+    test_cache_evicts_least_recently_used()
+    
+    print("\nTests completed!")
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from app.features import prepare_model_frame, prepare_model_input, validate_frame, validate_input
+
+RECORD = {
+    "date": "2023-05-15",
+    "department": "Sewing",
+    "team": "Team 3",
+    "targeted_productivity": 75,
+    "smv_minutes": 2.5,
+    "over_time_hours": 1.5,
+    "incentive_level": "Standard",
+    "idle_time_minutes": 30,
+    "idle_men_count": 1,
+    "style_change_count": 2,
+    "worker_count": 50
+}
+
+# Each differs from RECORD in one or two fields
+VARIANTS = [
+    {},
+    {"team": "Team 12", "smv_minutes": "4.25", "worker_count": "1e1"},
+    {"team": "Team x"},
+    {"team": "Team 1 2"},
+    {"team": "team 1"},
+    {"team": 5},
+    {"team": None},
+    {"date": 20230515},
+    {"date": "2099-01-01", "department": "Packing"},
+    {"department": None, "incentive_level": None},
+    {"smv_minutes": "nan"},
+    {"smv_minutes": float("nan")},
+    {"idle_time_minutes": "inf", "idle_men_count": float("inf")},
+    {"targeted_productivity": "abc", "worker_count": 0},
+    {"over_time_hours": True},
+    {"over_time_hours": 9, "style_change_count": -1},
+]
+
+def records():
+    result = [dict(RECORD, **variant) for variant in VARIANTS]
+    # A record without the field at all
+    result.append({key: value for key, value in RECORD.items() if key != "worker_count"})
+    return result
+
+def test_single_and_columnar_validation_agree():
+    """validate_input and validate_frame accept the same records with the same messages"""
+    expected = [validate_input(record) for record in records()]
+    # One frame of every record, so columns mix types, and one frame per record
+    frames = [pd.DataFrame(records())] + [pd.DataFrame([record]) for record in records()]
+    valid, errors, _ = validate_frame(frames[0])
+    for i, (is_valid, messages, _) in enumerate(expected):
+        assert valid[i] == is_valid, records()[i]
+        assert errors[i] == "; ".join(messages), records()[i]
+        single_valid, single_errors, _ = validate_frame(frames[i + 1])
+        assert single_valid[0] == is_valid and single_errors[0] == "; ".join(messages), records()[i]
+    assert valid.sum() == 2
+
+def test_columnar_encoding_matches_single_records():
+    """prepare_model_frame gives every valid row the vector prepare_model_input gives its record"""
+    frame = pd.DataFrame(records())
+    valid, _, columns = validate_frame(frame)
+    encoded = prepare_model_frame(columns, valid)
+    expected = [prepare_model_input(validate_input(record)[2])[0]
+                for record, ok in zip(records(), valid) if ok]
+    np.testing.assert_array_equal(encoded, np.asarray(expected, dtype=np.float64))
+
+if __name__ == "__main__":
+    print("Running input validation tests...")
+
+    test_single_and_columnar_validation_agree()
+    test_columnar_encoding_matches_single_records()
+
+    print("\nTests completed!")
@@ -0,0 +1,150 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from app.features import validate_frame
+from app.history import HISTORY_SUFFIX, BatchHistoryWriter, HistoryStore, batch_history, load_dataset
+from app.jobstore import MemoryJobStore
+
+def test_indexed_queries_match_a_scan():
+    """Index lookups and date slices select the same records as filtering every row"""
+    store = HistoryStore(load_dataset())
+    data = store.data
+    frame = pd.DataFrame(data.columns())
+    assert len(frame) == 1197
+
+    for team, department, start, end in [
+        (3, None, None, None),
+        (None, "Finishing", "2015-02-01", None),
+        (7, "Sewing", "2015-01-10", "2015-02-20"),
+        (13, None, None, None),
+        (None, None, "2015-03-01", "2015-03-01"),
+    ]:
+        start = None if start is None else np.datetime64(start)
+        end = None if end is None else np.datetime64(end)
+        positions = data.select(team, department, start, end)
+        mask = np.ones(len(frame), dtype=bool)
+        if team is not None:
+            mask &= frame["team"] == team
+        if department is not None:
+            mask &= frame["department"] == department
+        if start is not None:
+            mask &= frame["date"] >= start
+        if end is not None:
+            mask &= frame["date"] <= end
+        np.testing.assert_array_equal(positions, np.flatnonzero(mask))
+
+    by_team = {group["key"]: group for group in data.aggregate("team")}
+    expected = frame.groupby("team")["actual_productivity"]
+    for team, mean in expected.mean().items():
+        assert np.isclose(by_team[f"Team {team}"]["mean"], mean)
+        assert by_team[f"Team {team}"]["count"] == expected.size()[team]
+    assert data.departments == ["Finishing", "Sewing"] and data.teams == list(range(1, 13))
+
+def save_history(results_path, *chunks):
+    """Save the history of scored chunks of (rows, predictions) the way a batch job does"""
+    with BatchHistoryWriter(results_path + HISTORY_SUFFIX) as writer:
+        for chunk, predictions in chunks:
+            valid, _, columns = validate_frame(chunk)
+            writer.append(batch_history(np.asarray(predictions, dtype=np.float64), valid, columns))
+
+def batch_rows(dates, teams):
+    n = len(dates)
+    return pd.DataFrame({
+        "date": dates,
+        "department": ["Sewing"] * n,
+        "team": teams,
+        "targeted_productivity": ["0.8"] * n,
+        "smv_minutes": ["20"] * n,
+        "over_time_hours": ["4"] * n,
+        "incentive_level": ["High"] * n,
+        "idle_time_minutes": ["0"] * n,
+        "idle_men_count": ["0"] * n,
+        "style_change_count": ["0"] * n,
+        "worker_count": ["30"] * n,
+    })
+
+def test_batch_predictions_join_once():
+    """A completed job's saved rows are added as predicted records, once, under a new version"""
+    folder = tempfile.mkdtemp()
+    results_path = os.path.join(folder, "job.csv")
+    chunk = pd.DataFrame({
+        "date": ["2015-04-01", "bad", "2015-04-02"],
+        "department": ["Sewing", "Sewing", "Cutting"],
+        "team": ["Team 13", "Team 1", "Team 2"],
+        "targeted_productivity": ["0.8", "0.7", "0.6"],
+        "smv_minutes": ["20", "20", "20"],
+        "over_time_hours": ["4", "4", "4"],
+        "incentive_level": ["High", "Low", "None"],
+        "idle_time_minutes": ["0", "0", "0"],
+        "idle_men_count": ["0", "0", "0"],
+        "style_change_count": ["0", "0", "0"],
+        "worker_count": ["30", "30", "30"],
+    })
+    save_history(results_path, (chunk, [0.9, np.nan, 0.5]))
+
+    job_store = MemoryJobStore()
+    job_store.create("job", status="completed", results_path=results_path)
+    job_store.create("copy", status="completed", results_path=results_path, reused_from="job")
+    store = HistoryStore(load_dataset(), refresh_interval=3600)
+    before = store.data
+
+    assert store.refresh(job_store) == 1
+    assert store.refresh(job_store, force=True) == 0
+    data = store.data
+    assert len(before) == 1197 and len(data) == 1199 and data.version != before.version
+    assert data.departments == ["Cutting", "Finishing", "Sewing"] and data.teams[-1] == 13
+
+    records = data.records(data.select(start=np.datetime64("2015-04-01"), source="predicted"))
+    assert [(r["date"], r["team"], r["incentive_band"], r["actual_productivity"]) for r in records] == [
+        ("2015-04-01", "Team 13", "High", 0.9), ("2015-04-02", "Team 2", "None", 0.5)]
+
+def test_jobs_are_merged_in_date_order_and_expired_ones_dropped():
+    """Rows that fail validation are left out, and each refresh follows the completed jobs"""
+    folder = tempfile.mkdtemp()
+    first, second = os.path.join(folder, "first.csv"), os.path.join(folder, "second.csv")
+    # 'Team 1 2' is not a team, the row is invalid and its job still saves the others
+    save_history(first, (batch_rows(["2015-01-05", "2015-01-05"], ["Team 1 2", "Team 4"]), [np.nan, 0.7]),
+                 (batch_rows(["2015-03-09"], ["Team 5"]), [0.6]))
+    save_history(second, (batch_rows(["2015-01-01", "2015-02-02"], ["Team 6", "Team 7"]), [0.5, 0.4]))
+
+    job_store = MemoryJobStore()
+    job_store.create("first", status="completed", results_path=first)
+    store = HistoryStore(load_dataset(), refresh_interval=3600)
+    observed = store.data
+    assert store.refresh(job_store, force=True) == 1
+    job_store.create("second", status="completed", results_path=second)
+    assert store.refresh(job_store, force=True) == 1
+    data = store.data
+    assert len(data) == 1197 + 4
+
+    # Merged into the date order, as if sorted from scratch
+    columns = data.columns()
+    assert (np.diff(columns["date"].astype(np.int64)) >= 0).all()
+    predicted = data.records(data.select(source="predicted"))
+    assert [(r["date"], r["team"]) for r in predicted] == [
+        ("2015-01-01", "Team 6"), ("2015-01-05", "Team 4"), ("2015-02-02", "Team 7"), ("2015-03-09", "Team 5")]
+    positions = data.select(team=4, start=np.datetime64("2015-01-05"), end=np.datetime64("2015-01-05"))
+    assert data.records(positions)[-1]["actual_productivity"] == 0.7
+
+    # The first job expires, its records go and the version matches a store that never saw it
+    job_store.delete("first")
+    assert store.refresh(job_store, force=True) == 0
+    data = store.data
+    assert len(data) == 1197 + 2
+    assert [r["team"] for r in data.records(data.select(source="predicted"))] == ["Team 6", "Team 7"]
+    fresh = HistoryStore(load_dataset(), refresh_interval=3600)
+    fresh.refresh(job_store, force=True)
+    assert fresh.data.version == data.version != observed.version
+    assert data.aggregate("team") == fresh.data.aggregate("team")
+
+if __name__ == "__main__":
+    print("Running history tests...")
+
+    test_indexed_queries_match_a_scan()
+    test_batch_predictions_join_once()
+    test_jobs_are_merged_in_date_order_and_expired_ones_dropped()
+
+    print("\nTests completed!")
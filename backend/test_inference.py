@@ -0,0 +1,117 @@
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from app.features import validate_frame, prepare_model_frame
+from app.artifacts import export_model, load_artifact, load_model_artifact
+from app.inference import CompiledForest, CompiledLinear, compile_model
+from benchmarks.bench_batch import make_batch_frame
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_model(name):
+    with open(os.path.join(BACKEND_DIR, name), 'rb') as f:
+        return pickle.load(f)
+
+def sample_inputs(n_rows=3000):
+    """Encoded model inputs for realistic batch rows"""
+    valid, _, columns = validate_frame(make_batch_frame(n_rows, invalid_ratio=0, seed=3))
+    return prepare_model_frame(columns, valid)
+
+def test_random_forest_matches_sklearn():
+    """The compiled forest reproduces RandomForestRegressor.predict exactly"""
+    model = load_model('model_rf.pkl')
+    compiled = compile_model(model)
+    assert isinstance(compiled, CompiledForest)
+    X = sample_inputs()
+    assert np.array_equal(compiled.predict_compiled(X), model.predict(X))
+    # Single rows take the same path as the API
+    assert compiled.predict(X[:1])[0] == model.predict(X[:1])[0]
+
+def test_linear_regression_matches_sklearn():
+    """The compiled linear model reproduces LinearRegression.predict"""
+    model = load_model('model_lr.pkl')
+    compiled = compile_model(model)
+    assert isinstance(compiled, CompiledLinear)
+    X = sample_inputs()
+    np.testing.assert_allclose(compiled.predict(X), model.predict(X), rtol=1e-12)
+
+def test_xgboost_matches_booster():
+    """The compiled booster reproduces XGBRegressor.predict, missing values included"""
+    try:
+        import xgboost as xgb
+    except ImportError:
+        print("xgboost not installed, skipped")
+        return
+    X = sample_inputs()
+    y = 0.5 + 0.01 * X[:, 4] - 0.005 * X[:, 5]
+    model = xgb.XGBRegressor(n_estimators=50, max_depth=5, learning_rate=0.1).fit(X, y)
+    compiled = compile_model(model)
+    assert isinstance(compiled, CompiledForest)
+    X[::5, 5] = np.nan
+    np.testing.assert_allclose(compiled.predict_compiled(X), model.predict(X), rtol=1e-6)
+
+def test_contributions_add_up_to_predictions():
+    """Bias plus contributions is the prediction, for boosters as XGBoost computes them"""
+    X = sample_inputs()
+    for name in ('model_rf.pkl', 'model_lr.pkl'):
+        model = load_model(name)
+        compiled = compile_model(model)
+        # 3000 rows take the estimator's leaves, 10 the compiled walk
+        for rows in (X, X[:10]):
+            bias, contributions = compiled.explain(rows)
+            assert contributions.shape == rows.shape, name
+            np.testing.assert_allclose(bias + contributions.sum(axis=1), model.predict(rows), atol=1e-9, err_msg=name)
+    
+    try:
+        import xgboost as xgb
+    except ImportError:
+        print("xgboost not installed, skipped")
+        return
+    y = 0.5 + 0.01 * X[:, 4] - 0.005 * X[:, 5]
+    model = xgb.XGBRegressor(n_estimators=50, max_depth=5, learning_rate=0.1).fit(X, y)
+    expected = model.get_booster().predict(xgb.DMatrix(X), pred_contribs=True, approx_contribs=True)
+    path = os.path.join(tempfile.mkdtemp(), "xgb")
+    export_model(model, path)
+    for compiled in (compile_model(model), load_artifact(path)[0]):
+        bias, contributions = compiled.explain(X)
+        np.testing.assert_allclose(contributions, expected[:, :-1], atol=1e-6)
+        np.testing.assert_allclose(bias, expected[0, -1], rtol=1e-6)
+
+def test_unfitted_model_is_returned_unchanged():
+    """Models that cannot be compiled keep their own predict"""
+    model = load_model('model_xgb.pkl')
+    assert compile_model(model) is model
+
+def test_exported_artifacts_match_pickles():
+    """Memory-mapped exports predict bit for bit what the pickled models do"""
+    directory = tempfile.mkdtemp()
+    # Below and above LARGE_BATCH_ROWS, where the pickled forest hands over to sklearn
+    X = sample_inputs()
+    for name in ('model_rf.pkl', 'model_lr.pkl'):
+        expected, version = load_artifact(os.path.join(BACKEND_DIR, name))
+        path = os.path.join(directory, name[:-len('.pkl')])
+        assert export_model(expected, path, version=version) == version
+        model, loaded_version = load_model_artifact(path)
+        assert loaded_version == version
+        assert np.array_equal(model.predict(X), expected.predict(X)), name
+        assert np.array_equal(model.predict(X[:10]), expected.predict(X[:10])), name
+        arrays = vars(model).values()
+        assert all(isinstance(array.base, np.memmap) for array in arrays if isinstance(array, np.ndarray)), name
+    
+    # Exporting again replaces the folder
+    assert export_model(load_model('model_lr.pkl'), path) != version
+
+if __name__ == "__main__":
+    print("Running inference engine tests...")
+    
+    test_random_forest_matches_sklearn()
+    test_linear_regression_matches_sklearn()
+    test_xgboost_matches_booster()
+    test_contributions_add_up_to_predictions()
+    test_unfitted_model_is_returned_unchanged()
+    test_exported_artifacts_match_pickles()
+    
+    print("\nTests completed!")
@@ -0,0 +1,174 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from app.jobs import JobCancelled, JobScheduler, QueueFull
+from app.jobstore import MemoryJobStore, open_job_store
+from app.retention import RetentionPolicy
+
+def sleepy_job(name, seconds, store_url=None):
+    """Job that sleeps in small steps and honours cancellation"""
+    store = open_job_store(store_url) if store_url else None
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if store is not None and store.cancel_requested(name):
+            raise JobCancelled()
+        time.sleep(0.01)
+    return name
+
+def temp_store_url():
+    return "sqlite:///" + os.path.join(tempfile.mkdtemp(), "jobs.db")
+
+def make_scheduler(max_queued):
+    order = []
+    done = {}
+    finished = threading.Event()
+
+    def on_done(job_id, result, error):
+        done[job_id] = error if error is not None else result
+        finished.set()
+
+    scheduler = JobScheduler(workers=1, max_queued=max_queued, nice=0,
+                             on_start=order.append, on_done=on_done)
+    return scheduler, order, done
+
+def wait_for(done, count, timeout=60):
+    deadline = time.monotonic() + timeout
+    while len(done) < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+def test_priority_queue_and_cancel():
+    """Queued jobs run highest priority first, a cancelled one never runs"""
+    scheduler, order, done = make_scheduler(max_queued=3)
+    try:
+        scheduler.submit("first", sleepy_job, "first", 1.0)
+        scheduler.submit("low", sleepy_job, "low", 0, priority=0)
+        scheduler.submit("dropped", sleepy_job, "dropped", 0, priority=1)
+        scheduler.submit("high", sleepy_job, "high", 0, priority=5)
+        assert scheduler.position("high") == 1
+        assert scheduler.position("low") == 3
+
+        try:
+            scheduler.submit("overflow", sleepy_job, "overflow", 0)
+            assert False, "Expected QueueFull"
+        except QueueFull:
+            pass
+
+        assert scheduler.cancel("dropped") == "queued"
+        # Reported done at once, like a job that stopped itself
+        assert isinstance(done.pop("dropped"), JobCancelled)
+        wait_for(done, 3)
+        assert order == ["first", "high", "low"]
+        assert done == {"first": "first", "high": "high", "low": "low"}
+    finally:
+        scheduler.shutdown()
+
+def test_cancel_running_job():
+    """A running job stops at its next cancellation check"""
+    scheduler, order, done = make_scheduler(max_queued=1)
+    store_url = temp_store_url()
+    store = open_job_store(store_url)
+    store.create("long", status="queued")
+    try:
+        scheduler.submit("long", sleepy_job, "long", 30, store_url)
+        # Give the worker process time to start the job
+        time.sleep(2)
+        assert scheduler.cancel("long") == "running"
+        store.update("long", cancel_requested=1)
+        wait_for(done, 1)
+        assert isinstance(done["long"], JobCancelled)
+        assert scheduler.stats()["cancelled"] == 1
+    finally:
+        scheduler.shutdown()
+
+def test_job_store_queue_order():
+    """Both stores agree on queue positions and status counts"""
+    for store in (MemoryJobStore(), open_job_store(temp_store_url())):
+        store.create("a", status="queued", priority=0)
+        store.create("b", status="queued", priority=3)
+        store.create("c", status="queued", priority=0)
+        store.create("d", status="completed")
+        assert [store.queue_position(job) for job in "abcd"] == [2, 1, 3, None]
+        store.update("b", status="processing", rows_done=10)
+        assert store.get("b")["rows_done"] == 10
+        assert store.queue_position("c") == 2
+        assert store.counts() == {"queued": 2, "processing": 1, "completed": 1}
+        # No owner process recorded, so the unfinished jobs are orphans
+        assert store.fail_orphans("Interrupted") == 3
+        assert store.get("a")["status"] == "failed"
+
+def test_duplicate_lookup_and_retention():
+    """Identical uploads find the latest reusable job, and deleted results expire it"""
+    directory = tempfile.mkdtemp()
+    uploads = os.path.join(directory, "uploads")
+    results = os.path.join(directory, "results")
+    os.makedirs(uploads)
+    os.makedirs(results)
+    for store in (MemoryJobStore(), open_job_store(temp_store_url())):
+        paths = {}
+        for name in ("old", "new", "running"):
+            paths[name] = os.path.join(results, f"{name}_{id(store)}.csv.gz")
+            with open(paths[name], "wb") as f:
+                f.write(b"x" * 100)
+        store.create("old", status="completed", results_path=paths["old"],
+                     content_hash="abc", model_version="v1", output_format="csv")
+        store.create("new", status="completed", results_path=paths["new"],
+                     content_hash="abc", model_version="v1", output_format="csv")
+        store.create("running", status="processing", results_path=paths["running"],
+                     content_hash="def", model_version="v1", output_format="csv")
+        assert store.find_duplicate("abc", "v1", "csv")["id"] == "new"
+        assert store.find_duplicate("abc", "v2", "csv") is None
+        assert store.find_duplicate("abc", "v1", "xlsx") is None
+        # The history takes the predictions of an upload from its first job only
+        assert store.completed_results() == [("old", paths["old"])]
+
+        # Room for one finished result, the running job's file is kept, and
+        # so are an upload still spooling and a history sidecar being written
+        spooling = os.path.join(uploads, f"upload_{id(store)}.part")
+        sidecar = os.path.join(results, f"running_{id(store)}.history.tmp.npz")
+        for path in (spooling, sidecar):
+            with open(path, "wb") as f:
+                f.write(b"x" * 1000)
+            os.utime(path, (time.time() - 200, time.time() - 200))
+        os.utime(paths["old"], (time.time() - 100, time.time() - 100))
+        RetentionPolicy(uploads, results, 100, 100, None).apply(store)
+        assert not os.path.exists(paths["old"])
+        assert os.path.exists(paths["new"]) and os.path.exists(paths["running"])
+        assert os.path.exists(spooling) and os.path.exists(sidecar)
+        assert store.get("old")["status"] == "expired"
+        assert store.completed_results() == [("new", paths["new"])]
+
+        # Everything finished is past the age limit
+        RetentionPolicy(uploads, results, None, None, 0).apply(store)
+        assert os.listdir(results) == [os.path.basename(paths["running"])]
+        assert not os.path.exists(spooling)
+        assert store.find_duplicate("abc", "v1", "csv") is None
+        os.remove(paths["running"])
+
+def test_duplicates_skip_jobs_of_exited_owners():
+    """An unfinished job whose owner died is not reused, and is failed as an orphan"""
+    child = subprocess.Popen([sys.executable, "-c", ""])
+    child.wait()
+    for store in (MemoryJobStore(), open_job_store(temp_store_url())):
+        store.create("live", status="queued", owner_pid=os.getpid(),
+                     content_hash="abc", model_version="v1", output_format="csv")
+        store.create("dead", status="processing", owner_pid=child.pid,
+                     content_hash="abc", model_version="v1", output_format="csv")
+        assert store.find_duplicate("abc", "v1", "csv")["id"] == "live"
+        assert store.fail_orphans("Interrupted") == 1
+        assert store.get("dead")["status"] == "failed"
+        assert store.get("live")["status"] == "queued"
+
+if __name__ == "__main__":
+    print("Running batch scheduler tests...")
+
+    test_priority_queue_and_cancel()
+    test_cancel_running_job()
+    test_job_store_queue_order()
+    test_duplicate_lookup_and_retention()
+    test_duplicates_skip_jobs_of_exited_owners()
+
+    print("\nTests completed!")
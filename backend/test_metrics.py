@@ -0,0 +1,87 @@
+import multiprocessing
+import pickle
+import tempfile
+
+from app.metrics import Histogram, MetricsRegistry, StageTimer, mark_process_dead
+
+def make_registry(directory, queued):
+    """Registry of one server process with a counter, a histogram and a gauge"""
+    registry = MetricsRegistry()
+    registry.configure_multiprocess(directory)
+    rows = registry.counter('rows_total', "Rows", ('model',))
+    latency = registry.histogram('request_seconds', "Request time", (), buckets=(1.0,))
+    registry.collector('queued', "Queued jobs", (), lambda: [((), queued)])
+    registry.collector('ready', "Model ready", (), lambda: [((), queued)], multiprocess_mode='min')
+    return registry, rows, latency
+
+def other_worker(directory):
+    registry, rows, latency = make_registry(directory, 5)
+    rows.inc(2, model='rf')
+    latency.observe(0.5)
+    registry.flush()
+
+def test_histogram_text_format():
+    """Buckets are cumulative and end with +Inf, sum and count, as Prometheus expects"""
+    registry = MetricsRegistry()
+    latency = registry.histogram('request_seconds', "Request time", ('endpoint',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        latency.observe(value, endpoint='predict')
+    rows = registry.counter('rows_total', "Rows", ('model',))
+    rows.inc(3, model='say "rf"')
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP request_seconds Request time", "# TYPE request_seconds histogram"]
+    assert 'request_seconds_bucket{endpoint="predict",le="0.1"} 1' in lines
+    assert 'request_seconds_bucket{endpoint="predict",le="1.0"} 3' in lines
+    assert 'request_seconds_bucket{endpoint="predict",le="+Inf"} 4' in lines
+    assert 'request_seconds_sum{endpoint="predict"} 6.05' in lines
+    assert 'request_seconds_count{endpoint="predict"} 4' in lines
+    assert 'rows_total{model="say \\"rf\\""} 3.0' in lines
+
+def test_worker_observations_merge():
+    """Stage timings taken in a batch worker add up with the server's own"""
+    server = Histogram('stage_seconds', "Stage time", ('stage',), buckets=(0.1,))
+    worker = Histogram('stage_seconds', "Stage time", ('stage',), buckets=(0.1,))
+    server.observe(0.05, stage='read')
+    timer = StageTimer()
+    for _ in range(2):
+        with timer.stage('read'):
+            pass
+    worker.observe(timer.stages['read'], stage='read')
+    worker.observe(1.0, stage='write')
+
+    server.merge(pickle.loads(pickle.dumps(worker.snapshot())))
+    counts = {(name, key): value for name, key, _, value in server.samples() if name.endswith('_count')}
+    assert counts == {('stage_seconds_count', ('read',)): 2, ('stage_seconds_count', ('write',)): 1}
+    assert timer.server_timing().startswith("read;dur=")
+
+def test_processes_share_their_metrics():
+    """Counts of every process add up, gauges only while their process runs"""
+    directory = tempfile.mkdtemp()
+    worker = multiprocessing.get_context('spawn').Process(target=other_worker, args=(directory,))
+    worker.start()
+    worker.join()
+
+    registry, rows, latency = make_registry(directory, 1)
+    rows.inc(3, model='rf')
+    latency.observe(2.0)
+    lines = registry.render().splitlines()
+    assert 'rows_total{model="rf"} 5.0' in lines
+    assert 'request_seconds_bucket{le="1.0"} 1' in lines
+    assert 'request_seconds_count 2' in lines
+    assert 'queued 6' in lines
+    assert 'ready 1' in lines
+
+    mark_process_dead(worker.pid, directory)
+    lines = registry.render().splitlines()
+    assert 'rows_total{model="rf"} 5.0' in lines
+    assert 'queued 1' in lines
+
+if __name__ == "__main__":
+    print("Running metrics tests...")
+
+    test_histogram_text_format()
+    test_worker_observations_merge()
+    test_processes_share_their_metrics()
+
+    print("\nTests completed!")
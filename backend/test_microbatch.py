@@ -0,0 +1,96 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.microbatch import MicroBatcher
+
+class GatedModel:
+    """Sums each row, every call blocks until the gate is opened"""
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.calls = []
+
+    def predict(self, X):
+        self.calls.append(len(X))
+        self.gate.wait()
+        return X.sum(axis=1)
+
+def submit(batcher, row, results):
+    thread = threading.Thread(target=lambda: results.append(batcher.predict(np.array(row, dtype=np.float64))))
+    thread.start()
+    return thread
+
+def wait_for(condition):
+    deadline = time.perf_counter() + 5.0
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        time.sleep(0.001)
+
+def test_rows_queued_during_a_batch_are_coalesced():
+    """A lone row is scored at once, the rows queued behind a running batch share the next call"""
+    model = GatedModel()
+    batcher = MicroBatcher(model.predict, max_rows=3)
+    results = []
+    threads = [submit(batcher, [1.0, 1.0], results)]
+    wait_for(lambda: model.calls)
+    threads += [submit(batcher, [float(i), 0.0], results) for i in range(4)]
+    wait_for(lambda: batcher.stats()["queue_depth"] == 4)
+
+    model.gate.set()
+    for thread in threads:
+        thread.join()
+    assert model.calls == [1, 3, 1]
+    assert sorted(results) == [0.0, 1.0, 2.0, 2.0, 3.0]
+    stats = batcher.stats()
+    assert (stats["requests"], stats["batches"], stats["max_batch_rows"]) == (5, 3, 3)
+    batcher.close()
+
+def test_timed_out_row_is_cancelled():
+    """A row not served in time raises TimeoutError and is never scored"""
+    model = GatedModel()
+    batcher = MicroBatcher(model.predict, timeout_ms=50.0)
+    with pytest.raises(TimeoutError):
+        batcher.predict(np.ones(2))
+    # The first row is already being scored, the second times out in the queue
+    with pytest.raises(TimeoutError):
+        batcher.predict(np.ones(2))
+    model.gate.set()
+    batcher.close()
+    batcher._thread.join()
+    assert model.calls == [1]
+    assert batcher.stats()["timeouts"] == 2
+
+def test_close_scores_queued_rows_then_stops():
+    """close() lets the rows already queued finish, then the worker thread exits"""
+    model = GatedModel()
+    batcher = MicroBatcher(model.predict)
+    results = []
+    threads = [submit(batcher, [1.0], results)]
+    wait_for(lambda: model.calls)
+    threads.append(submit(batcher, [2.0], results))
+    wait_for(lambda: batcher.stats()["queue_depth"] == 1)
+    batcher.close()
+
+    model.gate.set()
+    for thread in threads:
+        thread.join()
+    batcher._thread.join(timeout=5.0)
+    assert not batcher._thread.is_alive()
+    assert sorted(results) == [1.0, 2.0]
+
+    # A request still holding the closed batcher is scored inline, no thread is started again
+    assert batcher.predict(np.array([3.0])) == 3.0
+    assert not batcher._thread.is_alive()
+    assert model.calls == [1, 1, 1]
+
+if __name__ == "__main__":
+    print("Running micro-batcher tests...")
+
+    test_rows_queued_during_a_batch_are_coalesced()
+    test_timed_out_row_is_cancelled()
+    test_close_scores_queued_rows_then_stops()
+
+    print("\nTests completed!")
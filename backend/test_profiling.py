@@ -0,0 +1,66 @@
+import gc
+import json
+import os
+import pstats
+import tempfile
+
+import numpy as np
+
+from app.charts import live_figures, render_chart
+from app.profiling import RequestProfiler, memory_stats, track_allocations
+
+def busy_work():
+    total = 0
+    for _ in range(50):
+        total += int(np.sort(np.random.default_rng(0).random(20000)).sum())
+    return total
+
+def test_profiles_are_written_in_both_formats():
+    """A pstats profile loads with pstats, a speedscope profile holds stacks of the profiled thread"""
+    directory = tempfile.mkdtemp()
+    profiler = RequestProfiler(directory)
+    session = profiler.start()
+    busy_work()
+    filename = profiler.stop(session, "predict")
+    stats = pstats.Stats(os.path.join(directory, filename))
+    assert filename.endswith(".prof") and any(func[2] == "busy_work" for func in stats.stats)
+
+    profiler = RequestProfiler(directory, fmt='speedscope', interval_ms=1.0)
+    session = profiler.start()
+    busy_work()
+    filename = profiler.stop(session, "predict")
+    with open(os.path.join(directory, filename)) as f:
+        profile = json.load(f)
+    names = [frame["name"] for frame in profile["shared"]["frames"]]
+    samples = profile["profiles"][0]["samples"]
+    assert samples and len(samples) == len(profile["profiles"][0]["weights"])
+    # Stacks start at the outermost call, the sampler thread itself is never recorded
+    assert all(names[sample[-1]] != "_run" for sample in samples)
+    assert any(names.index("busy_work") in sample for sample in samples)
+    assert profiler.written == 1
+
+def test_allocations_and_figures_are_counted():
+    """Peak traced memory covers an allocation freed inside the block, drawn figures are released"""
+    report = os.path.join(tempfile.mkdtemp(), "profiles", "batch.allocations.txt")
+    with track_allocations(report) as memory:
+        np.ones(4 * 1024 * 1024).sum()
+    assert memory["peak_bytes"] >= 32 * 1024 * 1024 > memory["current_bytes"]
+    with open(report) as f:
+        assert f.readline().startswith("Peak traced memory")
+
+    # Figures hold reference cycles, they are freed by the cycle collector
+    gc.collect()
+    before = live_figures()
+    render_chart('bar', (75.0, 2.5, 1.0, 30.0))
+    gc.collect()
+    assert live_figures() == before
+    stats = memory_stats()
+    assert stats["gc_objects"] > 0 and "traced_peak_bytes" not in stats
+
+if __name__ == "__main__":
+    print("Running profiling tests...")
+
+    test_profiles_are_written_in_both_formats()
+    test_allocations_and_figures_are_counted()
+
+    print("\nTests completed!")
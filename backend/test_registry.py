@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.artifacts import export_model, load_artifact
+from app.microbatch import MicroBatcher
+from app.registry import ModelRegistry, ModelUnavailable, UnknownModel
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def model_folder():
+    """Temporary folder with copies of the shipped model artifacts"""
+    folder = tempfile.mkdtemp()
+    for name in ("rf", "lr", "xgb"):
+        shutil.copy(os.path.join(BACKEND_DIR, f"model_{name}.pkl"), folder)
+    return folder
+
+def test_models_load_on_first_use():
+    """Artifacts are discovered up front but only unpickled when asked for"""
+    registry = ModelRegistry(model_folder())
+    assert {name: entry["state"] for name, entry in registry.stats().items()} == {
+        "lr": "unloaded", "rf": "unloaded", "xgb": "unloaded"}
+
+    default = registry.get()
+    assert default.name == "rf"
+    assert registry.get("rf", default.version) is default
+    assert registry.stats()["lr"]["state"] == "unloaded"
+
+    with pytest.raises(UnknownModel):
+        registry.get("rf", "0" * 12)
+    with pytest.raises(UnknownModel):
+        registry.get("svm")
+
+    # The shipped xgb artifact is an unfitted model, it fails its warm-up
+    with pytest.raises(ModelUnavailable):
+        registry.get("xgb")
+    assert registry.stats()["xgb"]["state"] == "error"
+
+def test_hot_swap_keeps_in_flight_requests():
+    """A reload swaps in the new artifact while rows queued on the old model are still served"""
+    folder = model_folder()
+    registry = ModelRegistry(folder, make_batcher=lambda predict: MicroBatcher(predict, window_ms=50.0))
+    old = registry.get("rf")
+    row = np.zeros(13)
+    expected_old = old.model.predict(np.array([row]))[0]
+
+    results = []
+    waiting = threading.Thread(target=lambda: results.append(old.predict_one(row)))
+    waiting.start()
+    while old.batcher.stats()["queue_depth"] == 0 and not results:
+        time.sleep(0.001)
+
+    # A broken artifact is refused and the model in service is kept
+    with open(os.path.join(folder, "model_rf.pkl"), "wb") as f:
+        f.write(b"not a pickle")
+    with pytest.raises(ModelUnavailable):
+        registry.reload("rf")
+    assert registry.get("rf") is old
+
+    shutil.copy(os.path.join(folder, "model_lr.pkl"), os.path.join(folder, "model_rf.pkl"))
+    new = registry.reload("rf")
+    waiting.join()
+
+    assert results == [expected_old]
+    assert registry.get("rf") is new and new.version != old.version
+    assert registry.reloads == 1
+    assert new.predict_one(row) == new.model.predict(np.array([row]))[0]
+
+def test_exported_folder_is_preferred():
+    """An exported array folder serves the model in place of its pickle, under the same version"""
+    folder = model_folder()
+    pickled = ModelRegistry(folder).get("rf")
+    model, version = load_artifact(os.path.join(folder, "model_rf.pkl"))
+    export_model(model, os.path.join(folder, "model_rf"), version=version)
+
+    registry = ModelRegistry(folder)
+    assert registry.stats()["rf"]["path"] == os.path.join(folder, "model_rf")
+    exported = registry.get("rf")
+    assert exported.version == pickled.version
+    row = np.zeros((1, 13))
+    assert exported.predict(row)[0] == pickled.predict(row)[0]
+
+if __name__ == "__main__":
+    print("Running model registry tests...")
+
+    test_models_load_on_first_use()
+    test_hot_swap_keeps_in_flight_requests()
+    test_exported_folder_is_preferred()
+
+    print("\nTests completed!")
@@ -0,0 +1,374 @@
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+import app.routes as routes
+from app.app import create_app
+from app.charts import CHARTS
+from app.metrics import BATCH_JOBS
+from benchmarks.bench_batch import make_batch_frame
+
+RECORD = {
+    "date": "2015-01-05",
+    "department": "Sewing",
+    "team": "Team 3",
+    "targeted_productivity": 0.8,
+    "smv_minutes": 26.16,
+    "over_time_hours": 4,
+    "incentive_level": "Standard",
+    "idle_time_minutes": 0,
+    "idle_men_count": 0,
+    "style_change_count": 0,
+    "worker_count": 59,
+}
+
+@contextmanager
+def serving(**config):
+    """Test client of an app with its own folders and job store, charts rendered in the request thread"""
+    folder = tempfile.mkdtemp()
+    settings = {
+        'UPLOAD_FOLDER': os.path.join(folder, 'uploads'),
+        'RESULTS_FOLDER': os.path.join(folder, 'results'),
+        'PROFILE_DIR': os.path.join(folder, 'profiles'),
+        'JOB_STORE_URL': f'memory://{folder}',
+        'CHART_RENDER_WORKERS': 0,
+        'BATCH_WORKERS': 1,
+        'METRICS_MULTIPROC_DIR': None,
+    }
+    settings.update(config)
+    app = create_app(settings)
+    try:
+        yield app.test_client()
+    finally:
+        routes.scheduler.shutdown()
+
+def post(client, path, body=None, **kwargs):
+    """POST a JSON body, returns (status, JSON response). The response is closed, releasing its admission slot"""
+    with client.post(path, json=body, **kwargs) as response:
+        return response.status_code, response.get_json()
+
+def get(client, path, **kwargs):
+    """GET a JSON resource, returns (status, JSON response)"""
+    with client.get(path, **kwargs) as response:
+        return response.status_code, response.get_json()
+
+def batch_csv(rows, seed=0):
+    return make_batch_frame(rows, invalid_ratio=0.1, seed=seed).to_csv(index=False).encode()
+
+def upload(client, data, **fields):
+    """Upload a batch CSV, returns (status, JSON response)"""
+    with client.post('/api/batch', data=dict(fields, file=(io.BytesIO(data), 'records.csv')),
+                     content_type='multipart/form-data') as response:
+        return response.status_code, response.get_json()
+
+def wait_for_batch(client, batch_id, timeout=60.0):
+    """Poll a batch job until it reaches a final status, returns its last status"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        _, job = get(client, f'/api/batch/{batch_id}')
+        if job["status"] not in ("queued", "processing"):
+            return job
+        assert time.perf_counter() < deadline, f"batch {batch_id} still {job['status']}"
+        time.sleep(0.05)
+
+def test_bulk_scores_valid_records_next_to_invalid_ones():
+    """Every record gets its own result, records with list or object fields get the errors of /api/predict"""
+    bad = dict(RECORD, team=["Team 3"], worker_count={"count": 59})
+    with serving() as client:
+        _, single = post(client, '/api/predict', RECORD)
+        status, rejected = post(client, '/api/predict', bad)
+        assert status == 400
+        status, body = post(client, '/api/predict/bulk', [RECORD, bad, "record", dict(RECORD, department="Knitting")])
+
+    assert status == 200
+    assert (body["count"], body["valid"]) == (4, 1)
+    first, second, third, fourth = body["results"]
+    assert first["actual_productivity"] == single["actual_productivity"]
+    assert first["category"] == single["category"]
+    assert second["details"] == rejected["details"] == [
+        "Invalid team format. Should be 'Team X'", "Worker count must be a number"]
+    assert third["details"] == ["Record must be an object"]
+    assert fourth["details"] == ["Invalid department"]
+
+def test_sweep_scores_a_grid_around_one_record():
+    """Every grid point and the base record score like /api/predict, bad sweeps are rejected"""
+    # Axes in the order sent, which is sorted by the test client
+    sweep = {"incentive_level": {}, "worker_count": {"values": [20, 40, 60]}}
+    with serving(SWEEP_MAX_POINTS=20) as client:
+        _, single = post(client, '/api/predict', RECORD)
+        _, point = post(client, '/api/predict', dict(RECORD, worker_count=40, incentive_level="High"))
+        status, body = post(client, '/api/predict/sweep', {"base": RECORD, "sweep": sweep})
+        # Swept fields may be left out of the base record
+        base = {key: value for key, value in RECORD.items() if key != "worker_count"}
+        _, partial = post(client, '/api/predict/sweep', {"base": base, "sweep": {"worker_count": {"start": 20, "stop": 60, "num": 3}}})
+
+        rejected = [post(client, '/api/predict/sweep', body) for body in (
+            RECORD,
+            {"base": RECORD, "sweep": {"date": {"values": ["2015-01-06"]}}},
+            {"base": RECORD, "sweep": {"worker_count": {"start": 1, "stop": 30}}},
+            {"base": RECORD, "sweep": {"worker_count": {"values": [-1, 10]}}},
+            {"base": RECORD, "sweep": {"incentive_level": {}, "worker_count": {"start": 10, "stop": 60, "step": 10}}},
+            {"base": dict(RECORD, department="Knitting"), "sweep": sweep},
+        )]
+
+    assert status == 200
+    assert body["parameters"] == [{"name": "incentive_level", "values": ["None", "Low", "Standard", "High"]},
+                                  {"name": "worker_count", "values": [20, 40, 60]}]
+    assert body["points"] == 12 and len(body["predictions"]) == 4 and len(body["predictions"][0]) == 3
+    assert body["base"]["actual_productivity"] == single["actual_productivity"]
+    assert body["predictions"][3][1] == point["actual_productivity"]
+    assert body["best"]["actual_productivity"] == max(max(row) for row in body["predictions"])
+    assert partial["parameters"] == [{"name": "worker_count", "values": [20, 40, 60]}]
+    assert [status for status, _ in rejected] == [400] * 6
+    assert "Expected a 'base' record" in rejected[0][1]["error"]
+    assert rejected[1][1]["error"].startswith("Cannot sweep date")
+    assert rejected[2][1]["error"] == "Invalid range for worker_count. Use 'values', or 'start' and 'stop' with 'step' or 'num'"
+    assert "at least" in rejected[3][1]["error"]
+    assert rejected[4][1]["error"] == "Sweep has 24 points, the limit is 20"
+    assert rejected[5][1]["details"] == ["Invalid department"]
+
+def test_charts_are_opt_in_and_served_by_url():
+    """Charts are only linked when asked for, and their URLs serve cacheable images"""
+    with serving() as client:
+        _, plain = post(client, '/api/predict', RECORD)
+        _, linked = post(client, '/api/predict?visualizations=true', RECORD)
+        _, composite = post(client, '/api/predict', dict(RECORD, chart_format='composite'))
+        _, data = post(client, '/api/predict?chart_format=data', RECORD)
+        invalid, _ = post(client, '/api/predict?chart_format=gif', RECORD)
+
+        url = urlsplit(linked["visualizations"]["bar_chart_url"]).path
+        with client.get(url) as image:
+            etag = image.headers['ETag']
+            assert image.status_code == 200 and image.mimetype == 'image/png'
+            assert image.data.startswith(b'\x89PNG')
+            assert image.cache_control.max_age == 31536000 and image.cache_control.immutable
+        with client.get(url, headers={'If-None-Match': etag}) as revalidated:
+            assert revalidated.status_code == 304
+        with client.get(url.replace('.png', '.svg')) as svg:
+            assert svg.status_code == 200 and svg.mimetype == 'image/svg+xml'
+        with client.get(urlsplit(composite["visualizations"]["composite_url"]).path) as image:
+            assert image.status_code == 200
+
+        key = url.split('/')[-2]
+        for path in (f'/api/visualizations/{key}/radar.png', f'/api/visualizations/{key}/bar.gif',
+                     '/api/visualizations/1.0_-2.0_1.0_1.0/bar.png', '/api/visualizations/1.0_nan_1.0_1.0/bar.png',
+                     '/api/visualizations/not-a-key/bar.png'):
+            with client.get(path) as missing:
+                assert missing.status_code == 404, path
+
+    assert "visualizations" not in plain
+    assert set(linked["visualizations"]) == {"bar_chart_url", "scatter_plot_url", "line_graph_url", "pie_chart_url"}
+    assert len(data["visualizations"]["values"]) == 4 and data["visualizations"]["charts"] == list(CHARTS.values())
+    assert invalid == 400
+
+def test_queued_batch_is_cancelled_and_running_one_is_signalled():
+    """A queued job is dropped at once with its upload, a running one is asked to stop"""
+    cancelled_before = BATCH_JOBS.snapshot().get(("cancelled",), 0)
+    with serving(BATCH_WORKERS=1) as client:
+        status, first = upload(client, batch_csv(200, seed=1))
+        assert status == 202
+        _, second = upload(client, batch_csv(200, seed=2), priority='5')
+        assert (second["status"], second["queue_position"]) == ("queued", 1)
+        upload_path = routes.job_store.get(second["batch_id"])["file_path"]
+
+        assert post(client, f'/api/batch/{second["batch_id"]}/cancel') == (
+            200, {"batch_id": second["batch_id"], "status": "cancelled"})
+        assert not os.path.exists(upload_path)
+        job = get(client, f'/api/batch/{second["batch_id"]}')[1]
+        assert job["status"] == "cancelled" and job["finished_at"]
+        # Counted like every other job that reached a final status
+        assert BATCH_JOBS.snapshot()[("cancelled",)] == cancelled_before + 1
+        assert post(client, f'/api/batch/{second["batch_id"]}/cancel')[0] == 409
+        assert post(client, '/api/batch/unknown/cancel')[0] == 404
+
+        status, running = post(client, f'/api/batch/{first["batch_id"]}/cancel')
+        assert (status, running["status"]) == (202, "cancelling")
+        assert routes.job_store.cancel_requested(first["batch_id"])
+        wait_for_batch(client, first["batch_id"])
+
+def test_identical_uploads_share_one_job():
+    """The same file for the same model attaches to the unfinished job, then reuses its result"""
+    data = batch_csv(200, seed=5)
+    with serving(BATCH_WORKERS=1) as client:
+        _, blocker = upload(client, batch_csv(200, seed=6))
+        status, first = upload(client, data)
+        assert (status, first["status"]) == (202, "queued")
+        status, attached = upload(client, data)
+        assert (status, attached["batch_id"], attached["deduplicated"]) == (202, first["batch_id"], True)
+
+        finished = wait_for_batch(client, first["batch_id"])
+        status, reused = upload(client, data)
+        assert (status, reused["status"], reused["deduplicated"]) == (202, "completed", True)
+        assert reused["batch_id"] != first["batch_id"]
+        assert (reused["rows_done"], reused["valid_rows"]) == (finished["rows_done"], finished["valid_rows"])
+        assert reused["reused_from"] == first["batch_id"]
+        with client.get(urlsplit(reused["results_url"]).path) as copy, \
+                client.get(urlsplit(finished["results_url"]).path) as original:
+            assert copy.status_code == 200 and copy.data == original.data
+
+        # Another output format is a job of its own
+        _, other = upload(client, data, output_format='ndjson')
+        assert "deduplicated" not in other and other["batch_id"] != first["batch_id"]
+        wait_for_batch(client, other["batch_id"])
+        wait_for_batch(client, blocker["batch_id"])
+
+def test_history_adds_each_upload_once():
+    """Predictions of the same file join the history once, whatever the output format"""
+    data = batch_csv(200, seed=7)
+    with serving() as client:
+        _, before = get(client, '/api/history?source=predicted&limit=0')
+        jobs = []
+        for output_format in ('csv', 'ndjson'):
+            _, job = upload(client, data, output_format=output_format)
+            jobs.append(wait_for_batch(client, job["batch_id"]))
+        _, after = get(client, '/api/history?source=predicted&limit=0')
+        assert after["summary"]["count"] == before["summary"]["count"] + jobs[0]["valid_rows"]
+
+        # Once the first result expires, the other job's predictions stand in for it
+        routes.job_store.expire_results([routes.job_store.get(jobs[0]["batch_id"])["results_path"]])
+        routes.history.refresh(routes.job_store, force=True)
+        _, expired = get(client, '/api/history?source=predicted&limit=0')
+        assert expired["summary"] == after["summary"]
+
+def test_history_and_metadata_revalidate_by_etag():
+    """History queries and metadata answer 304 to their ETag until a batch job changes the data"""
+    with serving() as client:
+        with client.get('/api/meta/departments') as departments:
+            assert departments.get_json() == ["Sewing", "Finishing", "Cutting", "QC"]
+            assert departments.cache_control.public and departments.cache_control.max_age == 3600
+        cached = {}
+        for path in ('/api/meta/teams', '/api/history/aggregates?by=department', '/api/history?team=Team%203&limit=5'):
+            with client.get(path) as response:
+                assert response.status_code == 200 and response.headers['ETag'], path
+                cached[path] = response.headers['ETag']
+            with client.get(path, headers={'If-None-Match': cached[path]}) as response:
+                assert response.status_code == 304, path
+        assert get(client, '/api/history?team=3')[0] == 400
+        assert get(client, '/api/history/aggregates?by=month')[0] == 400
+
+        # Predictions for a new team, the history version and every ETag change
+        data = make_batch_frame(50, invalid_ratio=0, seed=8).assign(team="Team 13").to_csv(index=False).encode()
+        _, job = upload(client, data)
+        wait_for_batch(client, job["batch_id"])
+        for path, etag in cached.items():
+            with client.get(path, headers={'If-None-Match': etag}) as response:
+                assert response.status_code == 200, path
+        assert get(client, '/api/meta/teams')[1][-1] == "Team 13"
+
+def test_results_download_in_every_format():
+    """Results are served with their type, gzip encoded or decoded as the client accepts, and by range"""
+    data = batch_csv(300, seed=3)
+    with serving() as client:
+        jobs = {}
+        for output_format in ('csv', 'ndjson', 'xlsx', 'parquet'):
+            status, job = upload(client, data, output_format=output_format)
+            assert status == 202
+            jobs[output_format] = wait_for_batch(client, job["batch_id"])
+        assert {job["status"] for job in jobs.values()} == {"completed"}
+        assert {job["rows_done"] for job in jobs.values()} == {300}
+
+        path = urlsplit(jobs["csv"]["results_url"]).path
+        with client.get(path, headers={'Accept-Encoding': 'gzip'}) as encoded:
+            assert encoded.status_code == 200 and encoded.content_encoding == 'gzip'
+            assert encoded.mimetype == 'text/csv' and 'Accept-Encoding' in encoded.headers['Vary']
+            assert 'employee_performance_batch_' in encoded.headers['Content-Disposition']
+            body, etag = encoded.data, encoded.headers['ETag']
+        with client.get(path) as decoded:
+            assert decoded.status_code == 200 and decoded.content_encoding is None
+            assert decoded.data == gzip.decompress(body)
+        results = pd.read_csv(io.BytesIO(gzip.decompress(body)))
+        assert len(results) == 300 and results["actual_productivity"].notna().sum() == jobs["csv"]["valid_rows"]
+
+        with client.get(path, headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=0-9'}) as partial:
+            assert partial.status_code == 206 and partial.data == body[:10]
+        with client.get(path, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag}) as cached:
+            assert cached.status_code == 304
+
+        for output_format, mimetype in (('ndjson', 'application/x-ndjson'), ('parquet', 'application/vnd.apache.parquet'),
+                                        ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')):
+            with client.get(urlsplit(jobs[output_format]["results_url"]).path, headers={'Accept-Encoding': 'gzip'}) as result:
+                assert result.status_code == 200 and result.mimetype == mimetype, output_format
+        with client.get(urlsplit(jobs["parquet"]["results_url"]).path) as result:
+            assert len(pd.read_parquet(io.BytesIO(result.data))) == 300
+
+        assert get(client, '/api/batch/unknown/download')[0] == 404
+        routes.job_store.expire_results([routes.job_store.get(jobs["xlsx"]["batch_id"])["results_path"]])
+        assert get(client, f'/api/batch/{jobs["xlsx"]["batch_id"]}/download')[0] == 410
+        # Files are sent by the server after the view returns, their slots are released once they are closed
+        assert all(entry["active"] == 0 for entry in routes.admission.stats().values())
+
+def test_batch_events_stream_until_the_final_status():
+    """The event stream pushes status changes and ends with the final event, then frees its slot"""
+    with serving(BATCH_EVENTS_POLL_SECONDS=0.05) as client:
+        _, job = upload(client, batch_csv(200, seed=4))
+        with client.get(f'/api/batch/{job["batch_id"]}/events') as stream:
+            assert stream.status_code == 200 and stream.mimetype == 'text/event-stream'
+            assert stream.headers['Cache-Control'] == 'no-cache' and stream.headers['X-Accel-Buffering'] == 'no'
+            body = stream.get_data(as_text=True)
+        assert body.startswith("retry: ")
+        messages = [message.splitlines() for message in body.split("\n\n")[1:] if message]
+        events = [lines[0][len("event: "):] for lines in messages]
+        assert events[0] == "status" and events[-1] == "complete"
+        final = json.loads(messages[-1][1][len("data: "):])
+        assert final["status"] == "completed" and final["results_url"].endswith("/download")
+
+        # A finished job answers with its final event alone
+        with client.get(f'/api/batch/{job["batch_id"]}/events') as stream:
+            assert stream.get_data(as_text=True).split("\n\n")[1].startswith("event: complete")
+        assert get(client, '/api/batch/unknown/events')[0] == 404
+        assert routes.admission.stats()["batch_events"]["active"] == 0
+
+def test_busy_route_class_gets_429_and_metrics_count_it():
+    """A request over its class's limit is turned away with Retry-After, and /api/metrics reports it"""
+    limits = {'prediction': 4, 'visualization': 2, 'batch_upload': 2, 'batch_status': 4, 'batch_events': 1,
+              'metadata': 4, 'operations': 2}
+    with serving(ADMISSION_LIMITS=limits, ADMISSION_QUEUE_TIMEOUT_MS=10.0) as client:
+        post(client, '/api/predict', RECORD)
+        _, job = upload(client, batch_csv(50, seed=9))
+        wait_for_batch(client, job["batch_id"])
+
+        # An open stream holds the only slot of its class, until it is closed
+        path = f'/api/batch/{job["batch_id"]}/events'
+        stream = client.get(path)
+        with client.get(path) as refused:
+            assert refused.status_code == 429 and refused.headers['Retry-After'] == '1'
+            assert refused.get_json() == {"error": "The server is busy, try again later"}
+        # Other classes are served meanwhile
+        assert get(client, f'/api/batch/{job["batch_id"]}')[0] == 200
+        stream.close()
+        with client.get(path) as served:
+            assert served.status_code == 200
+
+        health = get(client, '/api/health')[1]
+        assert health["admission"]["batch_events"]["rejected"] == 1
+        with client.get('/api/metrics') as response:
+            assert response.status_code == 200 and response.mimetype == 'text/plain'
+            samples = dict(line.rsplit(' ', 1) for line in response.get_data(as_text=True).splitlines()
+                           if line and not line.startswith('#'))
+    assert float(samples['admission_rejected_total{route_class="batch_events"}']) == 1
+    assert float(samples['admission_active_requests{route_class="operations"}']) == 1
+    assert float(samples['predicted_rows_total{endpoint="predict",model="rf"}']) >= 1
+    assert any(name.startswith('api_request_duration_seconds_count{') and 'status="429"' in name for name in samples)
+
+if __name__ == "__main__":
+    print("Running route tests...")
+
+    test_bulk_scores_valid_records_next_to_invalid_ones()
+    test_sweep_scores_a_grid_around_one_record()
+    test_charts_are_opt_in_and_served_by_url()
+    test_queued_batch_is_cancelled_and_running_one_is_signalled()
+    test_identical_uploads_share_one_job()
+    test_history_adds_each_upload_once()
+    test_history_and_metadata_revalidate_by_etag()
+    test_results_download_in_every_format()
+    test_batch_events_stream_until_the_final_status()
+    test_busy_route_class_gets_429_and_metrics_count_it()
+
+    print("\nTests completed!")
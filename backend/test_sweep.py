@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from app.features import prepare_model_input, validate_input
+from app.sweep import parse_sweep, sweep_grid
+
+BASE = {
+    "date": "2023-05-15",
+    "department": "Sewing",
+    "team": "Team 3",
+    "targeted_productivity": 75,
+    "smv_minutes": 2.5,
+    "over_time_hours": 1,
+    "incentive_level": "Standard",
+    "idle_time_minutes": 30,
+    "idle_men_count": 1,
+    "style_change_count": 2,
+    "worker_count": 50
+}
+
+def test_grid_matches_single_records():
+    """Every grid row is the encoding prepare_model_input gives the record with those settings"""
+    axes = parse_sweep({
+        "over_time_hours": {"start": 0, "stop": 8, "step": 2},
+        "incentive_level": {"values": ["None", "High"]}
+    }, max_points=100)
+    _, _, validated = validate_input(BASE)
+    grid, shape = sweep_grid(prepare_model_input(validated)[0], axes)
+
+    assert shape == (5, 2)
+    assert axes[0][1] == [0.0, 2.0, 4.0, 6.0, 8.0]
+    for i, hours in enumerate(axes[0][1]):
+        for j, level in enumerate(axes[1][1]):
+            _, _, record = validate_input(dict(BASE, over_time_hours=hours, incentive_level=level))
+            expected = np.asarray(prepare_model_input(record)[0], dtype=np.float64)
+            np.testing.assert_array_equal(grid.reshape(shape + (-1,))[i, j], expected)
+
+def test_invalid_sweeps_are_rejected():
+    """Unknown fields, out of range values and oversized grids are client errors"""
+    for sweep in (
+        {},
+        {"team": {"values": ["Team 1"]}},
+        {"over_time_hours": {"start": 0, "stop": 9}},
+        {"worker_count": {"start": 1, "stop": 1000, "step": 1}},
+        {"smv_minutes": {"start": 1, "stop": 10, "num": 10},
+         "worker_count": {"start": 1, "stop": 20, "step": 1}},
+        {"a": {}, "b": {}, "c": {}},
+    ):
+        with pytest.raises(ValueError):
+            parse_sweep(sweep, max_points=100)
+
+if __name__ == "__main__":
+    print("Running sweep tests...")
+
+    test_grid_matches_single_records()
+    test_invalid_sweeps_are_rejected()
+
+    print("\nTests completed!")
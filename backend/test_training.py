@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from app.features import DEPARTMENT_MAP, FEATURE_NAMES, INCENTIVE_MAP
+from app.registry import ModelRegistry
+from app.training import DATASET_PATH, clean_dataset, load_arrays, train
+
+def test_categories_use_the_serving_codes():
+    """Department and day are encoded the way prepare_model_input encodes a request"""
+    raw = pd.read_csv(DATASET_PATH)
+    X, y = clean_dataset(raw)
+    dates = pd.to_datetime(raw["date"], format="%m/%d/%Y")
+
+    assert X.shape == (len(raw), len(FEATURE_NAMES))
+    np.testing.assert_array_equal(X[:, FEATURE_NAMES.index("day")], dates.dt.weekday + 1)
+    np.testing.assert_array_equal(X[:, FEATURE_NAMES.index("month")], dates.dt.month)
+    sewing = raw["department"].str.strip() == "sweing"
+    np.testing.assert_array_equal(X[:, FEATURE_NAMES.index("department")],
+                                  np.where(sewing, DEPARTMENT_MAP["Sewing"], DEPARTMENT_MAP["Finishing"]))
+    np.testing.assert_array_equal(y, raw["actual_productivity"])
+
+def test_numbers_use_the_serving_units():
+    """Overtime is whole hours per worker and incentives are levels, as requests give them"""
+    raw = pd.read_csv(DATASET_PATH)
+    X, _ = clean_dataset(raw)
+    over_time = X[:, FEATURE_NAMES.index("over_time")]
+    incentive = X[:, FEATURE_NAMES.index("incentive")]
+    # 7080 minutes of overtime for 59 workers and an incentive of 98
+    assert (over_time[0], incentive[0]) == (2, INCENTIVE_MAP["High"])
+    np.testing.assert_array_equal(over_time, np.trunc(over_time))
+    assert np.median(over_time) <= 8
+    assert set(incentive) <= set(INCENTIVE_MAP.values())
+    np.testing.assert_array_equal(incentive == INCENTIVE_MAP["None"], raw["incentive"] == 0)
+
+def test_appended_rows_extend_the_cached_arrays():
+    """An incremental load cleans only the new rows and matches cleaning the whole file"""
+    folder = tempfile.mkdtemp()
+    dataset = os.path.join(folder, "data.csv")
+    with open(DATASET_PATH) as f:
+        lines = f.readlines()
+    with open(dataset, "w") as f:
+        f.writelines(lines[:101])
+    _, y, info = load_arrays(dataset, os.path.join(folder, "cache"))
+    assert (info["rows"], info["cached"]) == (100, False)
+
+    with open(dataset, "a") as f:
+        f.writelines(lines[101:121])
+    X, y, info = load_arrays(dataset, os.path.join(folder, "cache"), incremental=True)
+    assert (info["rows"], info["appended_rows"]) == (120, 20)
+    X_full, y_full = clean_dataset(pd.read_csv(dataset))
+    np.testing.assert_array_equal(X, X_full)
+    np.testing.assert_array_equal(y, y_full)
+
+def test_training_is_reproducible():
+    """The same data, grid and seed give the same artifact, which the registry serves"""
+    folder = tempfile.mkdtemp()
+    grids = {"rf": {"n_estimators": [5, 10], "max_depth": [3]}}
+    runs = [train(["lr", "rf"], output=folder, cache_dir=os.path.join(folder, "cache"), jobs=1, folds=2, grids=grids)
+            for _ in range(2)]
+
+    assert [report["version"] for report in runs[0]] == [report["version"] for report in runs[1]]
+    rf = runs[0][1]
+    assert len(rf["candidates"]) == 2 and rf["params"]["max_depth"] == 3
+    assert rf["latency"]["batch_rows_per_second"] > 0 and rf["size"]["trees"] == rf["params"]["n_estimators"]
+
+    registry = ModelRegistry(folder)
+    assert registry.discover() == ["lr", "rf"]
+    assert registry.get("rf").version == rf["version"]
+
+if __name__ == "__main__":
+    print("Running training pipeline tests...")
+
+    test_categories_use_the_serving_codes()
+    test_numbers_use_the_serving_units()
+    test_appended_rows_extend_the_cached_arrays()
+    test_training_is_reproducible()
+
+    print("\nTests completed!")
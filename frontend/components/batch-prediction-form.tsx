@@ -8,7 +8,7 @@ import { Input } from "@/components/ui/input"
 import { Label } from "@/components/ui/label"
 import { Alert, AlertDescription, AlertTitle } from "@/components/ui/alert"
 import { AlertCircle, CheckCircle2, Download, Loader2, Upload } from "lucide-react"
-import { submitBatchPrediction, checkBatchStatus } from "@/lib/api"
+import { submitBatchPrediction, subscribeBatchEvents } from "@/lib/api"
 import { Progress } from "@/components/ui/progress"
 
 export default function BatchPredictionForm() {
@@ -18,7 +18,8 @@ export default function BatchPredictionForm() {
   const [batchStatus, setBatchStatus] = useState<string | null>(null)
   const [resultsUrl, setResultsUrl] = useState<string | null>(null)
   const [error, setError] = useState<string | null>(null)
-  const [pollingInterval, setPollingInterval] = useState<NodeJS.Timeout | null>(null)
+  const [progress, setProgress] = useState<number | undefined>(undefined)
+  const [unsubscribe, setUnsubscribe] = useState<(() => void) | null>(null)
 
   const handleFileChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files && e.target.files[0]) {
@@ -48,23 +49,30 @@ export default function BatchPredictionForm() {
       setBatchId(response.batch_id)
       setBatchStatus(response.status)
 
-      // Start polling for status updates
-      const interval = setInterval(async () => {
-        if (batchId) {
-          const statusResponse = await checkBatchStatus(batchId)
-          setBatchStatus(statusResponse.status)
-
-          if (statusResponse.status === "completed") {
-            setResultsUrl(statusResponse.results_url)
-            if (pollingInterval) clearInterval(pollingInterval)
-          } else if (statusResponse.status === "failed") {
-            setError("Batch processing failed. Please try again.")
-            if (pollingInterval) clearInterval(pollingInterval)
-          }
-        }
-      }, 5000) // Poll every 5 seconds
-
-      setPollingInterval(interval)
+      // Follow status and progress pushed by the server
+      const close = subscribeBatchEvents(response.batch_id, {
+        onStatus: (status) => setBatchStatus(status.status),
+        onProgress: (update) => setProgress(update.percent),
+        onComplete: (status) => {
+          setBatchStatus(status.status)
+          setResultsUrl(status.results_url)
+        },
+        onFailed: (status) => {
+          setBatchStatus(status.status)
+          setError(
+            status.status === "cancelled"
+              ? "Batch processing was cancelled."
+              : "Batch processing failed. Please try again.",
+          )
+        },
+        onExpired: (status) => {
+          setBatchStatus(status.status)
+          setError("The results of this batch are no longer available. Please upload the file again.")
+        },
+        onError: () => setError("Lost connection to the server while processing the batch."),
+      })
+
+      setUnsubscribe(() => close)
     } catch (error) {
       console.error("Batch upload failed:", error)
       setError("Failed to upload batch file. Please try again.")
@@ -79,7 +87,8 @@ export default function BatchPredictionForm() {
     setBatchStatus(null)
     setResultsUrl(null)
     setError(null)
-    if (pollingInterval) clearInterval(pollingInterval)
+    setProgress(undefined)
+    if (unsubscribe) unsubscribe()
   }
 
   return (
@@ -117,7 +126,7 @@ export default function BatchPredictionForm() {
             </Button>
           </div>
         </div>
-      ) : batchStatus === "processing" ? (
+      ) : batchStatus === "processing" || batchStatus === "queued" ? (
         <div className="space-y-4">
           <Alert>
             <Loader2 className="h-4 w-4 animate-spin" />
@@ -128,9 +137,9 @@ export default function BatchPredictionForm() {
           <div className="space-y-2">
             <div className="flex justify-between text-sm">
               <span>Processing batch</span>
-              <span>Please wait...</span>
+              <span>{progress === undefined ? "Please wait..." : `${progress}%`}</span>
             </div>
-            <Progress value={undefined} className="h-2" />
+            <Progress value={progress} className="h-2" />
           </div>
         </div>
       ) : (
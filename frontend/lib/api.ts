@@ -40,7 +40,7 @@ export async function fetchTeams(): Promise<string[]> {
 // Submit prediction data to the API
 export async function submitPrediction(data: any) {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/predict`, {
+    const response = await fetch(`${API_BASE_URL}/api/predict?visualizations=true`, {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
@@ -122,6 +122,88 @@ export async function checkBatchStatus(batchId: string) {
   }
 }
 
+// Seconds between status checks of a batch job followed by polling
+const BATCH_POLL_SECONDS = 2
+
+// Follow a batch job through its Server-Sent Events stream, or by polling its
+// status when the server refuses the stream, e.g. with a 429 while busy.
+// Returns a function that stops following it.
+export function subscribeBatchEvents(
+  batchId: string,
+  handlers: {
+    onStatus?: (data: any) => void
+    onProgress?: (data: any) => void
+    onComplete?: (data: any) => void
+    onFailed?: (data: any) => void
+    onExpired?: (data: any) => void
+    onError?: () => void
+  },
+) {
+  let stopped = false
+  let timer: ReturnType<typeof setTimeout> | undefined
+  const finalHandlers: Record<string, ((data: any) => void) | undefined> = {
+    completed: handlers.onComplete,
+    failed: handlers.onFailed,
+    cancelled: handlers.onFailed,
+    expired: handlers.onExpired,
+  }
+
+  const source = new EventSource(`${API_BASE_URL}/api/batch/${batchId}/events`)
+  const listen = (event: string, handler?: (data: any) => void, final = false) => {
+    source.addEventListener(event, (message) => {
+      if (final) source.close()
+      handler?.(JSON.parse((message as MessageEvent).data))
+    })
+  }
+
+  listen("status", handlers.onStatus)
+  listen("progress", handlers.onProgress)
+  listen("complete", handlers.onComplete, true)
+  listen("failed", handlers.onFailed, true)
+  listen("cancelled", handlers.onFailed, true)
+  listen("expired", handlers.onExpired, true)
+  source.onerror = () => {
+    // The browser reconnects by itself unless the stream was refused
+    if (source.readyState === EventSource.CLOSED && !stopped) poll()
+  }
+
+  const poll = async () => {
+    let retryAfter = BATCH_POLL_SECONDS
+    try {
+      const response = await fetch(`${API_BASE_URL}/api/batch/${batchId}`)
+      if (stopped) return
+      if (response.ok) {
+        const status = await response.json()
+        if (status.status in finalHandlers) {
+          finalHandlers[status.status]?.(status)
+          return
+        }
+        handlers.onStatus?.(status)
+        if (status.rows_total) {
+          const percent = Math.round(1000 * Math.min((status.rows_done ?? 0) / status.rows_total, 1)) / 10
+          handlers.onProgress?.({ ...status, percent })
+        }
+      } else if (response.status === 429) {
+        retryAfter = Number(response.headers.get("Retry-After")) || BATCH_POLL_SECONDS
+      } else {
+        handlers.onError?.()
+        return
+      }
+    } catch (error) {
+      console.error("Error checking batch status:", error)
+      handlers.onError?.()
+      return
+    }
+    if (!stopped) timer = setTimeout(poll, retryAfter * 1000)
+  }
+
+  return () => {
+    stopped = true
+    source.close()
+    clearTimeout(timer)
+  }
+}
+
 // Check API health
 export async function checkApiHealth() {
   try {